@@ -0,0 +1,106 @@
+import json
+import logging
+import os
+
+# batas default, bisa diganti lewat variabel lingkungan; 0 berarti tanpa batas
+DEFAULT_MAX_CONNECTIONS = int(os.environ.get('FILE_MAX_CONNECTIONS', '1024'))
+# tanpa FILE_MAX_QUEUED: QUEUE_PER_WORKER koneksi antre per worker
+DEFAULT_MAX_QUEUED = os.environ.get('FILE_MAX_QUEUED')
+QUEUE_PER_WORKER = 4
+DEFAULT_MAX_UPLOAD_MB = int(os.environ.get('FILE_MAX_UPLOAD_MB', '0'))
+# rentang retry_after (detik) yang dikirim bersama BUSY
+RETRY_AFTER_MIN = 0.05
+RETRY_AFTER_MAX = 5.0
+# bobot durasi koneksi terbaru pada rata-rata bergerak (EWMA)
+SERVICE_WEIGHT = 0.2
+
+
+class UploadRejected(Exception):
+    """Upload ditolak karena batas byte upload. Isi upload belum dibaca,
+    jadi setelah BUSY dikirim koneksi harus ditutup."""
+
+
+class AdmissionControl:
+    """Batas jumlah koneksi terbuka, request/koneksi yang menunggu worker dan
+    byte upload yang sedang diterima.
+
+    Jumlah koneksi dan byte upload dibaca dari gauge Metrics di shared memory
+    sehingga batasnya berlaku untuk seluruh proses server. Koneksi atau upload
+    yang melewati batas langsung dijawab BUSY dengan retry_after, yaitu
+    perkiraan waktu sampai antrean habis dari rata-rata durasi request,
+    alih-alih menunggu di antrean sampai client timeout."""
+
+    def __init__(self, metrics, workers, max_connections=None, max_queued=None, max_upload_mb=None):
+        self.metrics = metrics
+        self.workers = max(1, workers)
+        if max_connections is None:
+            max_connections = DEFAULT_MAX_CONNECTIONS
+        if max_queued is None:
+            max_queued = int(DEFAULT_MAX_QUEUED) if DEFAULT_MAX_QUEUED else QUEUE_PER_WORKER * self.workers
+        if max_upload_mb is None:
+            max_upload_mb = DEFAULT_MAX_UPLOAD_MB
+        self.max_connections = max_connections
+        self.max_queued = max_queued
+        self.max_upload_bytes = max_upload_mb * 1024 * 1024
+        self.service_time = 0.1
+
+    def check_connection(self, queued):
+        """Alasan menolak koneksi baru, atau None jika koneksi boleh dilayani.
+        queued adalah jumlah request/koneksi yang sedang menunggu worker (cara
+        menghitungnya bergantung pada jenis server)."""
+        connections = self.metrics.total('active_connections')
+        if self.max_connections and connections >= self.max_connections:
+            return f'batas {self.max_connections} koneksi tercapai'
+        if self.max_queued and queued >= self.max_queued:
+            return f'antrean penuh ({queued} koneksi menunggu)'
+        return None
+
+    def finished(self, seconds):
+        """Catat durasi satu request (atau koneksi, bila server melayani per
+        koneksi) untuk perkiraan retry_after"""
+        self.service_time += SERVICE_WEIGHT * (seconds - self.service_time)
+
+    def retry_after(self, queued=0):
+        estimate = self.service_time * (queued + 1) / self.workers
+        return round(min(RETRY_AFTER_MAX, max(RETRY_AFTER_MIN, estimate)), 3)
+
+    def busy_response(self, reason, queued=0):
+        hasil = dict(status='BUSY', data=f'server sibuk: {reason}', retry_after=self.retry_after(queued))
+        return (json.dumps(hasil) + "\r\n\r\n").encode()
+
+    def rejection(self, addr, reason, queued=0):
+        """Catat penolakan koneksi baru dan kembalikan balasan BUSY-nya"""
+        self.metrics.inc('connections_rejected')
+        logging.warning(f"Koneksi dari {addr} ditolak: {reason}")
+        return self.busy_response(reason, queued)
+
+    def reject(self, conn, addr, reason, queued=0):
+        """Jawab koneksi baru dengan BUSY lalu tutup tanpa membaca request.
+        Tidak pernah menunggu: socket dibuat non-blocking dan balasan yang
+        tidak muat di buffer kirim dibuang."""
+        response = self.rejection(addr, reason, queued)
+        try:
+            conn.setblocking(False)
+            conn.send(response)
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+    def reserve_upload(self, nbytes=0):
+        """Catat nbytes upload yang akan diterima, atau lempar UploadRejected.
+        Satu upload tetap diterima walau lebih besar dari batas jika tidak ada
+        upload lain yang sedang berjalan."""
+        inflight = self.metrics.total('upload_bytes_inflight')
+        if self.max_upload_bytes and inflight and inflight + max(nbytes, 1) > self.max_upload_bytes:
+            self.metrics.inc('requests_busy')
+            raise UploadRejected(f'batas upload {self.max_upload_bytes // (1024 * 1024)} MB tercapai')
+        self.uploading(nbytes)
+
+    def uploading(self, nbytes):
+        """Tambah (atau kurangi, untuk nbytes negatif) byte upload yang sedang diterima"""
+        if nbytes:
+            self.metrics.inc('upload_bytes_inflight', nbytes)
+
+    def release_upload(self, nbytes):
+        self.uploading(-nbytes)
@@ -1,39 +1,72 @@
 import subprocess
+import threading
+import multiprocessing
 import time
 import os
 import csv
 import argparse
 import concurrent.futures
 
-from file_client_cli import run_stress_test
+from file_client import Connection
+from file_client_cli import (run_stress_test, set_server_port, upload_file_binary, dummy_file_path,
+                             DUMMY_FOLDER, RECV_SIZE, SERVER_HOST)
 
 # Server script names
 SERVER_THREAD_SCRIPT  = 'file_server_thread.py'
 SERVER_PROCESS_SCRIPT = 'file_server_process.py'
+SERVER_ASYNC_SCRIPT   = 'file_server_async.py'
+SERVER_SCRIPTS = [
+    ('thread',  SERVER_THREAD_SCRIPT),
+    ('process', SERVER_PROCESS_SCRIPT),
+    ('async',   SERVER_ASYNC_SCRIPT),
+    ('hybrid',  SERVER_PROCESS_SCRIPT),
+]
 
 # Default parameters
 CLIENT_WORKERS = [1, 5, 50]
 SERVER_WORKERS = [1, 5, 50]
+# mode hybrid: jumlah proses x thread per proses
+HYBRID_PROCS   = [os.cpu_count() or 1]
+HYBRID_THREADS = [4, 16]
 OPERATIONS     = ['upload', 'download']
 
+# batas waktu server menjawab STATUS setelah dijalankan
+READY_TIMEOUT = 30.0
+# folder kerja per instance server (storage server dan hasil download client)
+WORK_FOLDER = 'stress_work'
+
+MODE_LABELS = {'thread': 'Threading', 'process': 'Processing', 'async': 'Asyncio',
+               'hybrid': 'Process x Thread'}
+
 CSV_FILE   = 'stress_test_results.csv'
 FIELDNAMES = [
     'Nomor', 'mode', 'operation', 'volume_mb', 'client_workers', 'server_workers',
     'success_client_workers', 'fail_client_workers',
     'avg_duration_per_client_sec', 'avg_throughput_per_client_bps',
-    'success_server_workers', 'fail_server_workers'
+    'success_server_workers', 'fail_server_workers',
+    'p50_duration_sec', 'p90_duration_sec', 'p99_duration_sec', 'max_duration_sec',
+    'aggregate_throughput_bps', 'client_peak_rss_mb'
 ]
+# dipegang saat menulis CSV; diganti lock antar proses oleh init_job_worker
+CSV_LOCK = threading.Lock()
 
 def parse_args():
     p = argparse.ArgumentParser(description='Orkestrasi Stress Test')
     p.add_argument('--start-port', type=int, default=6666,
-                   help='Port awal untuk server thread (thread), process akan +1')
+                   help='Port instance server pertama; setiap instance berikutnya memakai port +1')
     p.add_argument('--mode',      type=str,
-                   help='Comma-separated list: thread,process')
+                   help='Comma-separated list: thread,process,async,hybrid')
     p.add_argument('--workers',   type=str,
                    help='Comma-separated list of server worker pool sizes (e.g. 1,5,50)')
+    p.add_argument('--procs',     type=str,
+                   help='Mode hybrid: comma-separated list of process counts (default: CPU count)')
+    p.add_argument('--threads',   type=str,
+                   help='Mode hybrid: comma-separated list of threads per process (e.g. 4,16)')
     p.add_argument('--volumes',   type=str,
                    help='Comma-separated list of file volumes in MB (e.g. 10,50,100)')
+    p.add_argument('--parallel',  type=int, default=1,
+                   help='Jumlah instance server yang diuji bersamaan, masing-masing '
+                        'dengan himpunan CPU sendiri (default 1)')
     return p.parse_args()
 
 def load_completed_scenarios(filename):
@@ -52,52 +85,137 @@ def load_completed_scenarios(filename):
                 completed.add(key)
     return completed
 
-def append_result_to_csv(filename, fieldnames, result, nomor):
-    file_exists = os.path.exists(filename)
-    with open(filename, 'a', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        if not file_exists:
-            writer.writeheader()
-        row = {
-            'Nomor': nomor,
-            'mode': result['mode'],
-            'operation': result['operation'],
-            'volume_mb': result['volume_mb'],
-            'client_workers': result['client_workers'],
-            'server_workers': result['server_workers'],
-            'success_client_workers': result['success_client_workers'],
-            'fail_client_workers': result['fail_client_workers'],
-            'avg_duration_per_client_sec': result['avg_duration_per_client_sec'],
-            'avg_throughput_per_client_bps': result['avg_throughput_per_client_bps'],
-            'success_server_workers': result['success_server_workers'],
-            'fail_server_workers': result['fail_server_workers']
-        }
-        print(f"DEBUG: Writing to CSV Nomor {nomor}: {row}")
-        writer.writerow(row)
+def append_result_to_csv(filename, fieldnames, result):
+    """Tambahkan satu baris hasil dan kembalikan Nomor-nya (urutan baris di
+    file). Beberapa job bisa menulis file yang sama, jadi dilakukan di bawah CSV_LOCK."""
+    with CSV_LOCK:
+        rows = 0
+        file_exists = os.path.exists(filename)
+        if file_exists:
+            # file lama mungkin belum punya kolom baru; ikuti header yang sudah ada
+            with open(filename, newline='') as f:
+                reader = csv.reader(f)
+                fieldnames = next(reader, None) or fieldnames
+                rows = sum(1 for _ in reader)
+        with open(filename, 'a', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+            if not file_exists:
+                writer.writeheader()
+            row = {name: result.get(name, '') for name in fieldnames}
+            row['Nomor'] = rows + 1
+            print(f"DEBUG: Writing to CSV Nomor {rows + 1}: {row}")
+            writer.writerow(row)
+    return rows + 1
 
 def print_scenario_result(res, nomor):
-    print("\n" + "="*60)
-    print(f"Nomor           : {nomor}")
-    print(f"Operasi         : {res['operation']}")
-    print(f"Volume file (MB): {res['volume_mb']}")
-    print(f"Client Workers  : {res['client_workers']}")
-    print(f"Server Workers  : {res['server_workers']}")
-    print(f"Mode            : {'Threading' if res.get('mode','thread')=='thread' else 'Processing'}")
-    print(f"Waktu Total (s) : {res['avg_duration_per_client_sec']:.2f}")
-    print(f"Throughput (B/s): {res['avg_throughput_per_client_bps']:.2f}")
-    print(f"Client Sukses   : {res['success_client_workers']}")
-    print(f"Client Gagal    : {res['fail_client_workers']}")
-    print(f"Server Sukses   : {res['success_server_workers']}")
-    print(f"Server Gagal    : {res['fail_server_workers']}")
-    print("="*60 + "\n")
-
-def start_server(script, worker_pool, port):
-    """Launch server subprocess, return Popen handle."""
+    # dicetak sekaligus agar tidak bercampur dengan output job lain
+    print("\n".join([
+        "\n" + "="*60,
+        f"Nomor           : {nomor}",
+        f"Operasi         : {res['operation']}",
+        f"Volume file (MB): {res['volume_mb']}",
+        f"Client Workers  : {res['client_workers']}",
+        f"Server Workers  : {res['server_workers']}",
+        f"Mode            : {MODE_LABELS.get(res.get('mode', 'thread'), res.get('mode'))}",
+        f"Durasi rata-rata: {res['avg_duration_per_client_sec']:.2f} s "
+        f"(p50 {res.get('p50_duration_sec', 0):.2f}, p99 {res.get('p99_duration_sec', 0):.2f}, "
+        f"max {res.get('max_duration_sec', 0):.2f})",
+        f"Throughput (B/s): {res['avg_throughput_per_client_bps']:.2f} per client, "
+        f"{res.get('aggregate_throughput_bps', 0):.2f} total",
+        f"RSS client (MB) : {res.get('client_peak_rss_mb', 0)} (puncak)",
+        f"Client Sukses   : {res['success_client_workers']}",
+        f"Client Gagal    : {res['fail_client_workers']}",
+        f"Server Sukses   : {res['success_server_workers']}",
+        f"Server Gagal    : {res['fail_server_workers']}",
+        "="*60 + "\n",
+    ]))
+
+def server_settings(mode, workers, procs, threads):
+    """Setting server per mode: list (server_workers, worker_pool, argumen
+    tambahan server). Mode hybrid memakai setiap kombinasi procs x threads
+    dengan server_workers berupa label seperti '4x16'."""
+    if mode == 'hybrid':
+        return [(f'{p}x{t}', p, ['--mode', 'hybrid', '--threads', str(t)])
+                for p in procs for t in threads]
+    return [(w, w, []) for w in workers]
+
+def total_workers(server_worker):
+    """Jumlah worker total dari server_workers (angka atau label 'PxT')"""
+    procs, _, threads = str(server_worker).partition('x')
+    return int(procs) * int(threads or 1)
+
+def server_jobs(modes, workers, procs, threads, start_port):
+    """Satu job per instance server, masing-masing dengan port sendiri:
+    list (mode, script, server_workers, worker_pool, argumen server, port)"""
+    jobs = []
+    for mode, script in SERVER_SCRIPTS:
+        if mode not in modes:
+            continue
+        for server_worker, worker_pool, server_args in server_settings(mode, workers, procs, threads):
+            jobs.append((mode, script, server_worker, worker_pool, server_args, start_port + len(jobs)))
+    return jobs
+
+def cpu_sets(n):
+    """Bagi CPU yang boleh dipakai proses ini menjadi n himpunan terpisah.
+    Berisi None (tanpa pinning) jika tidak didukung atau CPU kurang dari n."""
+    if not hasattr(os, 'sched_getaffinity'):
+        return [None] * n
+    cpus = sorted(os.sched_getaffinity(0))
+    if len(cpus) < n:
+        return [None] * n
+    size = len(cpus) // n
+    return [set(cpus[i * size:(i + 1) * size]) for i in range(n)]
+
+def status_ok(port, timeout=1.0):
+    """True jika server di port menjawab STATUS dengan OK"""
+    try:
+        conn = Connection(SERVER_HOST, port, RECV_SIZE, timeout)
+    except OSError:
+        return False
+    try:
+        return conn.request('STATUS').get('status') == 'OK'
+    except (OSError, ValueError):
+        return False
+    finally:
+        conn.close()
+
+def port_in_use(port):
+    """True jika sudah ada yang menerima koneksi di port"""
+    try:
+        Connection(SERVER_HOST, port, RECV_SIZE, 1.0).close()
+    except OSError:
+        return False
+    return True
+
+def wait_ready(proc, port, timeout=READY_TIMEOUT):
+    """Tunggu sampai server menjawab STATUS; gagal jika proses server berhenti
+    atau batas waktu terlewati. Mengembalikan lama menunggu (detik)."""
+    start = time.monotonic()
+    while not status_ok(port):
+        if proc.poll() is not None:
+            raise RuntimeError(f"server di port {port} berhenti saat start (exit {proc.returncode})")
+        if time.monotonic() - start > timeout:
+            raise RuntimeError(f"server di port {port} belum siap setelah {timeout:.0f}s")
+        time.sleep(0.05)
+    return time.monotonic() - start
+
+def start_server(script, worker_pool, port, extra_args=()):
+    """Launch server subprocess, wait until it answers STATUS, return Popen handle."""
+    if port_in_use(port):
+        # jangan sampai skenario mengukur server lain yang kebetulan memakai port ini
+        raise RuntimeError(f"port {port} sudah dipakai proses lain")
+    # path absolut karena job berjalan di folder kerjanya sendiri
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), script)
     proc = subprocess.Popen(
-        ['python', script, str(worker_pool), str(port)],
+        ['python', script, str(worker_pool), str(port), *extra_args],
         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
     )
-    time.sleep(2)  # allow server to initialize
+    try:
+        waited = wait_ready(proc, port)
+    except BaseException:
+        stop_server(proc)
+        raise
+    print(f"Server {os.path.basename(script)} port {port} siap dalam {waited:.2f}s")
     return proc
 
 def stop_server(proc):
@@ -105,19 +223,31 @@ def stop_server(proc):
     proc.terminate()
     proc.wait()
 
+def seed_download(volume, port, dummy_folder):
+    """Pastikan file dummy ada di server sebelum skenario download, walaupun
+    skenario upload-nya sudah selesai di run sebelumnya (dilewati bila isinya sama)"""
+    set_server_port(port)
+    success, msg = upload_file_binary(dummy_file_path(volume, dummy_folder), conditional=True)
+    if not success:
+        print(f"⚠️ Gagal menyiapkan file dummy {volume}MB di port {port}: {msg}")
+
 def run_tests_with_server(script_name, server_worker, mode_name, port,
-                          completed, start_nomor, volumes, timeout_sec=180):
+                          completed, volumes, timeout_sec=180,
+                          worker_pool=None, server_args=(), csv_file=CSV_FILE,
+                          dummy_folder=DUMMY_FOLDER):
     """
     Run stress-test scenarios on a single server instance.
     Applies a timeout per scenario; if exceeded, marks scenario as failed.
     """
-    proc = start_server(script_name, server_worker, port)
-    nomor = start_nomor
+    proc = start_server(script_name, worker_pool or server_worker, port, server_args)
     try:
         for volume in volumes:
             for operation in OPERATIONS:
+                pending = [c for c in CLIENT_WORKERS
+                           if (mode_name, operation, str(volume), str(c), str(server_worker)) not in completed]
+                if operation == 'download' and pending:
+                    seed_download(volume, port, dummy_folder)
                 for client_worker in CLIENT_WORKERS:
-                    nomor += 1
                     key = (mode_name, operation, str(volume),
                            str(client_worker), str(server_worker))
                     if key in completed:
@@ -125,14 +255,14 @@ def run_tests_with_server(script_name, server_worker, mode_name, port,
                         continue
 
                     print(f"Running {mode_name.upper()} | op={operation} | vol={volume}MB | "
-                          f"client={client_worker} | server={server_worker} (timeout={timeout_sec}s)")
+                          f"client={client_worker} | server={server_worker} | port={port} (timeout={timeout_sec}s)")
 
                     # execute run_stress_test with timeout
                     with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
                         future = executor.submit(
                             run_stress_test,
-                            operation, volume, client_worker, server_worker,
-                            concurrency_mode=mode_name, port=port
+                            operation, volume, client_worker, total_workers(server_worker),
+                            concurrency_mode=mode_name, port=port, dummy_folder=dummy_folder
                         )
                         try:
                             res = future.result(timeout=timeout_sec)
@@ -149,18 +279,40 @@ def run_tests_with_server(script_name, server_worker, mode_name, port,
                                 'avg_duration_per_client_sec': float(timeout_sec),
                                 'avg_throughput_per_client_bps': 0.0,
                                 'success_server_workers': 0,
-                                'fail_server_workers': server_worker
+                                'fail_server_workers': total_workers(server_worker)
                             }
 
-                    # ensure mode is set
+                    # ensure mode is set; hybrid dicatat dengan label PxT
                     res.setdefault('mode', mode_name)
+                    res['server_workers'] = server_worker
 
+                    nomor = append_result_to_csv(csv_file, FIELDNAMES, res)
                     print_scenario_result(res, nomor)
-                    append_result_to_csv(CSV_FILE, FIELDNAMES, res, nomor)
                     completed.add(key)
     finally:
         stop_server(proc)
-    return nomor
+
+def init_job_worker(cpu_queue, csv_lock):
+    """Initializer proses job: ambil satu himpunan CPU untuk proses ini (server
+    dan client yang dijalankannya mewarisi affinity) dan lock CSV bersama"""
+    global CSV_LOCK
+    CSV_LOCK = csv_lock
+    cpus = cpu_queue.get()
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+
+def run_job(job, completed, volumes, timeout_sec, csv_file, dummy_folder):
+    """Jalankan semua skenario satu instance server di folder kerjanya sendiri,
+    sehingga storage server dan hasil download tidak tercampur dengan job lain"""
+    mode, script, server_worker, worker_pool, server_args, port = job
+    work_dir = os.path.join(os.path.dirname(csv_file), WORK_FOLDER, f'{mode}_{server_worker}')
+    os.makedirs(work_dir, exist_ok=True)
+    os.chdir(work_dir)
+    run_tests_with_server(
+        script, server_worker, mode, port, completed, volumes, timeout_sec,
+        worker_pool=worker_pool, server_args=server_args, csv_file=csv_file,
+        dummy_folder=dummy_folder
+    )
 
 def main():
     args = parse_args()
@@ -172,6 +324,8 @@ def main():
         workers = [int(x) for x in args.workers.split(',')]
     else:
         workers = SERVER_WORKERS
+    procs = [int(x) for x in args.procs.split(',')] if args.procs else HYBRID_PROCS
+    threads = [int(x) for x in args.threads.split(',')] if args.threads else HYBRID_THREADS
     # Determine volume order (10,50 first; 100 last)
     if args.volumes:
         vols_in = [int(x) for x in args.volumes.split(',')]
@@ -181,21 +335,37 @@ def main():
     else:
         volumes = [10, 50, 100]
 
-    completed = load_completed_scenarios(CSV_FILE)
-    nomor = 1 + len(completed)
+    csv_file = os.path.abspath(CSV_FILE)
+    completed = load_completed_scenarios(csv_file)
 
-    # Run for each mode and server worker setting
-    for mode, script, port in [
-        ('thread',  SERVER_THREAD_SCRIPT,  6666),
-        ('process', SERVER_PROCESS_SCRIPT, 6667)
-    ]:
-        if mode not in modes:
-            continue
-        for server_worker in workers:
-            nomor = run_tests_with_server(
-                script, server_worker, mode, port,
-                completed, nomor, volumes, timeout_sec=180
-            )
+    # file dummy dibuat sekali untuk semua job dan skenario
+    dummy_folder = os.path.abspath(DUMMY_FOLDER)
+    for volume in volumes:
+        dummy_file_path(volume, dummy_folder)
+
+    jobs = server_jobs(modes, workers, procs, threads, args.start_port)
+    parallel = max(1, min(args.parallel, len(jobs)))
+    cpu_queue = multiprocessing.Queue()
+    for cpus in cpu_sets(parallel):
+        cpu_queue.put(cpus)
+
+    started = time.monotonic()
+    # setiap instance server dijalankan oleh satu proses job yang dipin ke
+    # himpunan CPU-nya sendiri; job berikutnya memakai proses (dan CPU) yang sama
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=parallel, initializer=init_job_worker,
+            initargs=(cpu_queue, multiprocessing.Lock())) as executor:
+        futures = {
+            executor.submit(run_job, job, completed, volumes, 180, csv_file, dummy_folder): job
+            for job in jobs
+        }
+        for future in concurrent.futures.as_completed(futures):
+            mode, _, server_worker, _, _, port = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                print(f"⚠️ Job {mode} server={server_worker} port={port} gagal: {e}")
+    print(f"Selesai: {len(jobs)} instance server dalam {time.monotonic() - started:.1f}s")
 
 if __name__ == '__main__':
     main()
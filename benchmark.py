@@ -0,0 +1,605 @@
+import argparse
+import base64
+import csv
+import json
+import os
+import queue
+import random
+import shlex
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from file_client import FileClient
+from file_interface import DEFAULT_STORAGE
+from file_protocol import FileProtocol
+from metrics import sample_percentile
+
+OPERATIONS = ('list', 'get', 'upload', 'delete')
+DEFAULT_MIX = 'list=1,get=6,upload=2,delete=1'
+SEED_PREFIX = 'bench_seed_'
+UPLOAD_PREFIX = 'bench_up_'
+IDLE_TIMEOUT = 300.0
+# perubahan relatif yang dianggap regresi pada compare
+DEFAULT_THRESHOLD = 0.10
+# kolom penentu skenario pada CSV hasil auto_stress_test
+SCENARIO_COLUMNS = ('mode', 'operation', 'volume_mb', 'client_workers', 'server_workers')
+IGNORED_METRICS = ('wall_sec', 'Nomor')
+# tahap pipeline yang diukur oleh micro; list/get/get_cached/bget/upload
+# adalah request utuh lewat FileProtocol, sisanya satu tahap saja
+MICRO_STAGES = ('shlex_split', 'b64encode', 'b64decode', 'json_dumps', 'disk_write', 'disk_read',
+                'list', 'get', 'get_cached', 'bget', 'upload')
+PROTOCOL_STAGES = ('list', 'get', 'get_cached', 'bget', 'upload')
+DEFAULT_MICRO_SIZES_KB = '1,64,1024,16384'
+MAX_MICRO_ITERATIONS = 100000
+
+
+def parse_mix(spec):
+    """'list=1,get=6,upload=2,delete=1' -> [(operasi, bobot)]"""
+    mix = []
+    for item in spec.split(','):
+        op, _, weight = item.partition('=')
+        op = op.strip().lower()
+        if op not in OPERATIONS:
+            raise ValueError(f'operasi {op!r} tidak dikenal, pilih dari {", ".join(OPERATIONS)}')
+        weight = float(weight) if weight else 1.0
+        if weight > 0:
+            mix.append((op, weight))
+    if not mix:
+        raise ValueError('mix tidak berisi operasi')
+    return mix
+
+
+class ClientState:
+    """Status satu client benchmark: rng sendiri, file hasil upload yang boleh
+    dihapus, serta jumlah request, byte dan waktu sibuk miliknya"""
+
+    def __init__(self, client_id, seed):
+        self.client_id = client_id
+        self.rng = random.Random(seed)
+        self.uploaded = deque()
+        self.counter = 0
+        self.requests = 0
+        self.bytes = 0
+        self.busy = 0.0
+
+    def reset_counts(self):
+        self.requests = 0
+        self.bytes = 0
+        self.busy = 0.0
+
+
+class Workload:
+    """Campuran request LIST/GET/UPLOAD/DELETE. Isi file upload dibuat sekali
+    di memori sebelum pengukuran, dan GET membaca file seed yang diupload saat
+    persiapan, sehingga yang terukur hanya request ke server."""
+
+    def __init__(self, mix, file_size, transfer='binary', seed_files=4):
+        self.ops = [op for op, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.file_size = file_size
+        self.transfer = transfer
+        self.payload = os.urandom(file_size)
+        self.payload_b64 = base64.b64encode(self.payload).decode() if transfer == 'text' else None
+        self.seed_names = [f'{SEED_PREFIX}{i}.dat' for i in range(seed_files)]
+
+    def prepare(self, client):
+        for name in self.seed_names:
+            if not self.upload(client, name)[0]:
+                raise RuntimeError(f'gagal menyiapkan {name}')
+
+    def cleanup(self, client, states):
+        names = self.seed_names + [name for state in states for name in state.uploaded]
+        for name in names:
+            try:
+                client.command(f'DELETE {name}')
+            except Exception:
+                pass
+
+    def pick(self, state):
+        op = state.rng.choices(self.ops, self.weights)[0]
+        if op == 'delete' and not state.uploaded:
+            # belum ada file milik client ini yang bisa dihapus
+            op = 'upload'
+        if op == 'get' and not self.seed_names:
+            op = 'list'
+        return op
+
+    def upload(self, client, name):
+        if self.transfer == 'text':
+            response = client.command(f'UPLOAD {name} {self.payload_b64}')
+        else:
+            response, _ = client.binary_command(f'BUPLOAD {name}', self.payload)
+        return response['status'] == 'OK', self.file_size
+
+    def execute(self, client, op, state):
+        """Jalankan satu operasi. Mengembalikan (sukses, byte isi file)."""
+        if op == 'list':
+            return client.command('LIST limit=100')['status'] == 'OK', 0
+        if op == 'get':
+            name = state.rng.choice(self.seed_names)
+            if self.transfer == 'text':
+                response = client.command(f'GET {name}')
+            else:
+                response, _ = client.binary_command(f'BGET {name}')
+            return response['status'] == 'OK', self.file_size
+        if op == 'upload':
+            state.counter += 1
+            name = f'{UPLOAD_PREFIX}{state.client_id}_{state.counter}.dat'
+            ok, nbytes = self.upload(client, name)
+            if ok:
+                state.uploaded.append(name)
+            return ok, nbytes
+        name = state.uploaded.popleft()
+        return client.command(f'DELETE {name}')['status'] == 'OK', 0
+
+
+class Recorder:
+    """Kumpulan latensi per operasi dari banyak thread. latency dihitung dari
+    jadwal request (open-loop) atau saat request dikirim (closed-loop),
+    service dari saat request benar-benar dikirim."""
+
+    def __init__(self):
+        self.latency = {op: [] for op in OPERATIONS}
+        self.service = {op: [] for op in OPERATIONS}
+        self.errors = dict.fromkeys(OPERATIONS, 0)
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def record(self, op, latency, service, ok, nbytes):
+        with self.lock:
+            if ok:
+                self.latency[op].append(latency)
+                self.service[op].append(service)
+                self.bytes += nbytes
+            else:
+                self.errors[op] += 1
+
+
+def run_one(workload, client, state, recorder, scheduled=None):
+    op = workload.pick(state)
+    start = time.perf_counter()
+    try:
+        ok, nbytes = workload.execute(client, op, state)
+    except Exception:
+        ok, nbytes = False, 0
+    end = time.perf_counter()
+    state.requests += 1
+    state.busy += end - start
+    if ok:
+        state.bytes += nbytes
+    if recorder is not None:
+        recorder.record(op, end - (start if scheduled is None else scheduled), end - start, ok, nbytes)
+
+
+def run_closed(workload, clients, states, seconds, recorder=None):
+    """Closed-loop: setiap client mengirim request berikutnya segera setelah
+    response sebelumnya diterima, selama `seconds` detik"""
+    deadline = time.perf_counter() + seconds
+
+    def loop(client, state):
+        while time.perf_counter() < deadline:
+            run_one(workload, client, state, recorder)
+
+    threads = [threading.Thread(target=loop, args=pair) for pair in zip(clients, states)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def run_open(workload, clients, states, rate, seconds, recorder=None):
+    """Open-loop: request dijadwalkan dengan laju tetap `rate` per detik tanpa
+    menunggu response sebelumnya. Jika semua client sibuk, request menunggu
+    giliran dan waktu tunggunya ikut dihitung dalam latensi (tidak ada
+    coordinated omission)."""
+    free = queue.SimpleQueue()
+    for pair in zip(clients, states):
+        free.put(pair)
+
+    def task(scheduled):
+        client, state = free.get()
+        try:
+            run_one(workload, client, state, recorder, scheduled)
+        finally:
+            free.put((client, state))
+
+    interval = 1.0 / rate
+    start = time.perf_counter()
+    deadline = start + seconds
+    with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+        n = 0
+        while True:
+            scheduled = start + n * interval
+            if scheduled >= deadline:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(task, scheduled)
+            n += 1
+
+
+def summarize(samples):
+    """Ringkasan latensi (ms) dari daftar durasi dalam detik"""
+    if not samples:
+        return dict(count=0)
+    samples = sorted(samples)
+    return dict(count=len(samples),
+                mean_ms=round(sum(samples) / len(samples) * 1000, 3),
+                p50_ms=round(sample_percentile(samples, 0.5) * 1000, 3),
+                p90_ms=round(sample_percentile(samples, 0.9) * 1000, 3),
+                p99_ms=round(sample_percentile(samples, 0.99) * 1000, 3),
+                max_ms=round(samples[-1] * 1000, 3))
+
+
+def server_usage(client):
+    """(detik CPU, RSS MB) seluruh proses server dari STATUS, atau (None, None).
+    Pada ServerProcess setiap worker memperbarui angkanya sendiri saat
+    melayani request, sehingga nilai worker yang menganggur bisa sedikit tertinggal."""
+    try:
+        response = client.command('STATUS')
+    except Exception:
+        return None, None
+    metrics = response.get('data', {}).get('metrics') if response['status'] == 'OK' else None
+    if not metrics or 'cpu_user_sec' not in metrics:
+        return None, None
+    return metrics['cpu_user_sec'] + metrics['cpu_system_sec'], metrics['rss_mb']
+
+
+def run_benchmark(host='127.0.0.1', port=6666, mode='closed', clients=4, rate=None, duration=10.0,
+                  warmup=2.0, mix=DEFAULT_MIX, file_size=1024 * 1024, transfer='binary',
+                  seed_files=4, keepalive=True, seed=None):
+    """Jalankan satu benchmark dan kembalikan hasilnya sebagai dict"""
+    if mode == 'open' and not rate:
+        raise ValueError('mode open membutuhkan rate')
+    workload = Workload(parse_mix(mix), file_size, transfer, seed_files)
+    rng = random.Random(seed)
+    # satu koneksi per client; tanpa keep-alive setiap request membuka koneksi baru
+    pool = [FileClient(host, port, max_connections=1, idle_timeout=IDLE_TIMEOUT, keepalive=keepalive)
+            for _ in range(clients)]
+    states = [ClientState(i, rng.random()) for i in range(clients)]
+    # koneksi kontrol (persiapan, STATUS, pembersihan) tidak ditahan di antara
+    # fase agar tidak ikut terhitung sebagai koneksi aktif server
+    control = FileClient(host, port, max_connections=1, keepalive=False)
+
+    def idle():
+        for client in pool:
+            client.close()
+
+    try:
+        workload.prepare(control)
+        runner = ((lambda rec, sec: run_open(workload, pool, states, rate, sec, rec)) if mode == 'open'
+                  else (lambda rec, sec: run_closed(workload, pool, states, sec, rec)))
+        if warmup > 0:
+            print(f"Warm-up {warmup}s ...")
+            runner(None, warmup)
+            idle()
+        for state in states:
+            state.reset_counts()
+
+        recorder = Recorder()
+        cpu_before, _ = server_usage(control)
+        print(f"Benchmark {mode}-loop {duration}s, {clients} client, mix {mix} ...")
+        start = time.perf_counter()
+        runner(recorder, duration)
+        wall = time.perf_counter() - start
+        idle()
+        cpu_after, rss_mb = server_usage(control)
+        workload.cleanup(control, states)
+    finally:
+        idle()
+
+    completed = sum(len(samples) for samples in recorder.latency.values())
+    errors = sum(recorder.errors.values())
+    latency = dict(all=summarize([x for samples in recorder.latency.values() for x in samples]))
+    service = dict(all=summarize([x for samples in recorder.service.values() for x in samples]))
+    for op in workload.ops:
+        latency[op] = dict(summarize(recorder.latency[op]), errors=recorder.errors[op])
+        service[op] = summarize(recorder.service[op])
+    client_rps = [state.requests / wall for state in states]
+    client_bps = [state.bytes / wall for state in states]
+    server = {}
+    if cpu_before is not None and cpu_after is not None:
+        cpu = cpu_after - cpu_before
+        server = dict(cpu_sec=round(cpu, 3),
+                      cpu_ms_per_request=round(cpu / completed * 1000, 3) if completed else None,
+                      load_cores=round(cpu / wall, 3), rss_mb=rss_mb)
+    result = dict(
+        config=dict(host=host, port=port, mode=mode, clients=clients, rate=rate, duration=duration,
+                    warmup=warmup, mix=mix, file_size=file_size, transfer=transfer,
+                    seed_files=seed_files, keepalive=keepalive),
+        wall_sec=round(wall, 3),
+        requests=completed,
+        errors=errors,
+        throughput_rps=round(completed / wall, 3),
+        throughput_bps=round(recorder.bytes / wall, 1),
+        latency=latency,
+        per_client=dict(rps_mean=round(sum(client_rps) / clients, 3), rps_min=round(min(client_rps), 3),
+                        bps_mean=round(sum(client_bps) / clients, 1), bps_min=round(min(client_bps), 1)),
+        server=server,
+    )
+    if mode == 'open':
+        # waktu layanan tanpa antrean di sisi client, untuk dibandingkan dengan latency
+        result['service'] = service
+    return result
+
+
+def measure(func, min_iterations=5, min_seconds=0.5):
+    """Durasi setiap panggilan func(); diulang minimal min_iterations kali dan
+    min_seconds detik"""
+    samples = []
+    deadline = time.perf_counter() + min_seconds
+    while len(samples) < MAX_MICRO_ITERATIONS and (len(samples) < min_iterations
+                                                   or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def write_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def run_micro(sizes, stages=MICRO_STAGES, min_iterations=5, stage_seconds=0.5,
+              storage=DEFAULT_STORAGE, profile=()):
+    """Benchmark FileProtocol di dalam proses tanpa socket, per ukuran isi file
+    dan per tahap pipeline (parsing, base64, JSON, disk, request utuh).
+    Tahap request utuh yang ada di `profile` juga diprofil dengan cProfile."""
+    folder = tempfile.mkdtemp(prefix='fp_bench_')
+    fp = FileProtocol(storage=storage, base_folder=folder)
+    if profile:
+        fp.profiler.enable()
+    results = {}
+    try:
+        for size in sizes:
+            label = f'{size // 1024}kb'
+            data = os.urandom(size)
+            data_b64 = base64.b64encode(data).decode()
+            name = f'micro_{label}.dat'
+            fp.proses_string(f'UPLOAD {name} {data_b64}')
+            response = dict(status='OK', etag='0' * 64, data_file=data_b64)
+            upload_cmd = f'UPLOAD micro_up_{label}.dat {data_b64}'
+            temp_path = os.path.join(folder, 'micro_write.tmp')
+            funcs = dict(
+                shlex_split=lambda: shlex.split(f'GET {name} offset=0 length={size}'),
+                b64encode=lambda: base64.b64encode(data),
+                b64decode=lambda: base64.b64decode(data_b64),
+                json_dumps=lambda: json.dumps(response),
+                disk_write=lambda: write_file(temp_path, data),
+                disk_read=lambda: read_file(fp.file.file_path(name)),
+                list=lambda: fp.proses_string('LIST limit=100'),
+                get=lambda: fp.proses_string(f'GET {name}'),
+                get_cached=lambda: fp.proses_request(f'GET {name}'),
+                bget=lambda: fp.proses_binary(f'BGET {name}'),
+                upload=lambda: fp.proses_string(upload_cmd),
+            )
+            results[label] = {}
+            for stage in stages:
+                func = funcs[stage]
+                if stage in profile:
+                    func = (lambda func, command: lambda: fp.profiler.call(command, func))(func, f'{stage}:{label}')
+                summary = summarize(measure(func, min_iterations, stage_seconds))
+                if stage not in ('shlex_split', 'list'):
+                    summary['throughput_mbps'] = round(size / (summary['mean_ms'] / 1000) / 1024 / 1024, 1)
+                results[label][stage] = summary
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    result = dict(config=dict(sizes=list(sizes), stages=list(stages), min_iterations=min_iterations,
+                              stage_seconds=stage_seconds, storage=storage),
+                  sizes=results)
+    if profile:
+        result['profile'] = fp.profiler.dump(limit=10, sort='tottime')['profiles']
+    return result
+
+
+def print_micro(result):
+    for label, stages in result['sizes'].items():
+        print(f"\nUkuran {label}")
+        print(f"{'tahap':<12} {'count':>7} {'mean':>10} {'p50':>10} {'p99':>10} {'MB/s':>9}  (ms)")
+        for stage, summary in stages.items():
+            mbps = summary.get('throughput_mbps')
+            print(f"{stage:<12} {summary['count']:>7} {summary['mean_ms']:>10.3f} {summary['p50_ms']:>10.3f} "
+                  f"{summary['p99_ms']:>10.3f} {mbps if mbps is not None else '-':>9}")
+    for command, stats in result.get('profile', {}).items():
+        print(f"\nProfil {command} ({stats['samples']} sampel, rata-rata {stats['mean_ms']} ms), urut tottime")
+        for row in stats['functions']:
+            print(f"  {row['tottime_ms']:>10.3f} {row['cumtime_ms']:>10.3f} {row['calls']:>8}  {row['function']}")
+    print()
+
+
+def flatten(data, prefix=''):
+    """{'a': {'b': 1}} -> {'a.b': 1}; hanya nilai angka, tanpa config"""
+    flat = {}
+    for key, value in data.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            if key != 'config':
+                flat.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def load_metrics(path):
+    """Metrik datar dari hasil benchmark (JSON atau CSV metric,value) atau dari
+    CSV auto_stress_test (satu baris per skenario)"""
+    if not path.endswith('.csv'):
+        with open(path) as f:
+            return flatten(json.load(f))
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    if rows and {'metric', 'value'} <= set(rows[0]):
+        return {row['metric']: float(row['value']) for row in rows if row['value'] not in ('', None)}
+    metrics = {}
+    for row in rows:
+        scenario = '/'.join(str(row.get(column)) for column in SCENARIO_COLUMNS)
+        for column, value in row.items():
+            if column in SCENARIO_COLUMNS:
+                continue
+            try:
+                metrics[f'{scenario}.{column}'] = float(value)
+            except (TypeError, ValueError):
+                pass
+    return metrics
+
+
+def direction(name):
+    """+1 jika makin besar makin baik, -1 jika makin kecil makin baik, 0 jika
+    metrik tidak dibandingkan"""
+    metric = name.rsplit('.', 1)[-1]
+    if metric in IGNORED_METRICS or metric == 'count':
+        return 0
+    if 'throughput' in metric or 'rps' in metric or 'bps' in metric or metric.startswith('success'):
+        return 1
+    if (metric.endswith('_ms') or metric.endswith('_sec') or 'error' in metric
+            or metric.startswith('fail') or 'cpu' in metric or 'rss' in metric):
+        return -1
+    return 0
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """Bandingkan metrik yang ada di kedua hasil.
+    Mengembalikan list (nama, baseline, current, perubahan relatif, regresi?)."""
+    rows = []
+    for name in sorted(set(baseline) & set(current)):
+        sign = direction(name)
+        if sign == 0:
+            continue
+        base, cur = baseline[name], current[name]
+        if base == 0:
+            change = 0.0 if cur == 0 else float('inf')
+        else:
+            change = (cur - base) / abs(base)
+        # perubahan ke arah yang buruk melebihi ambang
+        worse = -change * sign if change != float('inf') else (1 if sign < 0 else -1)
+        rows.append((name, base, cur, change, worse > threshold))
+    return rows
+
+
+def write_result(result, path):
+    if path.endswith('.csv'):
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['metric', 'value'])
+            for name, value in flatten(result).items():
+                writer.writerow([name, value])
+    else:
+        with open(path, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+def print_result(result):
+    print("\n" + "=" * 72)
+    print(f"Request sukses : {result['requests']} ({result['throughput_rps']:.1f} req/s, "
+          f"{result['throughput_bps'] / 1024 / 1024:.2f} MB/s), gagal {result['errors']}")
+    per_client = result['per_client']
+    print(f"Per client     : {per_client['rps_mean']:.2f} req/s rata-rata, {per_client['rps_min']:.2f} minimum")
+    if result['server']:
+        server = result['server']
+        print(f"Server         : CPU {server['cpu_sec']}s ({server['load_cores']} core), "
+              f"{server['cpu_ms_per_request']} ms CPU/request, RSS {server['rss_mb']} MB")
+    print(f"{'operasi':<8} {'count':>7} {'mean':>9} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}  (ms)")
+    for op, summary in result['latency'].items():
+        if summary.get('count'):
+            print(f"{op:<8} {summary['count']:>7} {summary['mean_ms']:>9.2f} {summary['p50_ms']:>9.2f} "
+                  f"{summary['p90_ms']:>9.2f} {summary['p99_ms']:>9.2f} {summary['max_ms']:>9.2f}")
+    print("=" * 72 + "\n")
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description='Benchmark file server')
+    sub = p.add_subparsers(dest='command', required=True)
+
+    run = sub.add_parser('run', help='jalankan benchmark')
+    run.add_argument('--host', default='127.0.0.1')
+    run.add_argument('--port', type=int, default=6666)
+    run.add_argument('--mode', choices=('closed', 'open'), default='closed',
+                     help='closed: client menunggu response sebelum request berikutnya; '
+                          'open: request dikirim dengan laju tetap --rate')
+    run.add_argument('--clients', type=int, default=4,
+                     help='jumlah client (koneksi keep-alive, atau koneksi baru per request '
+                          'dengan --no-keepalive)')
+    run.add_argument('--rate', type=float, help='request per detik untuk mode open')
+    run.add_argument('--duration', type=float, default=10.0, help='lama pengukuran (detik)')
+    run.add_argument('--warmup', type=float, default=2.0, help='lama warm-up yang tidak diukur (detik)')
+    run.add_argument('--mix', default=DEFAULT_MIX, help=f'bobot operasi (default {DEFAULT_MIX})')
+    run.add_argument('--file-size-kb', type=int, default=1024, help='ukuran file GET/UPLOAD')
+    run.add_argument('--transfer', choices=('text', 'binary'), default='binary')
+    run.add_argument('--seed-files', type=int, default=4, help='jumlah file yang dibaca operasi get')
+    run.add_argument('--no-keepalive', action='store_true', help='buka koneksi baru setiap request')
+    run.add_argument('--seed', type=int, help='seed random agar urutan request bisa diulang')
+    run.add_argument('--output', help='simpan hasil ke file .json atau .csv')
+
+    micro = sub.add_parser('micro', help='benchmark FileProtocol di dalam proses, tanpa socket')
+    micro.add_argument('--sizes-kb', default=DEFAULT_MICRO_SIZES_KB, help='ukuran isi file, dipisah koma')
+    micro.add_argument('--stages', default=','.join(MICRO_STAGES), help='tahap yang diukur, dipisah koma')
+    micro.add_argument('--iterations', type=int, default=5, help='jumlah ulangan minimal per tahap')
+    micro.add_argument('--stage-time', type=float, default=0.5, help='lama minimal per tahap (detik)')
+    micro.add_argument('--storage', default=DEFAULT_STORAGE, help='backend storage (flat/cas)')
+    micro.add_argument('--profile', default='',
+                       help=f'tahap request utuh yang diprofil cProfile ({", ".join(PROTOCOL_STAGES)})')
+    micro.add_argument('--output', help='simpan hasil ke file .json atau .csv')
+
+    cmp = sub.add_parser('compare', help='bandingkan hasil dengan baseline')
+    cmp.add_argument('baseline', help='hasil baseline (.json / .csv)')
+    cmp.add_argument('current', help='hasil baru (.json / .csv)')
+    cmp.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                     help='perubahan relatif yang dianggap regresi (default 0.10 = 10%%)')
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'run':
+        result = run_benchmark(args.host, args.port, args.mode, args.clients, args.rate, args.duration,
+                               args.warmup, args.mix, args.file_size_kb * 1024, args.transfer,
+                               args.seed_files, not args.no_keepalive, args.seed)
+        print_result(result)
+        if args.output:
+            write_result(result, args.output)
+            print(f"Hasil disimpan ke {args.output}")
+        return 0
+    if args.command == 'micro':
+        stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+        profile = [stage.strip() for stage in args.profile.split(',') if stage.strip()]
+        unknown = [stage for stage in stages if stage not in MICRO_STAGES]
+        unknown += [stage for stage in profile if stage not in PROTOCOL_STAGES]
+        if unknown:
+            print(f"Tahap tidak dikenal: {', '.join(unknown)}")
+            return 2
+        sizes = [int(kb) * 1024 for kb in args.sizes_kb.split(',')]
+        result = run_micro(sizes, stages, args.iterations, args.stage_time, args.storage, profile)
+        print_micro(result)
+        if args.output:
+            write_result(result, args.output)
+            print(f"Hasil disimpan ke {args.output}")
+        return 0
+
+    rows = compare(load_metrics(args.baseline), load_metrics(args.current), args.threshold)
+    if not rows:
+        print("Tidak ada metrik yang sama untuk dibandingkan")
+        return 0
+    regressions = 0
+    print(f"{'metrik':<48} {'baseline':>14} {'current':>14} {'ubah':>9}")
+    for name, base, cur, change, regressed in rows:
+        regressions += regressed
+        mark = '  REGRESI' if regressed else ''
+        print(f"{name:<48} {base:>14.3f} {cur:>14.3f} {change:>+9.1%}{mark}")
+    print(f"\n{regressions} regresi (ambang {args.threshold:.0%})")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+import lzma
+import zlib
+
+from metrics import Metrics
+
+CODECS = ('zlib', 'lzma')
+DEFAULT_LEVELS = dict(zlib=6, lzma=1)
+# ukuran sampel awal yang dipakai untuk menilai apakah data layak dikompresi
+SAMPLE_SIZE = 64 * 1024
+# sampel yang tidak mengecil di bawah rasio ini dikirim tanpa kompresi
+BYPASS_RATIO = 0.9
+
+
+def parse_codec(spec):
+    """Baca opsi compress: 'zlib', 'zlib:9', 'lzma' atau 'lzma:6'.
+    Mengembalikan (codec, level)."""
+    codec, _, level = spec.lower().partition(':')
+    if codec not in CODECS:
+        raise ValueError(f'compress harus salah satu dari {", ".join(CODECS)}')
+    level = int(level) if level else DEFAULT_LEVELS[codec]
+    if not 0 <= level <= 9:
+        raise ValueError('level kompresi harus 0-9')
+    return codec, level
+
+
+def is_compressible(data):
+    """Nilai sampel awal data dengan zlib level 1 (murah). Data acak atau yang
+    sudah terkompresi (jpg, zip, os.urandom) tidak akan mengecil, sehingga
+    tidak perlu menghabiskan CPU untuk mengompresi seluruh isinya."""
+    sample = data[:SAMPLE_SIZE]
+    if not sample:
+        return False
+    return len(zlib.compress(sample, 1)) < len(sample) * BYPASS_RATIO
+
+
+def compress(data, codec, level):
+    if codec == 'zlib':
+        return zlib.compress(data, level)
+    return lzma.compress(data, preset=level)
+
+
+def compress_blocks(blocks, codec, level):
+    """Kompresi data per blok; hasil gabungannya bisa dibaca decompress dan
+    DecompressingWriter seperti hasil compress"""
+    c = zlib.compressobj(level) if codec == 'zlib' else lzma.LZMACompressor(preset=level)
+    for block in blocks:
+        packed = c.compress(block)
+        if packed:
+            yield packed
+    yield c.flush()
+
+
+def decompress(data, codec):
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    if codec == 'lzma':
+        return lzma.decompress(data)
+    raise ValueError(f'encoding {codec} tidak dikenal')
+
+
+class DecompressingWriter:
+    """Dekompresi data per blok lalu tulis ke file f; dipakai di bawah
+    Base64Writer untuk UPLOAD streaming yang dikompresi"""
+
+    def __init__(self, f, codec):
+        self.f = f
+        self.codec = codec
+        self.d = zlib.decompressobj() if codec == 'zlib' else lzma.LZMADecompressor()
+        self.wire_bytes = 0
+        self.raw_bytes = 0
+
+    def write(self, data):
+        self.wire_bytes += len(data)
+        raw = self.d.decompress(data)
+        self.raw_bytes += len(raw)
+        self.f.write(raw)
+
+    def finish(self):
+        """Pesan error jika data terkompresi tidak lengkap, selain itu None"""
+        return None if self.d.eof else 'data terkompresi tidak lengkap'
+
+
+class CompressionStats:
+    """Statistik kompresi untuk STATUS: jumlah transfer dan byte asli vs
+    byte terkompresi per codec, serta transfer yang dilewati (bypass).
+
+    Angka disimpan di Metrics server (slot proses ini) sehingga pada server
+    process/hybrid STATUS menjumlahkan transfer di semua worker. Tanpa
+    metrics server dipakai Metrics lokal."""
+
+    def __init__(self, metrics=None):
+        self.metrics = metrics if metrics is not None else Metrics(())
+
+    def record(self, codec, raw_bytes, wire_bytes):
+        self.metrics.inc(f'compress_{codec}_transfers')
+        self.metrics.inc(f'compress_{codec}_raw_bytes', raw_bytes)
+        self.metrics.inc(f'compress_{codec}_wire_bytes', wire_bytes)
+
+    def record_bypass(self, raw_bytes):
+        self.metrics.inc('compress_bypassed')
+        self.metrics.inc('compress_bypassed_bytes', raw_bytes)
+
+    def stats(self):
+        total = self.metrics.total
+        data = {}
+        for codec in CODECS:
+            raw, wire = total(f'compress_{codec}_raw_bytes'), total(f'compress_{codec}_wire_bytes')
+            data[codec] = dict(transfers=total(f'compress_{codec}_transfers'), raw_bytes=raw,
+                               compressed_bytes=wire, ratio=round(wire / raw, 4) if raw else None)
+        data['bypassed'] = dict(transfers=total('compress_bypassed'), bytes=total('compress_bypassed_bytes'))
+        return data
@@ -0,0 +1,272 @@
+import base64
+import bisect
+import json
+import os
+import sqlite3
+import threading
+
+from storage import file_sha256, valid_name
+
+SORT_KEYS = ('name', 'size', 'mtime')
+# cache sha256 bersama di base_folder (lihat HashCache)
+HASH_DB = '.index.db'
+
+
+def encode_cursor(row):
+    return base64.urlsafe_b64encode(json.dumps(row).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        row = tuple(json.loads(base64.urlsafe_b64decode(cursor.encode())))
+    except Exception:
+        raise ValueError('cursor tidak valid')
+    if len(row) != 2:
+        raise ValueError('cursor tidak valid')
+    return row
+
+
+class HashCache:
+    """sha256 file per (nama, size, mtime) di sqlite, dibagi oleh semua proses
+    server yang memakai folder yang sama. Hash yang dihitung atau diterima
+    satu worker (mis. saat upload) dipakai worker lain dan server berikutnya
+    tanpa membaca ulang isi file. File sqlite baru dibuat saat pertama dipakai."""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def db(self):
+        """Koneksi sqlite milik thread ini (dibuat ulang setelah fork)"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS hashes (name TEXT PRIMARY KEY, size INTEGER NOT NULL,'
+                         ' mtime INTEGER NOT NULL, hash TEXT NOT NULL)')
+            self.local.conn, self.local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, name, size, mtime):
+        rows = self.db().execute('SELECT hash FROM hashes WHERE name = ? AND size = ? AND mtime = ?',
+                                 (name, size, mtime)).fetchall()
+        return rows[0][0] if rows else None
+
+    def put(self, name, size, mtime, digest):
+        self.db().execute('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?)', (name, size, mtime, digest))
+
+    def remove(self, name):
+        if os.path.exists(self.path):
+            self.db().execute('DELETE FROM hashes WHERE name = ?', (name,))
+
+
+class DirectoryIndex:
+    """Index in-memory isi storage: nama -> dict(size, mtime, hash).
+
+    Index dibangun sekali saat start lalu diperbarui per file oleh upload/delete,
+    sehingga LIST tidak perlu memindai storage. Jika storage diubah dari luar
+    (mis. proses server lain), perubahan versi storage (mtime folder untuk
+    FlatStorage) memicu pemindaian ulang yang hanya menghitung ulang hash file
+    yang size/mtime-nya berubah.
+
+    Nama file disimpan terurut (dan baris (size|mtime, nama) terurut per
+    kunci sort yang pernah diminta), diperbarui per file saat commit/delete,
+    sehingga satu halaman LIST hanya mengambil potongan list lewat bisect.
+    Index dibangun di proses induk sebelum fork; hash yang dihitung salah
+    satu proses dibagi lewat HashCache (hashes) sehingga perubahan dari
+    worker lain tidak di-hash ulang di setiap worker."""
+
+    def __init__(self, storage, hashes=None):
+        self.storage = storage
+        self.hashes = hashes
+        self.entries = {}
+        self.names = []          # nama file terurut, untuk prefix dan paging
+        self.sorted_rows = {}    # baris (nilai, nama) terurut per kunci sort selain nama
+        self.version = None
+        self.lock = threading.RLock()
+        # dipegang selama perubahan storage + update index milik server ini
+        # (lihat FileInterface.commit_temp dan delete)
+        self.commit_lock = threading.Lock()
+        self.rescan()
+
+    def make_entry(self, name, info, digest=None):
+        """Entri index untuk info; sha256 dari digest, storage, HashCache, atau
+        dihitung dari isi file (lalu disimpan ke HashCache)"""
+        digest = digest or info.hash
+        if digest is None and self.hashes is not None:
+            digest = self.hashes.get(name, info.size, info.mtime)
+        if digest is None:
+            digest = file_sha256(info.path)
+            if self.hashes is not None:
+                self.hashes.put(name, info.size, info.mtime, digest)
+        return dict(size=info.size, mtime=info.mtime, hash=digest)
+
+    def store(self, name, entry):
+        with self.lock:
+            old = self.entries.get(name)
+            if old is None:
+                bisect.insort(self.names, name)
+            self.entries[name] = entry
+            for sort, rows in self.sorted_rows.items():
+                if old is not None:
+                    del rows[bisect.bisect_left(rows, (old[sort], name))]
+                bisect.insort(rows, (entry[sort], name))
+
+    def rescan(self):
+        """Pindai ulang storage; hash lama dipakai lagi untuk file yang tidak berubah"""
+        with self.lock:
+            version = self.storage.version()
+            entries = {}
+            for name, info in self.storage.scan():
+                old = self.entries.get(name)
+                if old is not None and (old['size'], old['mtime']) == (info.size, info.mtime):
+                    entries[name] = old
+                    continue
+                try:
+                    entries[name] = self.make_entry(name, info)
+                except FileNotFoundError:
+                    # dihapus saat pemindaian; versi storage sudah berubah lagi
+                    # sehingga refresh berikutnya memindai ulang
+                    pass
+            self.entries = entries
+            self.names = sorted(entries)
+            self.sorted_rows = {}
+            self.version = version
+
+    def refresh_if_changed(self):
+        # versi yang dibaca di tengah perubahan milik sendiri selalu berbeda;
+        # perubahan itu memperbarui index sendiri, jadi jangan memindai ulang
+        # (dan jangan menunggu os.replace/remove file besar selesai)
+        if not self.commit_lock.acquire(blocking=False):
+            return
+        try:
+            if self.storage.version() != self.version:
+                self.rescan()
+        finally:
+            self.commit_lock.release()
+
+    def advance(self, versions):
+        """Terima versi storage setelah perubahan sendiri hanya jika tidak ada
+        perubahan lain sejak index terakhir sinkron; selain itu versi dibiarkan
+        berbeda sehingga refresh_if_changed berikutnya memindai ulang."""
+        if versions is not None and versions[0] == self.version:
+            self.version = versions[1]
+
+    def update(self, name, digest=None, versions=None):
+        """Catat file name yang baru disimpan; digest = sha256 jika sudah diketahui,
+        versions = (versi_sebelum, versi_sesudah) dari storage.store"""
+        info = self.storage.info(name)
+        with self.lock:
+            if info is None:
+                # file sudah ditimpa/dihapus lagi oleh request lain
+                self.discard(name)
+                return
+            self.store(name, self.make_entry(name, info, digest))
+            self.advance(versions)
+        if digest is not None and info.hash is None and self.hashes is not None:
+            # worker lain memakai hash ini tanpa membaca ulang file
+            self.hashes.put(name, info.size, info.mtime, digest)
+
+    def remove(self, name, versions=None):
+        """Hapus name dari index; versions = hasil storage.remove"""
+        with self.lock:
+            self.discard(name)
+            self.advance(versions)
+        if self.hashes is not None:
+            self.hashes.remove(name)
+
+    def discard(self, name):
+        with self.lock:
+            old = self.entries.pop(name, None)
+            if old is not None:
+                del self.names[bisect.bisect_left(self.names, name)]
+                for sort, rows in self.sorted_rows.items():
+                    del rows[bisect.bisect_left(rows, (old[sort], name))]
+
+    def get(self, name):
+        with self.lock:
+            return self.entries.get(name)
+
+    def lookup(self, name):
+        """Entri terkini untuk satu file tanpa memindai seluruh storage: hash
+        dihitung ulang hanya jika size/mtime file berbeda dari yang tercatat.
+        Mengembalikan None jika file tidak ada. Nama yang tidak mungkin
+        dihasilkan storage.scan() (path, alias, file tersembunyi) tidak
+        diteruskan ke storage dan tidak pernah masuk index."""
+        if not valid_name(name):
+            return None
+        info = self.storage.info(name)
+        if info is None:
+            return None
+        entry = self.get(name)
+        if entry is None or (entry['size'], entry['mtime']) != (info.size, info.mtime):
+            try:
+                entry = self.make_entry(name, info)
+            except FileNotFoundError:
+                return None
+            self.store(name, entry)
+        return entry
+
+    def probe(self, name):
+        """(size, byte yang akan di-hash lookup(name)) tanpa membaca isi file,
+        cukup satu storage.info: byte yang di-hash = size jika lookup akan
+        menghitung ulang sha256 (entri belum ada atau size/mtime berubah),
+        selain itu 0. Mengembalikan None jika file tidak ada."""
+        if not valid_name(name):
+            return None
+        info = self.storage.info(name)
+        if info is None:
+            return None
+        entry = self.get(name)
+        stale = info.hash is None and (entry is None or (entry['size'], entry['mtime']) != (info.size, info.mtime))
+        return info.size, info.size if stale else 0
+
+    def is_current(self):
+        """False jika storage berubah sejak pemindaian terakhir, sehingga LIST
+        berikutnya akan memindai ulang (lihat refresh_if_changed)"""
+        return self.storage.version() == self.version
+
+    def rows(self, sort):
+        """Baris (nilai, nama) terurut naik untuk kunci sort selain nama; dibuat
+        sekali lalu diperbarui per file oleh store/discard (dipanggil dengan self.lock)"""
+        rows = self.sorted_rows.get(sort)
+        if rows is None:
+            rows = self.sorted_rows[sort] = sorted((entry[sort], name) for name, entry in self.entries.items())
+        return rows
+
+    def query(self, prefix='', sort='name', descending=False, limit=None, cursor=None):
+        """Ambil entri terurut dengan filter prefix dan paging berbasis cursor.
+        Posisi halaman dicari dengan bisect dan hanya baris halaman itu yang
+        dibaca (untuk sort selain nama dengan prefix, baris yang tidak cocok
+        dilewati). Mengembalikan (list (nama, entri), next_cursor atau None)."""
+        if sort not in SORT_KEYS:
+            raise ValueError(f'sort harus salah satu dari {", ".join(SORT_KEYS)}')
+        after = decode_cursor(cursor) if cursor is not None else None
+        with self.lock:
+            if sort == 'name':
+                # rentang nama berawalan prefix langsung dari list terurut
+                seq = self.names
+                lo = bisect.bisect_left(seq, prefix)
+                hi = bisect.bisect_left(seq, prefix + '\U0010ffff') if prefix else len(seq)
+                if after is not None:
+                    after = after[1]
+            else:
+                seq = self.rows(sort)
+                lo, hi = 0, len(seq)
+            if after is not None:
+                if descending:
+                    hi = min(hi, bisect.bisect_left(seq, after))
+                else:
+                    lo = max(lo, bisect.bisect_right(seq, after))
+            result = []
+            last = None
+            for i in range(hi - 1, lo - 1, -1) if descending else range(lo, hi):
+                row = (seq[i], seq[i]) if sort == 'name' else seq[i]
+                if prefix and not row[1].startswith(prefix):
+                    continue
+                if limit is not None and len(result) >= limit:
+                    return result, encode_cursor(last)
+                result.append((row[1], self.entries[row[1]]))
+                last = row
+            return result, None
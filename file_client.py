@@ -0,0 +1,309 @@
+import json
+import random
+import select
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from file_transfer import send_payload, recv_payload, send_file, upload_writer, finish_upload
+from framing import FrameReader, TERMINATOR
+
+SOCK_BUFFER = 256 * 1024
+# lama menunggu balasan BUSY setelah server memutus koneksi baru
+BUSY_READ_TIMEOUT = 1.0
+# field isi file pada response GET; selalu field terakhir (lihat PROTOKOL.txt)
+DATA_FIELD = b', "data_file": "'
+DATA_FIELD_END = b'"}'
+# batas ukuran metadata sebelum DATA_FIELD
+RESPONSE_HEAD_LIMIT = 64 * 1024
+
+
+class ServerBusy(ConnectionError):
+    """Server menolak request dengan status BUSY (lihat admission control)"""
+
+    def __init__(self, response):
+        super().__init__(response.get('data', 'server sibuk'))
+        self.retry_after = response.get('retry_after') or 0
+
+
+def backoff_delay(attempt, retry_after=0, base=0.1, cap=5.0):
+    """Jeda sebelum percobaan ke-attempt (mulai 0): retry_after dari server
+    ditambah jitter acak sampai base * 2^attempt (maksimal cap), agar client
+    yang ditolak bersamaan tidak kembali bersamaan"""
+    return retry_after + random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def retry_busy(func, *args, timeout=120.0, base=0.1, cap=5.0):
+    """Panggil func(*args), ulangi dengan backoff selama server menjawab BUSY
+    dan batas waktu timeout (detik) belum terlewati"""
+    deadline = time.monotonic() + timeout
+    attempt = 0
+    while True:
+        try:
+            return func(*args)
+        except ServerBusy as e:
+            delay = backoff_delay(attempt, e.retry_after, base, cap)
+            if time.monotonic() + delay > deadline:
+                raise
+            time.sleep(delay)
+            attempt += 1
+
+
+class Connection:
+    """Satu koneksi TCP keep-alive ke server beserta FrameReader-nya"""
+
+    def __init__(self, host, port, recv_size, timeout=None):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCK_BUFFER)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCK_BUFFER)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.settimeout(timeout)
+        self.sock.connect((host, port))
+        self.reader = FrameReader(self.sock, recv_size)
+        self.last_used = time.monotonic()
+
+    def is_stale(self, idle_timeout):
+        """True jika koneksi terlalu lama menganggur atau sudah ditutup server"""
+        if time.monotonic() - self.last_used > idle_timeout:
+            return True
+        # koneksi menganggur yang bisa dibaca berarti EOF (atau data liar)
+        readable, _, _ = select.select([self.sock], [], [], 0)
+        return bool(readable)
+
+    def send(self, cmd):
+        self.sock.sendall((cmd + "\r\n\r\n").encode())
+
+    def read_response(self):
+        frame = self.reader.read_frame()
+        if frame is None:
+            raise ConnectionError('response tidak lengkap')
+        response = json.loads(frame.decode())
+        if response.get('status') == 'BUSY':
+            raise ServerBusy(response)
+        return response
+
+    def raise_if_busy(self):
+        """Dipanggil saat pengiriman gagal: jika server memutus koneksi setelah
+        menjawab BUSY, lempar ServerBusy agar request bisa dicoba ulang"""
+        try:
+            self.sock.settimeout(BUSY_READ_TIMEOUT)
+            frame = self.reader.read_frame()
+            response = json.loads(frame.decode()) if frame is not None else None
+        except (OSError, ValueError):
+            return
+        if response is not None and response.get('status') == 'BUSY':
+            raise ServerBusy(response)
+
+    def request(self, cmd, payload=None):
+        """Kirim satu request (beserta payload biner bila ada) dan baca response-nya"""
+        try:
+            self.send(cmd)
+            if payload is not None:
+                send_payload(self.sock, payload)
+        except OSError:
+            self.raise_if_busy()
+            raise
+        return self.read_response()
+
+    def stream_request(self, prefix, blocks):
+        """Kirim request teks yang isinya dihasilkan per blok (mis. UPLOAD
+        dengan base64 dari file) lalu baca response-nya. Memori tidak
+        bergantung pada ukuran isi request."""
+        try:
+            self.sock.sendall(prefix.encode())
+            for block in blocks:
+                self.sock.sendall(block)
+            self.sock.sendall(TERMINATOR)
+        except OSError:
+            self.raise_if_busy()
+            raise
+        return self.read_response()
+
+    def file_request(self, cmd, path):
+        """Kirim request biner (BUPLOAD) dengan isi file path sebagai payload
+        langsung dari disk, lalu baca response-nya"""
+        try:
+            self.send(cmd)
+            send_file(self.sock, path)
+        except OSError:
+            self.raise_if_busy()
+            raise
+        return self.read_response()
+
+    def read_file_response(self, f):
+        """Baca response GET dan tulis isi data_file (base64, didekompresi bila
+        ada encoding) langsung ke file f per blok. Mengembalikan response tanpa
+        data_file; response lain (ERROR, NOT_MODIFIED) dibaca seperti biasa."""
+        head = self.reader.read_until(DATA_FIELD, RESPONSE_HEAD_LIMIT)
+        if head is None:
+            return self.read_response()
+        response = json.loads(head.decode() + '}')
+        writer, decoder = upload_writer(f, response.get('encoding'))
+        tail = b''
+        for block in self.reader.iter_until_terminator():
+            # dua byte terakhir pesan adalah penutup string dan object JSON
+            data = tail + block
+            writer.write(data[:-len(DATA_FIELD_END)])
+            tail = data[-len(DATA_FIELD_END):]
+        if tail != DATA_FIELD_END:
+            raise ConnectionError('response GET tidak valid')
+        error = finish_upload(writer, decoder)
+        if error is not None:
+            return dict(status='ERROR', data=error)
+        return response
+
+    def abort(self):
+        """Putuskan koneksi, termasuk sendall yang sedang berjalan di thread lain"""
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class FileClient:
+    """Client dengan pool koneksi keep-alive per server.
+
+    Aman dipakai bersama oleh banyak thread: setiap request meminjam satu
+    koneksi dari pool (dibuat bila belum ada, maksimal max_connections) dan
+    mengembalikannya setelah response terbaca. Koneksi yang gagal di tengah
+    request dibuang, bukan dikembalikan ke pool.
+
+    Koneksi yang menganggur di pool tidak menempati worker server (server
+    menunggunya lewat poller), tetapi tetap dihitung dalam batas
+    FILE_MAX_CONNECTIONS. Dengan keepalive=False setiap koneksi ditutup
+    setelah satu request.
+
+    Request yang dijawab BUSY dicoba ulang dengan backoff eksponensial dan
+    jitter (lihat backoff_delay) sampai busy_timeout detik."""
+
+    def __init__(self, host='127.0.0.1', port=6666, max_connections=4,
+                 recv_size=256 * 1024, idle_timeout=30.0, timeout=None, keepalive=True,
+                 busy_timeout=120.0, backoff=0.1, max_backoff=5.0):
+        self.host = host
+        self.port = port
+        self.recv_size = recv_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.keepalive = keepalive
+        self.busy_timeout = busy_timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.idle = []
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max_connections)
+
+    def acquire(self):
+        self.slots.acquire()
+        try:
+            while True:
+                with self.lock:
+                    conn = self.idle.pop() if self.idle else None
+                if conn is None:
+                    return Connection(self.host, self.port, self.recv_size, self.timeout)
+                if not conn.is_stale(self.idle_timeout):
+                    return conn
+                conn.close()
+        except Exception:
+            self.slots.release()
+            raise
+
+    def release(self, conn, reusable=True):
+        if reusable and self.keepalive:
+            conn.last_used = time.monotonic()
+            with self.lock:
+                self.idle.append(conn)
+        else:
+            conn.close()
+        self.slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Pinjam satu koneksi; koneksi dibuang jika terjadi error"""
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException:
+            self.release(conn, reusable=False)
+            raise
+        self.release(conn)
+
+    def retry(self, func, *args):
+        """Panggil func(*args), ulangi selama server menjawab BUSY"""
+        return retry_busy(func, *args, timeout=self.busy_timeout, base=self.backoff, cap=self.max_backoff)
+
+    def call(self, func, *args):
+        """Panggil func(conn, *args) dengan satu koneksi dari pool, ulangi
+        selama server menjawab BUSY. Untuk transfer streaming yang tidak
+        menampung isi file di memori (lihat file_client_cli)."""
+        return self.retry(self.call_once, func, *args)
+
+    def call_once(self, func, *args):
+        with self.connection() as conn:
+            return func(conn, *args)
+
+    def command(self, cmd):
+        """Kirim satu request teks dan kembalikan response JSON"""
+        return self.retry(self.command_once, cmd)
+
+    def command_once(self, cmd):
+        with self.connection() as conn:
+            return conn.request(cmd)
+
+    def pipeline(self, cmds):
+        """Kirim beberapa request teks sekaligus pada satu koneksi tanpa
+        menunggu response satu per satu. Response dikembalikan sesuai urutan.
+        Hanya BUSY pada response pertama (koneksi ditolak) yang dicoba ulang."""
+        return self.retry(self.pipeline_once, cmds)
+
+    def pipeline_once(self, cmds):
+        with self.connection() as conn:
+            data = ''.join(cmd + "\r\n\r\n" for cmd in cmds).encode()
+            # kirim dari thread lain agar tidak deadlock bila buffer kedua arah penuh
+            sender = threading.Thread(target=conn.sock.sendall, args=(data,), daemon=True)
+            sender.start()
+            responses = []
+            try:
+                for _ in cmds:
+                    responses.append(conn.read_response())
+            except BaseException as e:
+                conn.abort()
+                sender.join()
+                if isinstance(e, ServerBusy) and responses:
+                    # sebagian request sudah diproses, jangan diulang seluruhnya
+                    raise ConnectionError(str(e)) from e
+                raise
+            sender.join()
+            return responses
+
+    def binary_command(self, cmd, payload=None):
+        """Kirim request mode biner (BGET/BUPLOAD).
+        Mengembalikan (response_json, payload_balasan atau None)."""
+        return self.retry(self.binary_command_once, cmd, payload)
+
+    def binary_command_once(self, cmd, payload=None):
+        with self.connection() as conn:
+            response = conn.request(cmd, payload)
+            data = None
+            if cmd.upper().startswith('BGET') and response['status'] == 'OK':
+                data = recv_payload(conn.reader)
+            return response, data
+
+    def close(self):
+        """Tutup semua koneksi yang sedang menganggur di pool"""
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,88 +1,515 @@
-import socket
 import json
 import base64
+import hashlib
 import logging
+import atexit
 import os
 import time
 from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 import csv
+import threading
+
+from compression import parse_codec, is_compressible, compress_blocks, SAMPLE_SIZE
+from file_transfer import recv_payload, recv_payload_into, base64_blocks, LENGTH_HEADER, CHUNK_SIZE
+from file_client import FileClient, Connection, retry_busy
+from metrics import sample_percentile, peak_rss_kb, reset_peak_rss
 
 SERVER_HOST = '127.0.0.1'
 SERVER_PORT = 6666
+RECV_SIZE = 256 * 1024
+CLIENT = None  # FileClient bersama; None berarti satu koneksi per request
 
 def set_server_port(port):
     global SERVER_PORT
     SERVER_PORT = port
 
+def set_recv_size(size):
+    global RECV_SIZE
+    RECV_SIZE = size
+
+def set_client(client):
+    """Pakai FileClient (pool koneksi keep-alive) untuk semua helper di modul ini"""
+    global CLIENT
+    CLIENT = client
+
 def send_command(cmd):
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 256 * 1024)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 256 * 1024)
-    sock.connect((SERVER_HOST, SERVER_PORT))
+    """Kirim satu request teks; request yang dijawab BUSY dicoba ulang dengan backoff"""
+    if CLIENT is not None:
+        return CLIENT.command(cmd)
+    response, _ = retry_busy(send_once, cmd)
+    return response
+
+def send_binary_command(cmd, payload=None):
+    """Kirim request mode biner (BGET/BUPLOAD).
+    Mengembalikan (response_json, payload_balasan atau None)."""
+    if CLIENT is not None:
+        return CLIENT.binary_command(cmd, payload)
+    return retry_busy(send_once, cmd, payload)
+
+def send_once(cmd, payload=None):
+    """Satu request pada koneksi baru yang langsung ditutup"""
+    conn = Connection(SERVER_HOST, SERVER_PORT, RECV_SIZE)
+    try:
+        response = conn.request(cmd, payload)
+        data = None
+        if cmd.upper().startswith('BGET') and response['status'] == 'OK':
+            data = recv_payload(conn.reader)
+        return response, data
+    finally:
+        conn.close()
+
+def call(func, *args):
+    """Jalankan func(conn, *args) pada koneksi dari CLIENT, atau koneksi baru
+    yang langsung ditutup; request yang dijawab BUSY dicoba ulang"""
+    if CLIENT is not None:
+        return CLIENT.call(func, *args)
+    return retry_busy(call_once, func, *args)
+
+def call_once(func, *args):
+    conn = Connection(SERVER_HOST, SERVER_PORT, RECV_SIZE)
     try:
-        full_msg = cmd + "\r\n\r\n"
-        sock.sendall(full_msg.encode())
-        buffer = b''
-        while True:
-            chunk = sock.recv(256 * 1024)  # buffer besar
-            if not chunk:
-                break
-            buffer += chunk
-            if b'\r\n\r\n' in buffer:
-                break
-        response_str = buffer.decode()
-        response_str = response_str.replace('\r\n\r\n', '')
-        return json.loads(response_str)
+        return func(conn, *args)
     finally:
-        sock.close()
+        conn.close()
+
+class LocalHashCache:
+    """Cache sha256 file lokal yang disimpan di file JSON, dengan kunci path
+    absolut dan divalidasi dengan size/mtime file. Hash hanya dihitung ulang
+    untuk file yang berubah, sehingga sinkronisasi berulang cukup membandingkan
+    hash dengan etag dari server."""
+
+    def __init__(self, path='.hashcache.json'):
+        self.path = path
+        self.entries = None
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        if self.entries is None:
+            try:
+                with open(self.path) as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def digest(self, filepath):
+        """sha256 isi file filepath (dari cache jika file tidak berubah)"""
+        key = os.path.abspath(filepath)
+        st = os.stat(filepath)
+        with self.lock:
+            self.load()
+            entry = self.entries.get(key)
+        if entry is not None and entry[:2] == [st.st_size, st.st_mtime_ns]:
+            return entry[2]
+        h = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(block)
+        self.remember(filepath, h.hexdigest(), st)
+        return h.hexdigest()
+
+    def remember(self, filepath, sha256, st=None):
+        """Catat hash file yang baru ditulis/dibaca"""
+        st = st or os.stat(filepath)
+        with self.lock:
+            self.load()
+            self.entries[os.path.abspath(filepath)] = [st.st_size, st.st_mtime_ns, sha256]
+            self.dirty = True
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            tmp = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.entries, f)
+            os.replace(tmp, self.path)
+            self.dirty = False
+
+HASHES = LocalHashCache()
+atexit.register(HASHES.save)
+
+def set_hash_cache(path):
+    """Ganti lokasi file cache hash lokal"""
+    global HASHES
+    HASHES.save()
+    HASHES = LocalHashCache(path)
+    atexit.register(HASHES.save)
+
+def local_etag(path):
+    """Opsi if-none-match untuk file lokal path, atau string kosong jika belum ada"""
+    return f' if-none-match={HASHES.digest(path)}' if os.path.isfile(path) else ''
 
 def generate_dummy_file(filename, size_mb):
-    size_bytes = size_mb * 1024 * 1024
+    # ditulis per MB agar tidak ikut menaikkan RSS puncak client
     with open(filename, 'wb') as f:
-        f.write(os.urandom(size_bytes))
+        for _ in range(size_mb):
+            f.write(os.urandom(1024 * 1024))
+
+# folder file dummy stress test; file dibuat sekali lalu dipakai ulang
+DUMMY_FOLDER = 'stress_data'
+
+def dummy_file_path(size_mb, folder=DUMMY_FOLDER):
+    """Path file dummy size_mb MB di folder, dibuat bila belum ada (atau
+    ukurannya berbeda). Dipakai bersama oleh semua worker dan skenario stress
+    test sehingga tidak ada worker yang menulis ulang file besar."""
+    path = os.path.join(folder, f'dummy_{size_mb}MB.dat')
+    if not os.path.isfile(path) or os.path.getsize(path) != size_mb * 1024 * 1024:
+        os.makedirs(folder, exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        generate_dummy_file(tmp, size_mb)
+        os.replace(tmp, path)
+    return path
+
+def read_blocks(fp):
+    return iter(lambda: fp.read(CHUNK_SIZE), b'')
+
+def send_upload(conn, prefix, filepath, codec=None):
+    """Kirim UPLOAD teks: isi filepath dibaca, dikompresi (codec = (nama, level))
+    dan di-encode base64 per blok"""
+    with open(filepath, 'rb') as fp:
+        blocks = read_blocks(fp)
+        if codec is not None:
+            blocks = compress_blocks(blocks, *codec)
+        return conn.stream_request(prefix, base64_blocks(blocks))
+
+def receive_download(conn, cmd, path):
+    """Kirim GET/BGET dan tulis isinya per blok ke file sementara yang
+    menggantikan path hanya jika download berhasil. Mengembalikan response."""
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp, 'wb') as fp:
+            conn.send(cmd)
+            if cmd.upper().startswith('BGET'):
+                res = conn.read_response()
+                if res['status'] == 'OK':
+                    recv_payload_into(conn.reader, fp)
+            else:
+                res = conn.read_file_response(fp)
+        if res['status'] == 'OK':
+            os.replace(tmp, path)
+        return res
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
 
-def upload_file(filepath):
+def upload_file(filepath, conditional=True, compress_spec=None):
+    """Upload file; jika conditional, server tidak menyimpan file bila isinya
+    sudah sama (if-none-match, diperiksa server dalam request yang sama).
+    compress_spec (mis. 'zlib:6' atau 'lzma') mengompresi isi sebelum dikirim,
+    kecuali sampel awal file ternyata tidak layak dikompresi.
+    Isi file dikirim per blok, jadi memori tidak bergantung pada ukuran file."""
     if not os.path.isfile(filepath):
         return False, "File tidak ditemukan"
     filename = os.path.basename(filepath)
-    with open(filepath, 'rb') as fp:
-        b64 = base64.b64encode(fp.read()).decode()
-    res = send_command(f'UPLOAD {filename} {b64}')
+    codec = None
+    option = f'if-none-match={HASHES.digest(filepath)} ' if conditional else ''
+    if compress_spec is not None:
+        with open(filepath, 'rb') as fp:
+            if is_compressible(fp.read(SAMPLE_SIZE)):
+                codec = parse_codec(compress_spec)
+                option += f'compress={compress_spec} '
+    res = call(send_upload, f'UPLOAD {filename} {option}', filepath, codec)
+    if res['status'] == 'NOT_MODIFIED':
+        return True, "File tidak berubah, upload dilewati"
     if res['status'] == 'OK':
         return True, res['data']
     else:
         return False, res['data']
 
-def download_file(filename, dest_folder):
-    res = send_command(f'GET {filename}')
+def download_file(filename, dest_folder, conditional=True, compress_spec=None):
+    """Download file; jika conditional dan salinan lokal sama dengan file di
+    server (if-none-match), isi file tidak dikirim ulang. compress_spec meminta
+    server mengompresi isi (server boleh menolak untuk data yang tidak layak).
+    Isi file didekode dan ditulis ke disk per blok."""
+    path = os.path.join(dest_folder, filename)
+    cmd = f'GET {filename}' + (local_etag(path) if conditional else '')
+    if compress_spec is not None:
+        cmd += f' compress={compress_spec}'
+    res = call(receive_download, cmd, path)
+    if res['status'] == 'NOT_MODIFIED':
+        return True, f"File '{filename}' tidak berubah"
     if res['status'] == 'OK':
-        data = base64.b64decode(res['data_file'])
-        path = os.path.join(dest_folder, filename)
-        with open(path, 'wb') as fp:
-            fp.write(data)
+        if conditional and res.get('etag'):
+            HASHES.remember(path, res['etag'])
         return True, f"File '{filename}' berhasil di-download"
     else:
         return False, res['data']
 
-def stress_upload_worker(file_size_mb):
-    filename = f'dummy_{file_size_mb}MB.dat'
-    generate_dummy_file(filename, file_size_mb)
+BATCH_SIZE = 100
+# batas isi file (sebelum base64) per request MUPLOAD
+BATCH_BYTES = 8 * 1024 * 1024
+
+def upload_batches(filepaths, batch_size, batch_bytes):
+    """Bagi filepaths menjadi batch berisi maksimal batch_size file dan sekitar
+    batch_bytes byte (file yang lebih besar tetap dikirim sendirian)"""
+    batch, total = [], 0
+    for filepath in filepaths:
+        size = os.path.getsize(filepath)
+        if batch and (len(batch) >= batch_size or total + size > batch_bytes):
+            yield batch
+            batch, total = [], 0
+        batch.append(filepath)
+        total += size
+    if batch:
+        yield batch
+
+def batch_items(res, names):
+    """Hasil per item dari response MGET/MUPLOAD/MDELETE; bila seluruh batch
+    gagal, setiap nama mendapat error batch tersebut"""
+    if res['status'] != 'OK':
+        return [dict(name=name, status='ERROR', data=res['data']) for name in names]
+    return res['data']
+
+def upload_files(filepaths, batch_size=BATCH_SIZE, batch_bytes=BATCH_BYTES):
+    """Upload banyak file kecil dengan MUPLOAD: satu request per batch.
+    Mengembalikan list (nama, sukses, pesan)."""
+    results = [(os.path.basename(path), False, "File tidak ditemukan")
+               for path in filepaths if not os.path.isfile(path)]
+    existing = [path for path in filepaths if os.path.isfile(path)]
+    for batch in upload_batches(existing, batch_size, batch_bytes):
+        parts = []
+        for filepath in batch:
+            with open(filepath, 'rb') as fp:
+                parts.append(f'{os.path.basename(filepath)} {base64.b64encode(fp.read()).decode()}')
+        res = send_command('MUPLOAD ' + ' '.join(parts))
+        results += [(item['name'], item['status'] == 'OK', item['data'])
+                    for item in batch_items(res, [os.path.basename(path) for path in batch])]
+    return results
+
+def download_files(filenames, dest_folder, batch_size=BATCH_SIZE):
+    """Download banyak file kecil dengan MGET: satu request per batch.
+    Mengembalikan list (nama, sukses, pesan)."""
+    results = []
+    for i in range(0, len(filenames), batch_size):
+        batch = filenames[i:i + batch_size]
+        for item in batch_items(send_command('MGET ' + ' '.join(batch)), batch):
+            name = item['name']
+            if item['status'] != 'OK':
+                results.append((name, False, item['data']))
+                continue
+            with open(os.path.join(dest_folder, name), 'wb') as fp:
+                fp.write(base64.b64decode(item['data_file']))
+            results.append((name, True, f"File '{name}' berhasil di-download"))
+    return results
+
+def delete_files(filenames, batch_size=BATCH_SIZE):
+    """Hapus banyak file dengan MDELETE: satu request per batch.
+    Mengembalikan list (nama, sukses, pesan)."""
+    results = []
+    for i in range(0, len(filenames), batch_size):
+        batch = filenames[i:i + batch_size]
+        results += [(item['name'], item['status'] == 'OK', item['data'])
+                    for item in batch_items(send_command('MDELETE ' + ' '.join(batch)), batch)]
+    return results
+
+def upload_file_binary(filepath, conditional=True):
+    """Upload file dengan mode biner (tanpa base64), dikirim langsung dari disk"""
+    if not os.path.isfile(filepath):
+        return False, "File tidak ditemukan"
+    filename = os.path.basename(filepath)
+    res = call(Connection.file_request, f'BUPLOAD {filename}' + (local_etag(filepath) if conditional else ''), filepath)
+    if res['status'] == 'NOT_MODIFIED':
+        return True, "File tidak berubah, upload dilewati"
+    return res['status'] == 'OK', res['data']
+
+def download_file_binary(filename, dest_folder, conditional=True, segmented=False):
+    """Download file dengan mode biner (tanpa base64), ditulis ke disk per blok.
+    segmented=True mengambil file per segmen secara paralel (lihat
+    download_file_segmented); download segmented yang belum selesai di
+    dest_folder selalu dilanjutkan."""
+    path = os.path.join(dest_folder, filename)
+    if segmented or os.path.exists(path + '.part.json'):
+        return download_file_segmented(filename, dest_folder, conditional=conditional)
+    res = call(receive_download, f'BGET {filename}' + (local_etag(path) if conditional else ''), path)
+    if res['status'] == 'NOT_MODIFIED':
+        return True, f"File '{filename}' tidak berubah"
+    if res['status'] != 'OK':
+        return False, res['data']
+    if conditional and res.get('etag'):
+        HASHES.remember(path, res['etag'])
+    return True, f"File '{filename}' berhasil di-download"
+
+SEGMENT_SIZE = 8 * 1024 * 1024
+
+def fetch_segment(client, filename, fd, offset, length):
+    """Ambil satu rentang file dengan BGET dan tulis ke posisinya dengan os.pwrite.
+    Mengembalikan header response (size/mtime) dari server."""
+    with client.connection() as conn:
+        conn.send(f'BGET {filename} offset={offset} length={length}')
+        res = conn.read_response()
+        if res['status'] != 'OK':
+            return res
+        (n,) = LENGTH_HEADER.unpack(conn.reader.read_exact(LENGTH_HEADER.size))
+        if n != length:
+            raise ConnectionError(f'segmen {offset} hanya berisi {n} dari {length} byte')
+        pos = offset
+        for block in conn.reader.iter_exact(n):
+            os.pwrite(fd, block, pos)
+            pos += len(block)
+        return res
+
+def download_file_segmented(filename, dest_folder, connections=4, segment_size=SEGMENT_SIZE, conditional=False):
+    """Download file besar dalam beberapa segmen secara paralel lewat beberapa
+    koneksi (dari CLIENT bila ada). Progres disimpan di '<file>.part.json';
+    bila download gagal, panggilan berikutnya hanya mengambil segmen yang
+    belum selesai. Jika conditional, file lokal yang sama dengan file di
+    server tidak di-download ulang."""
+    path = os.path.join(dest_folder, filename)
+    part_path = path + '.part'
+    state_path = part_path + '.json'
+    client = CLIENT or FileClient(SERVER_HOST, SERVER_PORT, max_connections=connections, recv_size=RECV_SIZE)
+    try:
+        # length=0 hanya untuk mengetahui ukuran dan versi file
+        info, _ = client.binary_command(f'BGET {filename} offset=0 length=0'
+                                        + (local_etag(path) if conditional else ''))
+        if info['status'] == 'NOT_MODIFIED':
+            return True, f"File '{filename}' tidak berubah"
+        if info['status'] != 'OK':
+            return False, info['data']
+        size, mtime = info['size'], info['mtime']
+
+        state = None
+        if os.path.exists(state_path) and os.path.exists(part_path):
+            with open(state_path) as f:
+                state = json.load(f)
+            if (state.get('size'), state.get('mtime'), state.get('segment_size')) != (size, mtime, segment_size):
+                state = None  # file di server sudah berubah, mulai dari awal
+        if state is None:
+            state = dict(size=size, mtime=mtime, segment_size=segment_size, done=[])
+        done = set(state['done'])
+        lock = threading.Lock()
+
+        def save_state():
+            tmp = state_path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(dict(state, done=sorted(done)), f)
+            os.replace(tmp, state_path)
+
+        def run(index):
+            offset = index * segment_size
+            res = client.retry(fetch_segment, client, filename, fd, offset, min(segment_size, size - offset))
+            if res['status'] != 'OK':
+                raise ConnectionError(res['data'])
+            if (res['size'], res['mtime']) != (size, mtime):
+                raise ConnectionError('file di server berubah saat download')
+            with lock:
+                done.add(index)
+                save_state()
+
+        fd = os.open(part_path, os.O_RDWR | os.O_CREAT)
+        try:
+            os.ftruncate(fd, size)
+            missing = [i for i in range((size + segment_size - 1) // segment_size) if i not in done]
+            save_state()
+            errors = []
+            with ThreadPoolExecutor(max_workers=connections) as executor:
+                for future in as_completed([executor.submit(run, i) for i in missing]):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        errors.append(str(e))
+        finally:
+            os.close(fd)
+        if errors:
+            return False, f"{len(errors)} segmen gagal, jalankan ulang untuk melanjutkan: {errors[0]}"
+        os.replace(part_path, path)
+        os.remove(state_path)
+        if conditional and info.get('etag'):
+            HASHES.remember(path, info['etag'])
+        return True, f"File '{filename}' berhasil di-download ({len(missing)} segmen)"
+    finally:
+        if client is not CLIENT:
+            client.close()
+
+PART_SIZE = 8 * 1024 * 1024
+
+def upload_file_multipart(filepath, concurrency=4, part_size=PART_SIZE, retries=2, upload_id=None):
+    """Upload file besar sebagai beberapa part yang dikirim paralel lalu
+    digabung dan disimpan atomic oleh server (UPLOAD_COMMIT). Part yang gagal
+    dicoba ulang sampai `retries` kali; jika tetap gagal, pesan error memuat
+    upload_id yang bisa diberikan lagi untuk melanjutkan tanpa mengirim ulang
+    part yang sudah diterima server."""
+    if not os.path.isfile(filepath):
+        return False, "File tidak ditemukan"
+    filename = os.path.basename(filepath)
+    size = os.path.getsize(filepath)
+    n_parts = max(1, (size + part_size - 1) // part_size)
+
+    def part_length(n):
+        return min(part_size, size - n * part_size)
+
+    client = FileClient(SERVER_HOST, SERVER_PORT, max_connections=concurrency, recv_size=RECV_SIZE)
+    try:
+        done = set()
+        if upload_id is not None:
+            res = client.command(f'UPLOAD_STATUS {upload_id}')
+            if res['status'] == 'OK':
+                done = {p['part'] for p in res['data'] if p['part'] < n_parts and p['size'] == part_length(p['part'])}
+            else:
+                upload_id = None
+        if upload_id is None:
+            res = client.command(f'UPLOAD_BEGIN {filename}')
+            if res['status'] != 'OK':
+                return False, res['data']
+            upload_id = res['upload_id']
+
+        fd = os.open(filepath, os.O_RDONLY)
+
+        def send_part(n):
+            length = part_length(n)
+            error = None
+            for _ in range(retries + 1):
+                try:
+                    data = os.pread(fd, length, n * part_size)
+                    res, _ = client.binary_command(f'BUPLOADPART {upload_id} {n}', data)
+                    if res['status'] == 'OK' and res['size'] == length:
+                        return
+                    error = res.get('data', 'ukuran part tidak sesuai')
+                except Exception as e:
+                    error = str(e)
+            raise ConnectionError(f'part {n} gagal: {error}')
+
+        errors = []
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                futures = [executor.submit(send_part, n) for n in range(n_parts) if n not in done]
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        errors.append(str(e))
+        finally:
+            os.close(fd)
+        if errors:
+            return False, f"{len(errors)} part gagal (upload_id={upload_id}): {errors[0]}"
+        res = client.command(f'UPLOAD_COMMIT {upload_id} parts={n_parts}')
+        return res['status'] == 'OK', res['data']
+    finally:
+        client.close()
+
+def stress_upload_worker(file_size_mb, transfer='text', compress_spec=None, filename=None):
+    # file dummy disiapkan sekali oleh run_stress_test dan tidak dihapus worker
+    filename = filename or dummy_file_path(file_size_mb)
     start = time.time()
-    success, msg = upload_file(filename)
+    # stress test selalu mengukur transfer penuh, tanpa STAT/etag
+    if transfer == 'binary':
+        success, msg = upload_file_binary(filename, conditional=False)
+    else:
+        success, msg = upload_file(filename, conditional=False, compress_spec=compress_spec)
     end = time.time()
     duration = end - start
     size_bytes = file_size_mb * 1024 * 1024
-    try:
-        os.remove(filename)
-    except:
-        pass
     print(f"[Worker Upload] File: {filename}, Success: {success}, Duration: {duration:.3f}s")
-    return success, duration, size_bytes
+    return success, duration, size_bytes, peak_rss_kb()
 
-def stress_download_worker(file_size_mb):
+def stress_download_worker(file_size_mb, transfer='text', compress_spec=None):
     filename = f'dummy_{file_size_mb}MB.dat'
     start = time.time()
-    success, msg = download_file(filename, '.')
+    if transfer == 'binary':
+        success, msg = download_file_binary(filename, '.', conditional=False)
+    else:
+        success, msg = download_file(filename, '.', conditional=False, compress_spec=compress_spec)
     end = time.time()
     duration = end - start
     size_bytes = file_size_mb * 1024 * 1024
@@ -91,36 +518,58 @@ def stress_download_worker(file_size_mb):
     except:
         pass
     print(f"[Worker Download] File: {filename}, Success: {success}, Duration: {duration:.3f}s")
-    return success, duration, size_bytes
+    return success, duration, size_bytes, peak_rss_kb()
 
-def run_stress_test(operation, file_size_mb, client_workers, server_workers, concurrency_mode='thread', port=6666):
+def run_stress_test(operation, file_size_mb, client_workers, server_workers, concurrency_mode='thread', port=6666, transfer='text', keepalive=False, compress_spec=None, dummy_folder=DUMMY_FOLDER):
     set_server_port(port)
-    print(f"Mulai stress test: {operation}, file {file_size_mb}MB, client workers {client_workers}, server workers {server_workers}, mode {concurrency_mode}, port {port}")
+    print(f"Mulai stress test: {operation}, file {file_size_mb}MB, client workers {client_workers}, server workers {server_workers}, mode {concurrency_mode}, port {port}, transfer {transfer}, compress {compress_spec}")
+    # pool koneksi hanya bisa dibagi antar thread, tidak antar proses
+    client = None
+    if keepalive and concurrency_mode != 'process':
+        client = FileClient(SERVER_HOST, port, max_connections=min(client_workers, server_workers), recv_size=RECV_SIZE)
+        set_client(client)
 
-    ExecutorClass = ThreadPoolExecutor if concurrency_mode == 'thread' else ProcessPoolExecutor
+    ExecutorClass = ProcessPoolExecutor if concurrency_mode == 'process' else ThreadPoolExecutor
     worker_func = stress_upload_worker if operation == 'upload' else stress_download_worker
+    worker_args = (file_size_mb, transfer, compress_spec)
+    if operation == 'upload':
+        worker_args += (dummy_file_path(file_size_mb, dummy_folder),)
 
     success_count = 0
     fail_count = 0
     durations = []
+    throughputs = []
+    # RSS puncak client: proses ini (mode thread) atau proses worker terbesar (mode process)
+    reset_peak_rss()
+    peak_kb = 0
 
     with ExecutorClass(max_workers=client_workers) as executor:
-        futures = [executor.submit(worker_func, file_size_mb) for _ in range(client_workers)]
+        futures = [executor.submit(worker_func, *worker_args) for _ in range(client_workers)]
         for future in as_completed(futures):
             try:
-                success, duration, _ = future.result()
+                success, duration, size_bytes, worker_peak_kb = future.result()
+                peak_kb = max(peak_kb, worker_peak_kb)
                 if success:
                     success_count += 1
                     durations.append(duration)
+                    throughputs.append(size_bytes / duration if duration > 0 else 0)
                 else:
                     fail_count += 1
             except Exception as e:
                 print(f"Worker raised exception: {e}")
                 fail_count += 1
 
-    avg_duration = max(durations) if durations else 0
+    if client is not None:
+        set_client(None)
+        client.close()
+
+    durations.sort()
+    avg_duration = sum(durations) / len(durations) if durations else 0
+    avg_throughput = sum(throughputs) / len(throughputs) if throughputs else 0
+    # semua client mulai bersamaan, jadi durasi terlama = waktu seluruh burst
+    max_duration = durations[-1] if durations else 0
     total_bytes = success_count * file_size_mb * 1024 * 1024
-    avg_throughput = total_bytes / avg_duration if avg_duration > 0 else 0
+    aggregate_throughput = total_bytes / max_duration if max_duration > 0 else 0
 
     server_status = send_command('STATUS')
     if server_status['status'] == 'OK':
@@ -139,6 +588,12 @@ def run_stress_test(operation, file_size_mb, client_workers, server_workers, con
         'fail_client_workers': fail_count,
         'avg_duration_per_client_sec': avg_duration,
         'avg_throughput_per_client_bps': avg_throughput,
+        'p50_duration_sec': sample_percentile(durations, 0.5) or 0,
+        'p90_duration_sec': sample_percentile(durations, 0.9) or 0,
+        'p99_duration_sec': sample_percentile(durations, 0.99) or 0,
+        'max_duration_sec': max_duration,
+        'aggregate_throughput_bps': aggregate_throughput,
+        'client_peak_rss_mb': round(peak_kb / 1024, 1),
         'success_server_workers': success_server_workers,
         'fail_server_workers': fail_server_workers,
     }
@@ -1,60 +1,543 @@
 import os
 import base64
+import hashlib
 import json
+import re
+import shutil
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from compression import CompressionStats, parse_codec, is_compressible, compress, compress_blocks, decompress
+from directory_index import DirectoryIndex, HashCache, HASH_DB
+from file_transfer import base64_blocks, CHUNK_SIZE
+from response_cache import ResponseCache, DEFAULT_CACHE_BYTES
+from storage import STORAGE_BACKENDS, valid_name
+
+TEMP_FOLDER = '.tmp'
+MULTIPART_PREFIX = 'multipart-'
+UPLOAD_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+# backend penyimpanan default: 'flat' (satu file per nama) atau 'cas'
+# (content-addressed dengan deduplikasi, lihat storage.BlobStorage)
+DEFAULT_STORAGE = os.environ.get('FILE_STORAGE', 'flat')
+# nama berupa path/alias ditolak sebelum menyentuh storage (lihat storage.valid_name)
+INVALID_NAME = 'Nama file tidak valid'
+# thread untuk memproses item MGET/MUPLOAD/MDELETE secara paralel
+DEFAULT_BATCH_WORKERS = int(os.environ.get('FILE_BATCH_WORKERS', '4'))
+
+def split_options(params, n_positional=0):
+    """Pisahkan n_positional parameter pertama dari opsi berbentuk key=value.
+    Parameter lain yang bukan key=value ikut dianggap parameter posisi."""
+    positional = list(params[:n_positional])
+    options = {}
+    for param in params[n_positional:]:
+        key, sep, value = param.partition('=')
+        if sep and key:
+            options[key.lower()] = value
+        else:
+            positional.append(param)
+    return positional, options
+
+def parse_range(options, size):
+    """Baca opsi offset/length untuk file berukuran size.
+    Length yang melewati akhir file dipotong. Mengembalikan (offset, length)."""
+    offset = int(options.get('offset', 0))
+    if offset < 0 or offset > size:
+        raise ValueError('offset di luar ukuran file')
+    length = size - offset
+    if 'length' in options:
+        if int(options['length']) < 0:
+            raise ValueError('length tidak valid')
+        length = min(int(options['length']), length)
+    return offset, length
+
+class HashingFile:
+    """Pembungkus file tulis yang menghitung sha256 isi file sambil ditulis"""
+
+    def __init__(self, f):
+        self.f = f
+        self.hasher = hashlib.sha256()
+
+    def write(self, data):
+        self.hasher.update(data)
+        return self.f.write(data)
+
+    def hexdigest(self):
+        return self.hasher.hexdigest()
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
 class FileInterface:
-    def __init__(self, base_folder='files'):
+    # command teks yang boleh dipanggil lewat FileProtocol
+    COMMANDS = ('list', 'stat', 'get', 'upload', 'delete',
+                'upload_begin', 'upload_part', 'upload_status', 'upload_commit', 'upload_abort',
+                'mget', 'mupload', 'mdelete')
+
+    def __init__(self, base_folder='files', cache_bytes=DEFAULT_CACHE_BYTES, storage=DEFAULT_STORAGE,
+                 metrics=None):
         self.base_folder = base_folder
+        self.temp_folder = os.path.join(self.base_folder, TEMP_FOLDER)
         os.makedirs(self.base_folder, exist_ok=True)
+        os.makedirs(self.temp_folder, exist_ok=True)
+        if storage not in STORAGE_BACKENDS:
+            raise ValueError(f'storage harus salah satu dari {", ".join(STORAGE_BACKENDS)}')
+        self.storage = STORAGE_BACKENDS[storage](self.base_folder)
+        # cache response GET yang sudah di-encode, diisi oleh FileProtocol;
+        # statistik cache dan kompresi di metrics server (jumlah semua worker) bila ada
+        self.cache = ResponseCache(cache_bytes, metrics=metrics)
+        self.compression = CompressionStats(metrics)
+        # metadata semua file (size, mtime, sha256) untuk LIST tanpa scan storage;
+        # dibangun sekali sebelum fork, hash dibagi antar worker lewat HashCache
+        self.index = DirectoryIndex(self.storage, HashCache(os.path.join(self.base_folder, HASH_DB)))
+        # file sementara yang sedang ditulis -> HashingFile-nya
+        self.pending = {}
+        # thread dibuat saat batch pertama, jadi aman dibuat sebelum fork
+        self.batch = ThreadPoolExecutor(max_workers=DEFAULT_BATCH_WORKERS)
+
+    def file_path(self, filename):
+        """Path isi file filename di storage, atau None jika file tidak ada"""
+        info = self.storage.info(filename)
+        return info.path if info is not None else None
+
+    def stat_file(self, filename):
+        """os.stat isi file filename, atau None jika file tidak ada"""
+        path = self.file_path(filename)
+        try:
+            return os.stat(path) if path is not None else None
+        except OSError:
+            return None
+
+    def open_temp(self):
+        """Buka file sementara untuk menampung upload. Mengembalikan (file, path)."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.temp_folder, prefix='upload-')
+        f = HashingFile(os.fdopen(fd, 'wb'))
+        self.pending[tmp_path] = f
+        return f, tmp_path
+
+    def commit_temp(self, filename, tmp_path, if_none_match=None):
+        """Simpan file sementara ke storage dengan nama tujuan secara atomic.
+        Jika if_none_match sama dengan etag file di server, file tidak
+        disimpan dan hasilnya NOT_MODIFIED; pemeriksaan dan penyimpanan
+        dilakukan di bawah commit_lock sehingga tidak disela upload lain."""
+        if not valid_name(filename):
+            self.discard_temp(tmp_path)
+            return dict(status='ERROR', data=INVALID_NAME)
+        f = self.pending.pop(tmp_path, None)
+        digest = f.hexdigest() if f is not None else None
+        # store dan update index berurutan antar commit agar versi storage
+        # tidak tertukar; versi yang tertukar membuat LIST berikutnya memindai
+        # ulang dan menghitung ulang hash file besar
+        with self.index.commit_lock:
+            try:
+                if if_none_match is not None:
+                    entry = self.index.lookup(filename)
+                    if entry is not None and entry['hash'] == if_none_match:
+                        self.discard_temp(tmp_path)
+                        return self.not_modified(filename, entry['hash'])
+                versions = self.storage.store(filename, tmp_path, digest)
+            except Exception as e:
+                self.discard_temp(tmp_path)
+                return dict(status='ERROR', data=str(e))
+            self.index.update(filename, digest, versions)
+        self.cache.invalidate(filename)
+        return dict(status='OK', data='Upload sukses')
+
+    def discard_temp(self, tmp_path):
+        """Hapus file sementara upload yang gagal"""
+        self.pending.pop(tmp_path, None)
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
 
     def list(self, params):
-        """List semua file dalam folder base_folder"""
+        """List file dalam storage dari index, terurut.
+        Opsi: prefix=P, sort=name|size|mtime, order=asc|desc, limit=N,
+        cursor=C (next_cursor dari halaman sebelumnya), detail=1 untuk
+        menyertakan size, mtime dan hash setiap file."""
+        _, options = split_options(params)
         try:
-            files = os.listdir(self.base_folder)
-            return dict(status='OK', data=files)
+            order = options.get('order', 'asc').lower()
+            if order not in ('asc', 'desc'):
+                raise ValueError('order harus asc atau desc')
+            limit = int(options['limit']) if 'limit' in options else None
+            if limit is not None and limit <= 0:
+                raise ValueError('limit tidak valid')
+            self.index.refresh_if_changed()
+            items, next_cursor = self.index.query(prefix=options.get('prefix', ''),
+                                                  sort=options.get('sort', 'name').lower(),
+                                                  descending=order == 'desc',
+                                                  limit=limit, cursor=options.get('cursor'))
+            if options.get('detail') == '1':
+                data = [dict(name=name, **entry) for name, entry in items]
+            else:
+                data = [name for name, _ in items]
+            hasil = dict(status='OK', data=data)
+            if limit is not None:
+                hasil['next_cursor'] = next_cursor
+            return hasil
         except Exception as e:
             return dict(status='ERROR', data=str(e))
 
-    def get(self, params):
-        """Download file: params[0] = filename"""
+    def stat(self, params):
+        """Metadata file tanpa isinya: params[0] = filename.
+        etag = sha256 isi file, sama dengan hash pada LIST detail=1."""
         if not params:
             return dict(status='ERROR', data='Nama file tidak diberikan')
-        filename = params[0]
-        path = os.path.join(self.base_folder, filename)
-        if not os.path.isfile(path):
+        if not valid_name(params[0]):
+            return dict(status='ERROR', data=INVALID_NAME)
+        try:
+            entry = self.index.lookup(params[0])
+        except Exception as e:
+            return dict(status='ERROR', data=str(e))
+        if entry is None:
             return dict(status='ERROR', data='File tidak ditemukan')
+        return dict(status='OK', data_namafile=params[0], size=entry['size'],
+                    mtime=entry['mtime'], etag=entry['hash'])
+
+    def not_modified(self, filename, etag):
+        return dict(status='NOT_MODIFIED', data='File tidak berubah', data_namafile=filename, etag=etag)
+
+    def encode_data(self, data, options, hasil):
+        """Isi data_file (base64) pada hasil. Dengan opsi compress=codec[:level]
+        data dikompresi hanya jika sampel awalnya layak dikompresi; hasil lalu
+        memuat encoding dan raw_size."""
+        if 'compress' in options:
+            codec, level = parse_codec(options['compress'])
+            if is_compressible(data):
+                packed = compress(data, codec, level)
+                self.compression.record(codec, len(data), len(packed))
+                hasil.update(encoding=codec, raw_size=len(data))
+                data = packed
+            else:
+                self.compression.record_bypass(len(data))
+        hasil['data_file'] = base64.b64encode(data).decode()
+        return hasil
+
+    def get_source(self, params):
+        """Periksa request GET dan siapkan metadata response tanpa membaca isi
+        file. Mengembalikan (hasil, (path, offset, length, options)), atau
+        (hasil, None) jika hasil sudah final (ERROR, NOT_MODIFIED)."""
+        if not params:
+            return dict(status='ERROR', data='Nama file tidak diberikan'), None
+        filename = params[0]
+        if not valid_name(filename):
+            return dict(status='ERROR', data=INVALID_NAME), None
+        _, options = split_options(params, 1)
+        path = self.file_path(filename)
+        if path is None:
+            return dict(status='ERROR', data='File tidak ditemukan'), None
+        try:
+            # etag diambil sebelum isi dibaca: jika file berubah di antaranya,
+            # client hanya akan men-download ulang, bukan menyimpan etag yang salah
+            entry = self.index.lookup(filename)
+            etag = entry['hash'] if entry else None
+            if etag is not None and options.get('if-none-match') == etag:
+                return self.not_modified(filename, etag), None
+            size = os.path.getsize(path)
+            if 'offset' in options or 'length' in options:
+                offset, length = parse_range(options, size)
+                return dict(status='OK', data_namafile=filename, size=size, etag=etag,
+                            offset=offset, length=length), (path, offset, length, options)
+            return dict(status='OK', etag=etag), (path, 0, size, options)
+        except Exception as e:
+            return dict(status='ERROR', data=str(e)), None
+
+    def get(self, params):
+        """Download file: params[0] = filename,
+        opsional offset=N length=N untuk mengambil sebagian file,
+        opsional if-none-match=ETAG agar isi tidak dikirim jika file tidak berubah,
+        opsional compress=zlib[:level]|lzma[:level] untuk kompresi isi"""
+        hasil, source = self.get_source(params)
+        if source is None:
+            return hasil
+        path, offset, length, options = source
         try:
             with open(path, 'rb') as f:
-                data_b64 = base64.b64encode(f.read()).decode()
-            return dict(status='OK', data_file=data_b64)
+                f.seek(offset)
+                data = f.read(length)
+            return self.encode_data(data, options, hasil)
         except Exception as e:
             return dict(status='ERROR', data=str(e))
 
+    def get_chunks(self, params):
+        """Seperti get, tetapi isi file tidak dibaca sekaligus. Mengembalikan
+        (hasil tanpa data_file, iterator blok base64 isi file), atau
+        (hasil, None) jika tidak ada isi yang dikirim. Keputusan kompresi
+        diambil dari blok pertama sehingga encoding sudah ada di hasil."""
+        hasil, source = self.get_source(params)
+        if source is None:
+            return hasil, None
+        path, offset, length, options = source
+        try:
+            f = open(path, 'rb')
+        except Exception as e:
+            return dict(status='ERROR', data=str(e)), None
+        try:
+            f.seek(offset)
+            first = f.read(min(length, CHUNK_SIZE))
+            blocks = self.read_blocks(f, first, length)
+            if 'compress' in options:
+                codec, level = parse_codec(options['compress'])
+                if is_compressible(first):
+                    hasil.update(encoding=codec, raw_size=length)
+                    blocks = self.compress_blocks(blocks, codec, level, length)
+                else:
+                    self.compression.record_bypass(length)
+        except Exception as e:
+            f.close()
+            return dict(status='ERROR', data=str(e)), None
+        return hasil, base64_blocks(blocks)
+
+    def read_blocks(self, f, first, length):
+        """Hasilkan length byte isi file f per blok (first = blok pertama yang
+        sudah dibaca), lalu tutup f"""
+        with f:
+            yield first
+            remaining = length - len(first)
+            while remaining > 0:
+                block = f.read(min(remaining, CHUNK_SIZE))
+                if not block:
+                    raise ConnectionError('file berubah saat dikirim')
+                remaining -= len(block)
+                yield block
+
+    def compress_blocks(self, blocks, codec, level, raw_bytes):
+        wire_bytes = 0
+        for packed in compress_blocks(blocks, codec, level):
+            wire_bytes += len(packed)
+            yield packed
+        self.compression.record(codec, raw_bytes, wire_bytes)
+
     def upload(self, params):
-        """Upload file: params[0] = filename, params[1] = base64 content"""
+        """Upload file: params[0] = filename, params[1] = base64 content,
+        opsional compress=codec jika isi dikompresi oleh client,
+        opsional if-none-match=ETAG agar file tidak disimpan jika isi file di
+        server sudah sama"""
         if len(params) < 2:
             return dict(status='ERROR', data='Parameter kurang untuk upload')
         filename = params[0]
+        if not valid_name(filename):
+            return dict(status='ERROR', data=INVALID_NAME)
         data_b64 = params[1]
-        path = os.path.join(self.base_folder, filename)
+        _, options = split_options(params, 2)
         try:
             data = base64.b64decode(data_b64)
-            with open(path, 'wb') as f:
+            if 'compress' in options:
+                codec, _ = parse_codec(options['compress'])
+                packed, data = data, decompress(data, codec)
+                self.compression.record(codec, len(data), len(packed))
+            f, tmp_path = self.open_temp()
+            with f:
                 f.write(data)
-            return dict(status='OK', data='Upload sukses')
+            return self.commit_temp(filename, tmp_path, options.get('if-none-match'))
         except Exception as e:
             return dict(status='ERROR', data=str(e))
 
+    def bget(self, params):
+        """Download file mode biner: params[0] = filename,
+        opsional offset=N length=N untuk mengambil sebagian file,
+        opsional if-none-match=ETAG (lihat get).
+        Mengembalikan (hasil, (path_file, offset, length)) agar isi dikirim
+        langsung dari disk."""
+        if not params:
+            return dict(status='ERROR', data='Nama file tidak diberikan'), None
+        filename = params[0]
+        if not valid_name(filename):
+            return dict(status='ERROR', data=INVALID_NAME), None
+        _, options = split_options(params, 1)
+        path = self.file_path(filename)
+        if path is None:
+            return dict(status='ERROR', data='File tidak ditemukan'), None
+        try:
+            entry = self.index.lookup(filename)
+            etag = entry['hash'] if entry else None
+            if etag is not None and options.get('if-none-match') == etag:
+                return self.not_modified(filename, etag), None
+            st = os.stat(path)
+            offset, length = parse_range(options, st.st_size)
+            hasil = dict(status='OK', data_namafile=filename, size=st.st_size, mtime=st.st_mtime_ns, etag=etag)
+            if 'offset' in options or 'length' in options:
+                hasil.update(offset=offset, length=length)
+            return hasil, (path, offset, length)
+        except Exception as e:
+            return dict(status='ERROR', data=str(e)), None
+
+    def bupload(self, params, tmp_path):
+        """Upload file mode biner: params[0] = filename,
+        opsional if-none-match=ETAG (lihat upload),
+        tmp_path = file sementara berisi payload yang sudah diterima"""
+        if not params:
+            self.discard_temp(tmp_path)
+            return dict(status='ERROR', data='Nama file tidak diberikan')
+        _, options = split_options(params, 1)
+        return self.commit_temp(params[0], tmp_path, options.get('if-none-match'))
+
     def delete(self, params):
         """Hapus file: params[0] = filename"""
         if not params:
             return dict(status='ERROR', data='Nama file tidak diberikan')
         filename = params[0]
-        path = os.path.join(self.base_folder, filename)
-        if not os.path.isfile(path):
+        if not valid_name(filename):
+            return dict(status='ERROR', data=INVALID_NAME)
+        if self.storage.info(filename) is None:
             return dict(status='ERROR', data='File tidak ditemukan')
         try:
-            os.remove(path)
+            with self.index.commit_lock:
+                versions = self.storage.remove(filename)
+                self.index.remove(filename, versions)
+            self.cache.invalidate(filename)
             return dict(status='OK', data='File dihapus')
         except Exception as e:
             return dict(status='ERROR', data=str(e))
+
+    def run_batch(self, handler, items):
+        """Jalankan handler untuk setiap item (list params) secara paralel.
+        Hasil per item memuat name; status batch OK walaupun sebagian item gagal."""
+        results = list(self.batch.map(handler, items))
+        failed = sum(1 for hasil in results if hasil['status'] == 'ERROR')
+        data = [dict(hasil, name=item[0]) for item, hasil in zip(items, results)]
+        return dict(status='OK', data=data, ok=len(data) - failed, failed=failed)
+
+    def mget(self, params):
+        """Download banyak file sekaligus: params = nama file"""
+        if not params:
+            return dict(status='ERROR', data='Nama file tidak diberikan')
+        return self.run_batch(self.get, [[name] for name in params])
+
+    def mupload(self, params):
+        """Upload banyak file sekaligus: params = pasangan nama file, isi base64"""
+        if not params or len(params) % 2:
+            return dict(status='ERROR', data='Parameter mupload harus pasangan nama dan isi file')
+        return self.run_batch(self.upload, [params[i:i + 2] for i in range(0, len(params), 2)])
+
+    def mdelete(self, params):
+        """Hapus banyak file sekaligus: params = nama file"""
+        if not params:
+            return dict(status='ERROR', data='Nama file tidak diberikan')
+        return self.run_batch(self.delete, [[name] for name in params])
+
+    def multipart_dir(self, upload_id):
+        """Folder penampung part untuk upload_id, atau None jika id tidak valid"""
+        if not UPLOAD_ID_PATTERN.fullmatch(upload_id):
+            return None
+        path = os.path.join(self.temp_folder, MULTIPART_PREFIX + upload_id)
+        return path if os.path.isdir(path) else None
+
+    def upload_begin(self, params):
+        """Mulai upload multi-part: params[0] = filename. Mengembalikan upload_id."""
+        if not params:
+            return dict(status='ERROR', data='Nama file tidak diberikan')
+        if not valid_name(params[0]):
+            return dict(status='ERROR', data=INVALID_NAME)
+        upload_id = uuid.uuid4().hex
+        try:
+            folder = os.path.join(self.temp_folder, MULTIPART_PREFIX + upload_id)
+            os.makedirs(folder)
+            with open(os.path.join(folder, 'name'), 'w') as f:
+                f.write(params[0])
+            return dict(status='OK', upload_id=upload_id)
+        except Exception as e:
+            return dict(status='ERROR', data=str(e))
+
+    def store_part(self, upload_id, part, tmp_path):
+        """Simpan file sementara sebagai part ke-part dari upload_id"""
+        folder = self.multipart_dir(upload_id)
+        if folder is None:
+            self.discard_temp(tmp_path)
+            return dict(status='ERROR', data='upload_id tidak dikenal')
+        try:
+            part = int(part)
+            if part < 0:
+                raise ValueError('nomor part tidak valid')
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, os.path.join(folder, f'part-{part:08d}'))
+            self.pending.pop(tmp_path, None)
+            return dict(status='OK', part=part, size=size)
+        except Exception as e:
+            self.discard_temp(tmp_path)
+            return dict(status='ERROR', data=str(e))
+
+    def upload_part(self, params):
+        """Kirim satu part: params[0] = upload_id, params[1] = nomor part,
+        params[2] = isi part dalam base64"""
+        if len(params) < 3:
+            return dict(status='ERROR', data='Parameter kurang untuk upload_part')
+        try:
+            data = base64.b64decode(params[2])
+            f, tmp_path = self.open_temp()
+            with f:
+                f.write(data)
+        except Exception as e:
+            return dict(status='ERROR', data=str(e))
+        return self.store_part(params[0], params[1], tmp_path)
+
+    def bupload_part(self, params, tmp_path):
+        """Part mode biner: params[0] = upload_id, params[1] = nomor part,
+        tmp_path = file sementara berisi payload"""
+        if len(params) < 2:
+            self.discard_temp(tmp_path)
+            return dict(status='ERROR', data='Parameter kurang untuk upload_part')
+        return self.store_part(params[0], params[1], tmp_path)
+
+    def list_parts(self, folder):
+        return sorted((int(name[5:]), os.path.getsize(os.path.join(folder, name)))
+                      for name in os.listdir(folder) if name.startswith('part-'))
+
+    def upload_status(self, params):
+        """Daftar part yang sudah diterima: params[0] = upload_id"""
+        folder = self.multipart_dir(params[0]) if params else None
+        if folder is None:
+            return dict(status='ERROR', data='upload_id tidak dikenal')
+        parts = self.list_parts(folder)
+        return dict(status='OK', data=[dict(part=n, size=size) for n, size in parts])
+
+    def upload_commit(self, params):
+        """Gabungkan semua part sesuai urutan nomor lalu simpan atomic:
+        params[0] = upload_id, opsional parts=N untuk memastikan tepat part 0..N-1
+        yang diterima. Tanpa parts, nomor part tetap harus berurutan dari 0
+        tanpa celah agar part yang hilang tidak menghasilkan file terpotong."""
+        folder = self.multipart_dir(params[0]) if params else None
+        if folder is None:
+            return dict(status='ERROR', data='upload_id tidak dikenal')
+        _, options = split_options(params, 1)
+        parts = self.list_parts(folder)
+        try:
+            expected = int(options['parts']) if 'parts' in options else None
+        except (ValueError, KeyError):
+            return dict(status='ERROR', data='parts harus bilangan bulat')
+        numbers = [n for n, _ in parts]
+        if expected is None and not numbers:
+            return dict(status='ERROR', data='belum ada part yang diterima')
+        if numbers != list(range(len(numbers) if expected is None else expected)):
+            return dict(status='ERROR', data='part belum lengkap')
+        with open(os.path.join(folder, 'name')) as f:
+            filename = f.read()
+        out, tmp_path = self.open_temp()
+        try:
+            with out:
+                for n, _ in parts:
+                    with open(os.path.join(folder, f'part-{n:08d}'), 'rb') as src:
+                        shutil.copyfileobj(src, out, 1024 * 1024)
+        except Exception as e:
+            self.discard_temp(tmp_path)
+            return dict(status='ERROR', data=str(e))
+        hasil = self.commit_temp(filename, tmp_path)
+        if hasil['status'] == 'OK':
+            shutil.rmtree(folder, ignore_errors=True)
+        return hasil
+
+    def upload_abort(self, params):
+        """Batalkan upload multi-part: params[0] = upload_id"""
+        folder = self.multipart_dir(params[0]) if params else None
+        if folder is None:
+            return dict(status='ERROR', data='upload_id tidak dikenal')
+        shutil.rmtree(folder, ignore_errors=True)
+        return dict(status='OK', data='Upload dibatalkan')
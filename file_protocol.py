@@ -2,26 +2,49 @@ import json
 import logging
 import shlex
 
-from file_interface import FileInterface
+from file_interface import FileInterface, DEFAULT_STORAGE, split_options
+from file_transfer import BINARY_COMMANDS
+from profiler import CommandProfiler, parse_commands, DEFAULT_LIMIT
+from response_cache import DEFAULT_CACHE_BYTES
+
+# nama request yang dicatat terpisah di metrics server
+REQUEST_TYPES = ('status', 'metrics', 'profile') + FileInterface.COMMANDS + tuple(c.lower() for c in BINARY_COMMANDS)
 
 class FileProtocol:
-    def __init__(self, server_ref=None):
-        self.file = FileInterface()
+    def __init__(self, server_ref=None, cache_bytes=DEFAULT_CACHE_BYTES, storage=DEFAULT_STORAGE,
+                 base_folder='files'):
+        self.file = FileInterface(base_folder=base_folder, cache_bytes=cache_bytes, storage=storage,
+                                  metrics=server_ref.metrics if server_ref is not None else None)
         self.server_ref = server_ref  # referensi server untuk akses statistik
+        # GET file yang response-nya tidak muat di cache dikirim per blok
+        self.stream_min_bytes = self.file.cache.max_entry_bytes * 3 // 4
+        # profiling per command, nonaktif kecuali FILE_PROFILE diset atau lewat PROFILE on
+        self.profiler = CommandProfiler.from_env()
 
     def proses_string(self, string_datamasuk=''):
-        logging.warning(f"string diproses: {string_datamasuk}")
-
-        # Tangani command STATUS khusus untuk statistik server
+        # Tangani command STATUS dan METRICS khusus untuk statistik server
         if string_datamasuk.strip().upper() == 'STATUS':
             if self.server_ref:
                 sukses, gagal = self.server_ref.get_worker_stats()
                 return json.dumps(dict(status='OK', data={
                     'worker_sukses': sukses,
-                    'worker_gagal': gagal
+                    'worker_gagal': gagal,
+                    'metrics': self.server_ref.metrics.snapshot(),
+                    'cache': self.file.cache.stats(),
+                    'compression': self.file.compression.stats()
                 }))
             else:
                 return json.dumps(dict(status='ERROR', data='server stats tidak tersedia'))
+        if string_datamasuk.strip().upper() == 'METRICS':
+            if self.server_ref:
+                return json.dumps(dict(status='OK', data=self.server_ref.metrics.prometheus()))
+            else:
+                return json.dumps(dict(status='ERROR', data='server stats tidak tersedia'))
+        if string_datamasuk[:8].upper() in ('PROFILE', 'PROFILE '):
+            try:
+                return json.dumps(self.profile(shlex.split(string_datamasuk)[1:]))
+            except ValueError as e:
+                return json.dumps(dict(status='ERROR', data=str(e)))
 
         # Proses command upload khusus karena base64 bisa ada spasi
         if string_datamasuk.upper().startswith('UPLOAD '):
@@ -31,21 +54,147 @@ class FileProtocol:
             c_request = parts[0].lower()
             nama_file = parts[1]
             isi_file = parts[2]
-            params = [nama_file, isi_file]
+            # opsi compress=codec dan if-none-match=ETAG boleh mendahului isi file
+            options = []
+            option = isi_file.split(' ', 1)
+            while len(option) == 2 and option[0].lower().startswith(('compress=', 'if-none-match=')):
+                options.append(option[0])
+                isi_file = option[1]
+                option = isi_file.split(' ', 1)
+            params = [nama_file, isi_file] + options
+        elif string_datamasuk.upper().startswith('MUPLOAD '):
+            # isi base64 tidak berisi spasi; shlex terlalu lambat untuk payload besar
+            tokens = string_datamasuk.split()
+            c_request = tokens[0].lower()
+            params = tokens[1:]
+        elif string_datamasuk.upper().startswith('UPLOAD_PART '):
+            parts = string_datamasuk.split(' ', 3)
+            c_request = parts[0].lower()
+            params = parts[1:]
         else:
-            tokens = shlex.split(string_datamasuk)
+            try:
+                tokens = shlex.split(string_datamasuk)
+            except ValueError as e:
+                return json.dumps(dict(status='ERROR', data=f'request tidak valid: {e}'))
             if not tokens:
                 return json.dumps(dict(status='ERROR', data='request kosong'))
             c_request = tokens[0].lower()
             params = tokens[1:]
 
-        logging.warning(f"memproses request: {c_request}")
+        logging.debug("memproses request: %s", c_request)
 
+        if c_request.upper() in BINARY_COMMANDS:
+            return json.dumps(dict(status='ERROR', data='request biner harus memakai mode biner'))
+
+        if c_request not in self.file.COMMANDS:
+            return json.dumps(dict(status='ERROR', data='request tidak dikenali'))
+        handler = getattr(self.file, c_request)
         try:
-            handler = getattr(self.file, c_request)
             return json.dumps(handler(params))
-        except AttributeError:
-            return json.dumps(dict(status='ERROR', data='request tidak dikenali'))
+        except Exception as e:
+            # parameter yang tidak valid tidak boleh memutus koneksi client
+            logging.warning("request %s gagal: %s", c_request, e)
+            return json.dumps(dict(status='ERROR', data=str(e)))
+
+    def profile(self, params):
+        """PROFILE [dump [command] [limit=N] [sort=cumulative|tottime|calls]]
+        PROFILE on [command,command|all] [sample=F] [memory=1]
+        PROFILE off | PROFILE reset"""
+        positional, options = split_options(params)
+        action = positional[0].lower() if positional else 'dump'
+        try:
+            if action == 'on':
+                commands = parse_commands(positional[1]) if len(positional) > 1 else None
+                self.profiler.enable(commands, float(options.get('sample', 1)), options.get('memory') == '1')
+                return dict(status='OK', data='profiling aktif')
+            if action == 'off':
+                self.profiler.disable()
+                return dict(status='OK', data='profiling nonaktif')
+            if action == 'reset':
+                self.profiler.reset()
+                return dict(status='OK', data='statistik profiling dihapus')
+            if action == 'dump':
+                command = positional[1].lower() if len(positional) > 1 else None
+                return dict(status='OK', data=self.profiler.dump(command, int(options.get('limit', DEFAULT_LIMIT)),
+                                                                 options.get('sort', 'cumulative')))
+        except ValueError as e:
+            return dict(status='ERROR', data=str(e))
+        return dict(status='ERROR', data='PROFILE harus dump, on, off atau reset')
+
+    def proses_request(self, string_datamasuk=''):
+        """Seperti proses_string tetapi mengembalikan bytes siap kirim (termasuk
+        terminator). Response GET disimpan di cache sehingga download berulang
+        untuk file yang sama tidak perlu dibaca, di-encode dan di-serialize lagi."""
+        tokens = string_datamasuk.split()
+        if len(tokens) == 2 and tokens[0].upper() == 'GET':
+            nama_file = tokens[1]
+            st = self.file.stat_file(nama_file)
+            if st is not None:
+                cached = self.file.cache.get(nama_file, st)
+                logging.debug("memproses request: get %s (cache %s)", nama_file, 'hit' if cached else 'miss')
+                if cached is not None:
+                    return cached
+                hasil = self.file.get([nama_file])
+                data = (json.dumps(hasil) + "\r\n\r\n").encode()
+                if hasil['status'] == 'OK':
+                    self.file.cache.put(nama_file, st, data)
+                return data
+        return (self.proses_string(string_datamasuk) + "\r\n\r\n").encode()
+
+    def proses_chunks(self, string_datamasuk=''):
+        """Seperti proses_request tetapi mengembalikan iterable bytes siap kirim:
+        list berisi satu response, atau generator untuk GET file yang lebih
+        besar dari stream_min_bytes. Generator menghasilkan awal JSON, isi
+        base64 per blok lalu penutup JSON dan terminator (format sama dengan
+        response biasa), sehingga memori server tidak bergantung pada ukuran
+        file dan byte pertama terkirim sebelum seluruh file dibaca."""
+        tokens = string_datamasuk.split()
+        if len(tokens) >= 2 and tokens[0].upper() == 'GET':
+            st = self.file.stat_file(tokens[1])
+            if st is not None and st.st_size > self.stream_min_bytes:
+                logging.debug("memproses request: get %s (streaming)", tokens[1])
+                hasil, blocks = self.file.get_chunks(shlex.split(string_datamasuk)[1:])
+                if blocks is not None:
+                    return self.stream_response(hasil, blocks)
+                return [(json.dumps(hasil) + "\r\n\r\n").encode()]
+        return [self.proses_request(string_datamasuk)]
+
+    def stream_response(self, hasil, blocks):
+        # data_file selalu field terakhir; isi base64 tidak perlu di-escape
+        yield (json.dumps(hasil)[:-1] + ', "data_file": "').encode()
+        yield from blocks
+        yield b'"}\r\n\r\n'
+
+    def proses_upload(self, nama_file, tmp_path, error=None, decoder=None, if_none_match=None):
+        """Selesaikan UPLOAD streaming yang isinya sudah ditulis ke tmp_path.
+        decoder = DecompressingWriter jika upload memakai opsi compress,
+        if_none_match = nilai opsi if-none-match (lihat FileInterface.commit_temp)."""
+        logging.debug("memproses request: upload (streaming) %s", nama_file)
+        if error is not None:
+            self.file.discard_temp(tmp_path)
+            return json.dumps(dict(status='ERROR', data=error))
+        if decoder is not None:
+            self.file.compression.record(decoder.codec, decoder.raw_bytes, decoder.wire_bytes)
+        return json.dumps(self.file.commit_temp(nama_file, tmp_path, if_none_match))
+
+    def proses_binary(self, string_datamasuk, tmp_path=None):
+        """Proses request mode biner (BGET/BUPLOAD/BUPLOADPART). Untuk upload, tmp_path berisi
+        payload yang sudah diterima. Mengembalikan (hasil_json, path file balasan atau None)."""
+        tokens = string_datamasuk.split()
+        if not tokens:
+            return json.dumps(dict(status='ERROR', data='request kosong')), None
+        c_request = tokens[0].lower()
+        params = tokens[1:]
+        logging.debug("memproses request biner: %s", c_request)
+
+        if c_request == 'bupload':
+            return json.dumps(self.file.bupload(params, tmp_path)), None
+        if c_request == 'buploadpart':
+            return json.dumps(self.file.bupload_part(params, tmp_path)), None
+        if c_request == 'bget':
+            hasil, source = self.file.bget(params)
+            return json.dumps(hasil), source
+        return json.dumps(dict(status='ERROR', data='request tidak dikenali')), None
 
 if __name__ == '__main__':
     fp = FileProtocol()
@@ -53,3 +202,9 @@ if __name__ == '__main__':
     print(fp.proses_string("GET pokijan.jpg"))
     dummy_b64 = "cHJvZ2phciBrZWxhc...=="
     print(fp.proses_string(f"UPLOAD progjar_kelas_c.txt {dummy_b64}"))
+    # PROFILE on all juga mencakup command profile; dump dan reset di dalam
+    # request yang sedang diprofil tidak boleh deadlock
+    for request in ('PROFILE on all', 'PROFILE dump', 'PROFILE reset', 'PROFILE off'):
+        hasil = json.loads(fp.profiler.call('profile', fp.proses_string, request))
+        assert hasil['status'] == 'OK', hasil
+    print("PROFILE on all/dump/reset: OK")
@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import sys
+from admission import AdmissionControl, UploadRejected
+from file_protocol import FileProtocol, REQUEST_TYPES
+from file_transfer import (is_binary_command, upload_writer, finish_upload, LENGTH_HEADER,
+                           UPLOAD_PREFIX, UPLOAD_OPTIONS, PAYLOAD_COMMANDS)
+from framing import AsyncFrameReader, DEFAULT_RECV_SIZE, TERMINATOR
+from metrics import Metrics, MeteredStreamReader, accept_queue_depth
+from request_log import RequestLog, describe, setup_logging
+from scheduler import classify, FAST, DEFAULT_FAST_WORKERS
+
+class ServerAsync:
+    """Server berbasis asyncio: semua koneksi dilayani satu event loop,
+    sedangkan I/O disk dan kerja base64/JSON dijalankan di thread pool.
+    Request metadata/kecil (scheduler.classify) memakai thread pool lane cepat
+    tersendiri agar tidak antre di belakang blok-blok transfer besar."""
+
+    def __init__(self, ip='0.0.0.0', port=6668, worker_pool=5, recv_size=DEFAULT_RECV_SIZE,
+                 fast_workers=DEFAULT_FAST_WORKERS):
+        self.ipinfo = (ip, port)
+        self.worker_pool = worker_pool
+        self.recv_size = recv_size
+        self.executor = ThreadPoolExecutor(max_workers=worker_pool)
+        self.fast_executor = ThreadPoolExecutor(max_workers=fast_workers)
+        self.metrics = Metrics(REQUEST_TYPES)
+        self.admission = AdmissionControl(self.metrics, worker_pool)
+        self.fp = FileProtocol(server_ref=self)
+
+    def get_worker_stats(self):
+        scalars, _ = self.metrics.totals()
+        return scalars['connections_ok'], scalars['connections_failed']
+
+    async def run_blocking(self, func, *args):
+        loop = asyncio.get_running_loop()
+        self.metrics.inc('executor_inflight')
+        try:
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.metrics.inc('executor_inflight', -1)
+
+    async def run_fast(self, func, *args):
+        """Seperti run_blocking tetapi di thread pool lane cepat"""
+        return await asyncio.get_running_loop().run_in_executor(self.fast_executor, func, *args)
+
+    def write(self, writer, data):
+        writer.write(data)
+        self.metrics.inc('bytes_out', len(data))
+
+    async def send_response(self, writer, hasil):
+        self.write(writer, (hasil + "\r\n\r\n").encode())
+        await writer.drain()
+
+    async def receive_upload(self, reader, writer, nama_file, options):
+        """Mengembalikan jumlah byte base64 yang diterima"""
+        self.admission.reserve_upload()
+        received = 0
+        try:
+            f, tmp_path = await self.run_blocking(self.fp.file.open_temp)
+            try:
+                b64_writer, decoder = upload_writer(f, options.get('compress'))
+                async for block in reader.iter_until_terminator():
+                    received += len(block)
+                    self.admission.uploading(len(block))
+                    await self.run_blocking(b64_writer.write, block)
+                error = await self.run_blocking(finish_upload, b64_writer, decoder)
+            except Exception:
+                await self.run_blocking(self.fp.file.discard_temp, tmp_path)
+                raise
+            finally:
+                await self.run_blocking(f.close)
+        finally:
+            self.admission.release_upload(received)
+        hasil = await self.run_blocking(self.fp.profiler.call, 'upload', self.fp.proses_upload,
+                                        nama_file, tmp_path, error, decoder, options.get('if-none-match'))
+        await self.send_response(writer, hasil)
+        return received
+
+    async def handle_binary(self, reader, writer, data_str, run=None):
+        """Mengembalikan jumlah byte payload yang diterima. run: run_blocking
+        atau run_fast, sesuai lane request ini"""
+        run = run or self.run_blocking
+        tmp_path = None
+        length = 0
+        if data_str.split(' ', 1)[0].strip().upper() in PAYLOAD_COMMANDS:
+            # payload selalu dibaca agar stream tetap sinkron walau request gagal
+            (length,) = LENGTH_HEADER.unpack(await reader.read_exact(LENGTH_HEADER.size))
+            self.admission.reserve_upload(length)
+            try:
+                f, tmp_path = await run(self.fp.file.open_temp)
+                try:
+                    async for block in reader.iter_exact(length):
+                        await run(f.write, block)
+                except Exception:
+                    await run(self.fp.file.discard_temp, tmp_path)
+                    raise
+                finally:
+                    await run(f.close)
+            finally:
+                self.admission.release_upload(length)
+        command = data_str.split(' ', 1)[0].strip().lower()
+        hasil, source = await run(self.fp.profiler.call, command, self.fp.proses_binary, data_str, tmp_path)
+        await self.send_response(writer, hasil)
+        if source is not None:
+            await self.send_file(writer, *source)
+        return length
+
+    async def send_file(self, writer, path, offset=0, length=None):
+        f = await self.run_blocking(open, path, 'rb')
+        try:
+            size = os.fstat(f.fileno()).st_size
+            length = max(0, size - offset) if length is None else max(0, min(length, size - offset))
+            self.write(writer, LENGTH_HEADER.pack(length))
+            await writer.drain()
+            if length:
+                loop = asyncio.get_running_loop()
+                sent = await loop.sendfile(writer.transport, f, offset, length)
+                self.metrics.inc('bytes_out', sent)
+                if sent != length:
+                    raise ConnectionError('file berubah saat dikirim')
+        finally:
+            await self.run_blocking(f.close)
+
+    async def send_chunks(self, writer, chunks, run):
+        """Kirim hasil proses_chunks; blok response streaming dibaca dari disk
+        di executor satu per satu, diselingi drain agar buffer tulis tidak
+        menumpuk"""
+        if isinstance(chunks, list):
+            for chunk in chunks:
+                self.write(writer, chunk)
+            await writer.drain()
+            return
+        while True:
+            chunk = await run(next, chunks, None)
+            if chunk is None:
+                return
+            self.write(writer, chunk)
+            await writer.drain()
+
+    async def handle_client(self, stream_reader, writer):
+        addr = writer.get_extra_info('peername')
+        self.metrics.inc('connections_total')
+        # semua koneksi aktif bersamaan di event loop; yang dianggap antre adalah
+        # pekerjaan executor yang belum kebagian thread
+        queued = max(0, self.metrics.total('executor_inflight') - self.worker_pool)
+        reason = self.admission.check_connection(queued)
+        if reason is not None:
+            self.write(writer, self.admission.rejection(addr, reason, queued))
+            writer.close()
+            return
+        logging.warning(f"Connection dari {addr}")
+        self.metrics.inc('active_connections')
+        start = time.perf_counter()
+        reader = AsyncFrameReader(MeteredStreamReader(stream_reader, self.metrics), self.recv_size)
+        log = RequestLog(addr, self.metrics)
+        try:
+            while True:
+                header = reader.take_upload_header(UPLOAD_PREFIX, UPLOAD_OPTIONS)
+                if header is not None:
+                    with log.request('upload', header[0]) as record:
+                        record.size = await self.receive_upload(reader, writer, *header)
+                    continue
+                raw_msg = reader.next_frame()
+                if raw_msg is None:
+                    if not await reader.fill():
+                        break
+                    continue
+                data_str = raw_msg.decode()
+                command, name = describe(data_str)
+                # header biner berikutnya (panjang payload) ikut menentukan lane
+                head = raw_msg + TERMINATOR + reader.peek(LENGTH_HEADER.size)
+                run = self.run_blocking
+                if classify(head, self.fp.file.index) == FAST:
+                    self.metrics.inc('requests_fast')
+                    run = self.run_fast
+                with log.request(command, name, len(raw_msg)) as record:
+                    if is_binary_command(data_str):
+                        record.size += await self.handle_binary(reader, writer, data_str, run)
+                    else:
+                        # hanya kerja di executor yang diprofil, bukan I/O di event loop
+                        await self.send_chunks(writer, await run(self.fp.profiler.call, command,
+                                                                 self.fp.proses_chunks, data_str), run)
+            self.metrics.inc('connections_ok')
+        except UploadRejected as e:
+            self.write(writer, self.admission.busy_response(str(e)))
+            await writer.drain()
+            self.metrics.inc('connections_ok')
+        except Exception as e:
+            logging.error(f"error saat proses client {addr}: {e}")
+            self.metrics.inc('connections_failed')
+        finally:
+            self.admission.finished(time.perf_counter() - start)
+            self.metrics.inc('active_connections', -1)
+            writer.close()
+
+    async def start(self):
+        server = await asyncio.start_server(self.handle_client, *self.ipinfo,
+                                            reuse_address=True, backlog=1024)
+        self.metrics.gauge_source('accept_queue',
+                                  lambda: sum(accept_queue_depth(sock) or 0 for sock in server.sockets))
+        logging.warning(f"ServerAsync berjalan di {self.ipinfo} dengan pool {self.worker_pool}")
+        async with server:
+            await server.serve_forever()
+
+def main():
+    setup_logging(level=logging.WARNING)
+    worker_pool = 5
+    port = 6668
+    if len(sys.argv) > 1:
+        worker_pool = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        port = int(sys.argv[2])
+    server = ServerAsync(port=port, worker_pool=worker_pool)
+    asyncio.run(server.start())
+
+if __name__ == '__main__':
+    main()
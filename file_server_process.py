@@ -1,82 +1,133 @@
+import argparse
+import os
 import socket
 import logging
-from concurrent.futures import ProcessPoolExecutor
-import threading
+import multiprocessing
+import shutil
+import signal
+import tempfile
+from multiprocessing.connection import wait
 import sys
-from file_protocol import FileProtocol
+from admission import AdmissionControl
+from file_protocol import FileProtocol, REQUEST_TYPES
+from framing import DEFAULT_RECV_SIZE
+from metrics import Metrics, accept_queue_depth
+from request_log import setup_logging, reinit_after_fork
+from scheduler import RequestScheduler
+
+# thread worker per proses untuk mode hybrid bila --threads tidak diberikan
+DEFAULT_HYBRID_THREADS = int(os.environ.get('FILE_HYBRID_THREADS', 8))
 
 class ServerProcess:
-    def __init__(self, ip='0.0.0.0', port=6667, worker_pool=5):
+    """Server pre-fork: worker_pool proses anak masing-masing menjalankan
+    loop accept dan penjadwal request sendiri (scheduler.RequestScheduler),
+    sehingga tidak ada pickling per koneksi.
+
+    Setiap proses melayani transfer besar dengan `threads` thread (mode
+    process: 1; mode hybrid: beberapa). Jumlah proses menentukan paralelisme
+    kerja CPU (base64/JSON tidak terhalang GIL proses lain), jumlah thread
+    menentukan berapa transfer yang menunggu disk/jaringan sekaligus.
+
+    Dengan SO_REUSEPORT setiap proses membuka listener sendiri dan kernel
+    membagi koneksi; tanpa SO_REUSEPORT semua proses memakai listener yang
+    dibuat induk sebelum fork."""
+
+    def __init__(self, ip='0.0.0.0', port=6667, worker_pool=5, threads=1, recv_size=DEFAULT_RECV_SIZE,
+                 reuse_port=hasattr(socket, 'SO_REUSEPORT')):
         self.ipinfo = (ip, port)
         self.worker_pool = worker_pool
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.lock = threading.Lock()
-        self.worker_results = []
+        self.threads = threads
+        self.recv_size = recv_size
+        self.reuse_port = reuse_port
+        self.sock = None
+        # metrics di shared memory, satu slot per worker yang hanya ditulis
+        # oleh prosesnya sendiri; STATUS dari worker mana pun menjumlahkan semuanya
+        self.metrics = Metrics(REQUEST_TYPES, slots=worker_pool)
+        # antrean request dihitung per proses, masing-masing dengan `threads` worker bulk
+        self.admission = AdmissionControl(self.metrics, workers=threads)
         self.fp = FileProtocol(server_ref=self)
+        # PROFILE on/off/reset berlaku di semua worker dan dump menggabungkan statistiknya
+        self.fp.profiler.share(tempfile.mkdtemp(prefix='fileserver-profile-'))
 
     def get_worker_stats(self):
-        with self.lock:
-            total = len(self.worker_results)
-            sukses = sum(1 for r in self.worker_results if r)
-            gagal = total - sukses
-        return sukses, gagal
+        scalars, _ = self.metrics.totals()
+        return scalars['connections_ok'], scalars['connections_failed']
 
-    def handle_client(self, conn, addr):
-        buffer = b''
-        try:
-            while True:
-                chunk = conn.recv(4096)
-                if not chunk:
-                    break
-                buffer += chunk
-                while b'\r\n\r\n' in buffer:
-                    idx = buffer.index(b'\r\n\r\n')
-                    raw_msg = buffer[:idx]
-                    buffer = buffer[idx+4:]
-                    data_str = raw_msg.decode()
-                    logging.warning(f"string diproses: {data_str}")
-                    if data_str.strip().upper() == 'STATUS':
-                        hasil = self.fp.proses_string('STATUS')
-                    else:
-                        hasil = self.fp.proses_string(data_str)
-                    hasil = hasil + "\r\n\r\n"
-                    conn.sendall(hasil.encode())
-            return True
-        except Exception as e:
-            logging.error(f"error saat proses client {addr}: {e}")
-            return False
-        finally:
-            conn.close()
+    def create_listener(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(self.ipinfo)
+        sock.listen(100)
+        return sock
+
+    def worker_loop(self, worker_id, sock):
+        """Poller dan lane request di dalam proses anak"""
+        self.metrics.use_slot(worker_id)
+        reinit_after_fork()
+        if sock is None:
+            sock = self.create_listener()
+        logging.warning(f"Worker {worker_id} (pid {multiprocessing.current_process().pid}) siap")
+        # `threads` thread lane bulk per proses, ditambah lane cepat sehingga request
+        # kecil tidak menunggu transfer besar yang sedang dilayani proses ini
+        scheduler = RequestScheduler(sock, self.fp, self.metrics, self.admission, self.recv_size,
+                                     bulk_workers=self.threads, report_accept_queue=self.reuse_port)
+        scheduler.serve_forever()
+
+    def spawn_worker(self, worker_id):
+        proc = multiprocessing.Process(target=self.worker_loop, args=(worker_id, self.sock), daemon=True)
+        proc.start()
+        return proc
 
     def start(self):
-        self.sock.bind(self.ipinfo)
-        self.sock.listen(100)
-        logging.warning(f"ServerProcess berjalan di {self.ipinfo} dengan pool {self.worker_pool}")
+        # SIGTERM diubah menjadi SystemExit agar proses anak ikut dihentikan
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        if not self.reuse_port:
+            self.sock = self.create_listener()
+            self.metrics.gauge_source('accept_queue', lambda: accept_queue_depth(self.sock))
+        logging.warning(f"ServerProcess berjalan di {self.ipinfo} dengan {self.worker_pool} proses"
+                        f" x {self.threads} thread ({'SO_REUSEPORT' if self.reuse_port else 'listener bersama'})")
 
-        with ProcessPoolExecutor(max_workers=self.worker_pool) as executor:
-            futures = set()
+        workers = {i: self.spawn_worker(i) for i in range(self.worker_pool)}
+        try:
             while True:
-                conn, addr = self.sock.accept()
-                logging.warning(f"Connection dari {addr}")
-                future = executor.submit(self.handle_client, conn, addr)
-                futures.add(future)
-                done = {f for f in futures if f.done()}
-                for f in done:
-                    try:
-                        sukses = f.result()
-                    except Exception:
-                        sukses = False
-                    with self.lock:
-                        self.worker_results.append(sukses)
-                    futures.remove(f)
+                # jalankan ulang worker yang mati agar jumlah proses tetap
+                wait([p.sentinel for p in workers.values()])
+                for worker_id, proc in list(workers.items()):
+                    if not proc.is_alive():
+                        logging.error(f"Worker {worker_id} berhenti (exit {proc.exitcode}), dijalankan ulang")
+                        workers[worker_id] = self.spawn_worker(worker_id)
+        finally:
+            for proc in workers.values():
+                proc.terminate()
+            shutil.rmtree(self.fp.profiler.folder, ignore_errors=True)
+
+def parse_args():
+    p = argparse.ArgumentParser(description='File server pre-fork (process / hybrid process x thread)')
+    p.add_argument('worker_pool', nargs='?', type=int,
+                   help='jumlah proses worker (default 5, mode hybrid: jumlah CPU)')
+    p.add_argument('port', nargs='?', type=int, default=6667, help='port server (default 6667)')
+    p.add_argument('--mode', choices=('process', 'hybrid'), default='process',
+                   help='process: satu thread transfer per proses; hybrid: --threads thread per proses')
+    p.add_argument('--procs', type=int, help='jumlah proses (sama dengan worker_pool)')
+    p.add_argument('--port', type=int, dest='port_option', help='port server (sama dengan port)')
+    p.add_argument('--threads', type=int,
+                   help=f'thread transfer per proses untuk mode hybrid (default {DEFAULT_HYBRID_THREADS})')
+    args = p.parse_args()
+    if args.mode == 'process' and args.threads is not None:
+        p.error('--threads hanya untuk --mode hybrid')
+    return args
 
 def main():
-    logging.basicConfig(level=logging.WARNING)
-    worker_pool = 5
-    if len(sys.argv) > 1:
-        worker_pool = int(sys.argv[1])
-    server = ServerProcess(worker_pool=worker_pool)
+    setup_logging(level=logging.WARNING)
+    args = parse_args()
+    procs = args.procs or args.worker_pool
+    threads = 1
+    if args.mode == 'hybrid':
+        procs = procs or os.cpu_count() or 1
+        threads = args.threads or DEFAULT_HYBRID_THREADS
+    server = ServerProcess(port=args.port_option or args.port, worker_pool=procs or 5, threads=threads)
     server.start()
 
 if __name__ == '__main__':
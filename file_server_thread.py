@@ -1,82 +1,50 @@
 import socket
 import logging
-import threading
-from concurrent.futures import ThreadPoolExecutor
 import sys
-from file_protocol import FileProtocol
+from admission import AdmissionControl
+from file_protocol import FileProtocol, REQUEST_TYPES
+from framing import DEFAULT_RECV_SIZE
+from metrics import Metrics, accept_queue_depth
+from request_log import setup_logging
+from scheduler import RequestScheduler
 
 class ServerThread:
-    def __init__(self, ip='0.0.0.0', port=6666, worker_pool=5):
+    """Server berbasis thread: koneksi menganggur ditunggu satu poller dan
+    setiap request dilayani lane cepat (metadata/request kecil) atau salah
+    satu dari worker_pool thread lane bulk (lihat scheduler.RequestScheduler)."""
+
+    def __init__(self, ip='0.0.0.0', port=6666, worker_pool=5, recv_size=DEFAULT_RECV_SIZE):
         self.ipinfo = (ip, port)
         self.worker_pool = worker_pool
+        self.recv_size = recv_size
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.lock = threading.Lock()
-        self.worker_results = []
+        self.metrics = Metrics(REQUEST_TYPES)
+        self.metrics.gauge_source('accept_queue', lambda: accept_queue_depth(self.sock))
+        self.admission = AdmissionControl(self.metrics, worker_pool)
         self.fp = FileProtocol(server_ref=self)
 
     def get_worker_stats(self):
-        with self.lock:
-            total = len(self.worker_results)
-            sukses = sum(1 for r in self.worker_results if r)
-            gagal = total - sukses
-        return sukses, gagal
-
-    def handle_client(self, conn, addr):
-        buffer = b''
-        try:
-            while True:
-                chunk = conn.recv(4096)
-                if not chunk:
-                    break
-                buffer += chunk
-                while b'\r\n\r\n' in buffer:
-                    idx = buffer.index(b'\r\n\r\n')
-                    raw_msg = buffer[:idx]
-                    buffer = buffer[idx+4:]
-                    data_str = raw_msg.decode()
-                    logging.warning(f"string diproses: {data_str}")
-                    if data_str.strip().upper() == 'STATUS':
-                        hasil = self.fp.proses_string('STATUS')
-                    else:
-                        hasil = self.fp.proses_string(data_str)
-                    hasil = hasil + "\r\n\r\n"
-                    conn.sendall(hasil.encode())
-            return True
-        except Exception as e:
-            logging.error(f"error saat proses client {addr}: {e}")
-            return False
-        finally:
-            conn.close()
+        scalars, _ = self.metrics.totals()
+        return scalars['connections_ok'], scalars['connections_failed']
 
     def start(self):
         self.sock.bind(self.ipinfo)
         self.sock.listen(100)
         logging.warning(f"ServerThread berjalan di {self.ipinfo} dengan pool {self.worker_pool}")
-
-        with ThreadPoolExecutor(max_workers=self.worker_pool) as executor:
-            futures = set()
-            while True:
-                conn, addr = self.sock.accept()
-                logging.warning(f"Connection dari {addr}")
-                future = executor.submit(self.handle_client, conn, addr)
-                futures.add(future)
-                done = {f for f in futures if f.done()}
-                for f in done:
-                    try:
-                        sukses = f.result()
-                    except Exception:
-                        sukses = False
-                    with self.lock:
-                        self.worker_results.append(sukses)
-                    futures.remove(f)
+        scheduler = RequestScheduler(self.sock, self.fp, self.metrics, self.admission,
+                                     self.recv_size, self.worker_pool)
+        scheduler.serve_forever()
 
 def main():
-    logging.basicConfig(level=logging.WARNING)
+    setup_logging(level=logging.WARNING)
     worker_pool = 5
+    port = 6666
     if len(sys.argv) > 1:
         worker_pool = int(sys.argv[1])
-    server = ServerThread(worker_pool=worker_pool)
+    if len(sys.argv) > 2:
+        port = int(sys.argv[2])
+    server = ServerThread(port=port, worker_pool=worker_pool)
     server.start()
 
 if __name__ == '__main__':
@@ -0,0 +1,286 @@
+import base64
+import mmap
+import os
+import socket
+import struct
+
+from admission import UploadRejected
+from compression import parse_codec, DecompressingWriter
+from framing import FrameReader, DEFAULT_RECV_SIZE
+from metrics import MeteredSocket
+from request_log import RequestLog, describe
+
+# Mode biner: header request/response tetap berupa string + "\r\n\r\n",
+# tetapi isi file dikirim mentah dengan awalan panjang 8 byte (big-endian).
+BINARY_COMMANDS = ('BGET', 'BUPLOAD', 'BUPLOADPART')
+# command biner yang diikuti payload dari client
+PAYLOAD_COMMANDS = ('BUPLOAD', 'BUPLOADPART')
+LENGTH_HEADER = struct.Struct('!Q')
+CHUNK_SIZE = 256 * 1024
+UPLOAD_PREFIX = b'UPLOAD '
+# opsi UPLOAD teks yang boleh mendahului isi base64
+UPLOAD_OPTIONS = (b'COMPRESS=', b'IF-NONE-MATCH=')
+
+
+def is_binary_command(data_str):
+    """True jika request memakai mode biner (BGET/BUPLOAD/BUPLOADPART)"""
+    return data_str.split(' ', 1)[0].strip().upper() in BINARY_COMMANDS
+
+
+def send_payload(conn, data):
+    """Kirim payload biner: header panjang lalu isi mentah"""
+    conn.sendall(LENGTH_HEADER.pack(len(data)))
+    conn.sendall(data)
+
+
+def send_file(conn, path, offset=0, length=None):
+    """Kirim isi file (atau rentang offset/length) sebagai payload biner
+    langsung dari disk. Memakai sendfile (zero-copy) bila tersedia, selain itu
+    mmap, sehingga memori server tidak bergantung pada ukuran file."""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        length = max(0, size - offset) if length is None else max(0, min(length, size - offset))
+        conn.sendall(LENGTH_HEADER.pack(length))
+        if length == 0:
+            return
+        if hasattr(os, 'sendfile'):
+            sent = conn.sendfile(f, offset, length)
+        else:
+            sent = send_mmap(conn, f, offset, length)
+        if sent != length:
+            raise ConnectionError('file berubah saat dikirim')
+
+
+def send_mmap(conn, f, offset, length):
+    """Kirim rentang file lewat memory map per blok tanpa menyalin seluruh isi"""
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm)
+        try:
+            for start in range(offset, offset + length, CHUNK_SIZE):
+                conn.sendall(view[start:min(start + CHUNK_SIZE, offset + length)])
+        finally:
+            view.release()
+    return length
+
+
+def recv_payload(reader):
+    """Terima payload biner dari FrameReader ke memori"""
+    (length,) = LENGTH_HEADER.unpack(reader.read_exact(LENGTH_HEADER.size))
+    return reader.read_exact(length)
+
+
+def recv_payload_into(reader, f):
+    """Terima payload biner dari FrameReader langsung ke file f per blok.
+    Mengembalikan panjang payload."""
+    (length,) = LENGTH_HEADER.unpack(reader.read_exact(LENGTH_HEADER.size))
+    reader.read_into_file(f, length)
+    return length
+
+
+def base64_blocks(blocks):
+    """Encode base64 per blok tanpa menampung seluruh data; sisa yang bukan
+    kelipatan 3 byte dibawa ke blok berikutnya sehingga hasilnya sama dengan
+    encode sekaligus"""
+    carry = b''
+    for block in blocks:
+        data = carry + block
+        cut = len(data) // 3 * 3
+        carry = data[cut:]
+        if cut:
+            yield base64.b64encode(data[:cut])
+    if carry:
+        yield base64.b64encode(carry)
+
+
+def handle_binary_request(conn, fp, reader, data_str, admission=None):
+    """Layani satu request mode biner di sisi server.
+    Mengembalikan jumlah byte payload yang diterima."""
+    command = data_str.split(' ', 1)[0].strip().upper()
+    tmp_path = None
+    length = 0
+    if command in PAYLOAD_COMMANDS:
+        # payload selalu dibaca agar stream tetap sinkron walau request gagal
+        (length,) = LENGTH_HEADER.unpack(reader.read_exact(LENGTH_HEADER.size))
+        if admission is not None:
+            admission.reserve_upload(length)
+        try:
+            f, tmp_path = fp.file.open_temp()
+            try:
+                with f:
+                    reader.read_into_file(f, length)
+            except Exception:
+                fp.file.discard_temp(tmp_path)
+                raise
+        finally:
+            if admission is not None:
+                admission.release_upload(length)
+    hasil, source = fp.proses_binary(data_str, tmp_path)
+    conn.sendall((hasil + "\r\n\r\n").encode())
+    if source is not None:
+        send_file(conn, *source)
+    return length
+
+
+class Base64Writer:
+    """Dekode isi base64 per blok dan tulis ke file. Blok boleh terpotong di
+    sembarang posisi; kesalahan dekode dicatat tanpa menghentikan penerimaan
+    agar stream tetap sinkron."""
+
+    def __init__(self, f, error=None):
+        self.f = f
+        self.carry = b''
+        self.error = error
+
+    def write(self, block):
+        if self.error is not None:
+            return
+        data = self.carry + block
+        # dekode hanya kelipatan 4 karakter base64
+        cut = len(data) // 4 * 4
+        self.carry = data[cut:]
+        try:
+            self.f.write(base64.b64decode(data[:cut]))
+        except Exception as e:
+            self.error = str(e)
+
+    def finish(self):
+        if self.error is None and self.carry:
+            try:
+                self.f.write(base64.b64decode(self.carry))
+            except Exception as e:
+                self.error = str(e)
+        return self.error
+
+
+def upload_writer(f, codec=None):
+    """Base64Writer untuk isi UPLOAD streaming ke file f. Jika codec (opsi
+    compress) diberikan, hasil dekode base64 didekompresi dulu.
+    Mengembalikan (writer, decoder atau None)."""
+    if codec is None:
+        return Base64Writer(f), None
+    try:
+        codec, _ = parse_codec(codec)
+    except ValueError as e:
+        # isi tetap dibaca sampai terminator agar stream tetap sinkron
+        return Base64Writer(f, error=str(e)), None
+    decoder = DecompressingWriter(f, codec)
+    return Base64Writer(decoder), decoder
+
+
+def finish_upload(writer, decoder):
+    """Pesan error UPLOAD streaming setelah terminator, atau None"""
+    error = writer.finish()
+    if error is None and decoder is not None:
+        error = decoder.finish()
+    return error
+
+
+def receive_upload(conn, fp, reader, nama_file, options=None, admission=None):
+    """Terima isi UPLOAD teks secara streaming: base64 didekode (dan
+    didekompresi bila ada opsi compress) lalu ditulis ke file sementara per
+    blok sampai terminator, lalu kirim balasan. options = opsi header
+    (lihat UPLOAD_OPTIONS).
+    Memori per koneksi dibatasi ukuran blok penerimaan.
+    Mengembalikan jumlah byte base64 yang diterima."""
+    if admission is not None:
+        # ukuran upload teks belum diketahui; byte dicatat per blok
+        admission.reserve_upload()
+    options = options or {}
+    received = 0
+    try:
+        f, tmp_path = fp.file.open_temp()
+        try:
+            with f:
+                writer, decoder = upload_writer(f, options.get('compress'))
+                for block in reader.iter_until_terminator():
+                    received += len(block)
+                    if admission is not None:
+                        admission.uploading(len(block))
+                    writer.write(block)
+                error = finish_upload(writer, decoder)
+        except Exception:
+            fp.file.discard_temp(tmp_path)
+            raise
+    finally:
+        if admission is not None:
+            admission.release_upload(received)
+    hasil = fp.proses_upload(nama_file, tmp_path, error, decoder, options.get('if-none-match'))
+    conn.sendall((hasil + "\r\n\r\n").encode())
+    return received
+
+
+class ServerConnection:
+    """Satu koneksi client di server thread/process. Request dilayani satu per
+    satu lewat serve_one sehingga di antara request koneksi bisa dikembalikan
+    ke poller (lihat scheduler.RequestScheduler). Setiap request dicatat
+    ringkas lewat RequestLog (tanpa payload); jika metrics diberikan, byte
+    masuk/keluar dan latensi setiap request juga dicatat. Request yang dipilih
+    fp.profiler diprofil utuh, termasuk pengiriman ke socket. Jika admission
+    diberikan, upload yang melewati batas byte upload dijawab BUSY lalu
+    koneksi diakhiri."""
+
+    def __init__(self, conn, fp, recv_size=DEFAULT_RECV_SIZE, metrics=None, peer=None, admission=None):
+        self.sock = conn
+        self.conn = MeteredSocket(conn, metrics) if metrics is not None else conn
+        self.fp = fp
+        self.peer = peer
+        self.admission = admission
+        self.log = RequestLog(peer, metrics)
+        self.reader = FrameReader(self.conn, recv_size)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def head(self, n):
+        """Sampai n byte awal request berikutnya tanpa mengonsumsinya: data yang
+        sudah ada di buffer lalu data di socket (MSG_PEEK). Mengembalikan b''
+        jika client sudah menutup koneksi."""
+        head = self.reader.peek(n)
+        if len(head) < n:
+            # tanpa MSG_DONTWAIT, socket hanya diintip saat poller melaporkannya siap dibaca
+            flags = getattr(socket, 'MSG_DONTWAIT', 0)
+            if flags or not head:
+                try:
+                    head += self.sock.recv(n - len(head), socket.MSG_PEEK | flags)
+                except BlockingIOError:
+                    pass
+        return head
+
+    def serve_one(self):
+        """Layani satu request. Mengembalikan False jika koneksi sudah selesai
+        (ditutup client, atau diakhiri setelah upload dijawab BUSY)."""
+        fp, reader, log = self.fp, self.reader, self.log
+        try:
+            while True:
+                header = reader.take_upload_header(UPLOAD_PREFIX, UPLOAD_OPTIONS)
+                if header is not None:
+                    with log.request('upload', header[0]) as record, fp.profiler.profile('upload'):
+                        record.size = receive_upload(self.conn, fp, reader, *header, admission=self.admission)
+                    return True
+                raw_msg = reader.next_frame()
+                if raw_msg is None:
+                    if not reader.fill():
+                        return False
+                    continue
+                data_str = raw_msg.decode()
+                command, name = describe(data_str)
+                with log.request(command, name, len(raw_msg)) as record, fp.profiler.profile(command):
+                    if is_binary_command(data_str):
+                        record.size += handle_binary_request(self.conn, fp, reader, data_str, self.admission)
+                    else:
+                        for chunk in fp.proses_chunks(data_str):
+                            self.conn.sendall(chunk)
+                return True
+        except UploadRejected as e:
+            self.conn.sendall(self.admission.busy_response(str(e)))
+            return False
+
+    def close(self):
+        self.sock.close()
+
+
+def serve_connection(conn, fp, recv_size=DEFAULT_RECV_SIZE, metrics=None, peer=None, admission=None):
+    """Layani semua request pada satu koneksi sampai client menutupnya"""
+    connection = ServerConnection(conn, fp, recv_size, metrics, peer, admission)
+    while connection.serve_one():
+        pass
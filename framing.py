@@ -0,0 +1,257 @@
+TERMINATOR = b'\r\n\r\n'
+DEFAULT_RECV_SIZE = 64 * 1024
+
+
+class FrameBuffer:
+    """Buffer penerimaan untuk pesan berbatas "\r\n\r\n".
+
+    Data ditampung dalam satu bytearray yang bisa tumbuh, dan pencarian
+    terminator dilanjutkan dari offset terakhir sehingga setiap byte hanya
+    diperiksa sekali (linear terhadap ukuran pesan). Kelas ini tidak melakukan
+    I/O; lihat FrameReader (socket) dan AsyncFrameReader (asyncio)."""
+
+    def __init__(self, recv_size=DEFAULT_RECV_SIZE):
+        self.recv_size = recv_size
+        self.buf = bytearray(recv_size)
+        self.start = 0  # awal data yang belum dikonsumsi
+        self.end = 0    # akhir data yang sudah diterima
+        self.scan = 0   # posisi lanjutan pencarian terminator
+
+    def buffered(self):
+        """Jumlah byte yang sudah diterima tetapi belum dikonsumsi"""
+        return self.end - self.start
+
+    def reserve(self):
+        """Siapkan ruang kosong minimal recv_size byte setelah self.end"""
+        if self.start == self.end:
+            if len(self.buf) > 4 * self.recv_size:
+                self.buf = bytearray(self.recv_size)
+            self.start = self.end = self.scan = 0
+        elif len(self.buf) - self.end < self.recv_size and self.start > 0:
+            del self.buf[:self.start]
+            self.end -= self.start
+            self.scan -= self.start
+            self.start = 0
+        free = len(self.buf) - self.end
+        if free < self.recv_size:
+            self.buf.extend(bytes(self.recv_size - free))
+
+    def feed(self, data):
+        """Tambahkan data yang diterima dari sumber lain (mis. asyncio)"""
+        self.reserve()
+        if len(data) > len(self.buf) - self.end:
+            self.buf.extend(bytes(len(data) - (len(self.buf) - self.end)))
+        self.buf[self.end:self.end + len(data)] = data
+        self.end += len(data)
+
+    def next_frame(self):
+        """Ambil satu pesan lengkap dari data yang sudah diterima.
+        Mengembalikan None jika terminator belum ada."""
+        idx = self.buf.find(TERMINATOR, max(self.scan, self.start), self.end)
+        if idx < 0:
+            self.scan = max(self.start, self.end - len(TERMINATOR) + 1)
+            return None
+        frame = bytes(self.buf[self.start:idx])
+        self.start = self.scan = idx + len(TERMINATOR)
+        return frame
+
+    def take_upload_header(self, prefix, options):
+        """Jika data yang belum dikonsumsi diawali `prefix nama ` (prefix tanpa
+        memperhatikan huruf besar/kecil), opsional diikuti token `opsi...`
+        berakhiran spasi untuk opsi di options (mis. b'COMPRESS='), konsumsi
+        header tersebut dan kembalikan (nama, {opsi: nilai}) dengan nama opsi
+        huruf kecil tanpa '='. Mengembalikan None jika bukan header seperti
+        itu atau header belum lengkap diterima."""
+        n = len(prefix)
+        if self.end - self.start < n or self.buf[self.start:self.start + n].upper() != prefix:
+            return None
+        sep = self.buf.find(b' ', self.start + n, self.end)
+        if sep < 0 or self.buf.find(TERMINATOR, self.start, sep) >= 0:
+            return None
+        name = bytes(self.buf[self.start + n:sep]).decode()
+        pos = sep + 1
+        longest = max(len(option) for option in options)
+        values = {}
+        while True:
+            head = bytes(self.buf[pos:min(pos + longest, self.end)]).upper()
+            term = self.buf.find(TERMINATOR, pos, self.end)
+            matched = next((option for option in options if head[:len(option)] == option), None)
+            if matched is None:
+                if term < 0 and any(len(head) < len(option) and option.startswith(head) for option in options):
+                    return None  # belum bisa dibedakan antara opsi dan isi
+                break
+            opt_sep = self.buf.find(b' ', pos, self.end)
+            if opt_sep < 0 or (term >= 0 and term < opt_sep):
+                if term < 0:
+                    return None  # nilai opsi belum lengkap diterima
+                break
+            values[matched[:-1].decode().lower()] = bytes(self.buf[pos + len(matched):opt_sep]).decode()
+            pos = opt_sep + 1
+        self.start = pos
+        self.scan = max(self.scan, self.start)
+        return name, values
+
+    def take_body_block(self):
+        """Ambil bagian isi pesan yang pasti bukan terminator.
+        Mengembalikan (blok, selesai); selesai=True jika terminator sudah dikonsumsi."""
+        idx = self.buf.find(TERMINATOR, max(self.scan, self.start), self.end)
+        if idx >= 0:
+            block = bytes(self.buf[self.start:idx])
+            self.start = self.scan = idx + len(TERMINATOR)
+            return block, True
+        # sisakan byte terakhir yang mungkin merupakan awal terminator
+        safe = max(self.start, self.end - len(TERMINATOR) + 1)
+        block = bytes(self.buf[self.start:safe])
+        self.start = self.scan = safe
+        return block, False
+
+    def peek(self, n):
+        """Sampai n byte berikutnya yang sudah diterima, tanpa mengonsumsinya"""
+        return bytes(self.buf[self.start:min(self.end, self.start + n)])
+
+    def take(self, n):
+        """Ambil paling banyak n byte dari data yang sudah diterima"""
+        n = min(n, self.end - self.start)
+        data = bytes(self.buf[self.start:self.start + n])
+        self.start += n
+        self.scan = max(self.scan, self.start)
+        return data
+
+
+class FrameReader(FrameBuffer):
+    """Pembaca pesan dari socket blocking dengan recv_into"""
+
+    def __init__(self, conn, recv_size=DEFAULT_RECV_SIZE):
+        super().__init__(recv_size)
+        self.conn = conn
+
+    def fill(self):
+        """Terima data baru dari socket. Mengembalikan False jika koneksi ditutup."""
+        self.reserve()
+        with memoryview(self.buf)[self.end:self.end + self.recv_size] as view:
+            nbytes = self.conn.recv_into(view)
+        self.end += nbytes
+        return nbytes > 0
+
+    def read_frame(self):
+        """Baca satu pesan lengkap (tanpa terminator). None jika koneksi ditutup."""
+        while True:
+            frame = self.next_frame()
+            if frame is not None:
+                return frame
+            if not self.fill():
+                return None
+
+    def iter_until_terminator(self):
+        """Hasilkan isi pesan per blok sampai terminator (terminator dibuang),
+        tanpa menampung seluruh pesan di memori."""
+        while True:
+            block, done = self.take_body_block()
+            if block:
+                yield block
+            if done:
+                return
+            if not self.fill():
+                raise ConnectionError('koneksi terputus sebelum pesan selesai')
+
+    def read_until(self, marker, limit):
+        """Baca awal pesan sampai marker (marker ikut dikonsumsi) dan
+        kembalikan bagian sebelum marker; sisa pesan dibaca dengan
+        iter_until_terminator. Mengembalikan None tanpa mengonsumsi apa pun
+        jika pesan selesai atau melewati limit byte tanpa marker."""
+        while True:
+            window = min(self.end, self.start + limit)
+            idx = self.buf.find(marker, self.start, window)
+            term = self.buf.find(TERMINATOR, self.start, window)
+            if idx >= 0 and (term < 0 or idx < term):
+                head = bytes(self.buf[self.start:idx])
+                self.start = idx + len(marker)
+                self.scan = max(self.scan, self.start)
+                return head
+            if term >= 0 or self.end - self.start >= limit:
+                return None
+            if not self.fill():
+                raise ConnectionError('koneksi terputus sebelum pesan selesai')
+
+    def read_exact(self, n):
+        """Baca tepat n byte"""
+        while self.buffered() < n:
+            if not self.fill():
+                raise ConnectionError('koneksi terputus sebelum payload lengkap')
+        return self.take(n)
+
+    def iter_exact(self, n):
+        """Hasilkan tepat n byte per blok tanpa menampung semuanya di memori"""
+        remaining = n
+        while remaining:
+            if self.start == self.end and not self.fill():
+                raise ConnectionError('koneksi terputus sebelum payload lengkap')
+            block = self.take(remaining)
+            remaining -= len(block)
+            yield block
+
+    def read_into_file(self, f, n):
+        """Baca tepat n byte dan tulis langsung ke file f per blok"""
+        remaining = n
+        while remaining:
+            if self.start == self.end and not self.fill():
+                raise ConnectionError('koneksi terputus sebelum payload lengkap')
+            k = min(remaining, self.end - self.start)
+            with memoryview(self.buf)[self.start:self.start + k] as view:
+                f.write(view)
+            self.start += k
+            remaining -= k
+        self.scan = max(self.scan, self.start)
+
+
+class AsyncFrameReader(FrameBuffer):
+    """Pembaca pesan dari asyncio.StreamReader"""
+
+    def __init__(self, stream, recv_size=DEFAULT_RECV_SIZE):
+        super().__init__(recv_size)
+        self.stream = stream
+
+    async def fill(self):
+        """Terima data baru. Mengembalikan False jika koneksi ditutup."""
+        data = await self.stream.read(self.recv_size)
+        if not data:
+            return False
+        self.feed(data)
+        return True
+
+    async def read_frame(self):
+        """Baca satu pesan lengkap (tanpa terminator). None jika koneksi ditutup."""
+        while True:
+            frame = self.next_frame()
+            if frame is not None:
+                return frame
+            if not await self.fill():
+                return None
+
+    async def iter_until_terminator(self):
+        """Versi async dari FrameReader.iter_until_terminator"""
+        while True:
+            block, done = self.take_body_block()
+            if block:
+                yield block
+            if done:
+                return
+            if not await self.fill():
+                raise ConnectionError('koneksi terputus sebelum pesan selesai')
+
+    async def read_exact(self, n):
+        """Baca tepat n byte"""
+        while self.buffered() < n:
+            if not await self.fill():
+                raise ConnectionError('koneksi terputus sebelum payload lengkap')
+        return self.take(n)
+
+    async def iter_exact(self, n):
+        """Hasilkan tepat n byte per blok tanpa menampung semuanya di memori"""
+        remaining = n
+        while remaining:
+            if self.start == self.end and not await self.fill():
+                raise ConnectionError('koneksi terputus sebelum payload lengkap')
+            block = self.take(remaining)
+            remaining -= len(block)
+            yield block
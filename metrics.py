@@ -0,0 +1,301 @@
+import bisect
+import math
+import multiprocessing
+import os
+import socket
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+COUNTERS = ('connections_total', 'connections_ok', 'connections_failed',
+            'requests_total', 'request_errors', 'bytes_in', 'bytes_out',
+            'connections_rejected', 'requests_busy', 'requests_fast')
+GAUGES = ('active_connections', 'queued_connections', 'accept_queue', 'executor_inflight',
+          'upload_bytes_inflight')
+# pemakaian CPU (mikrodetik) dan memori proses, ditulis ulang oleh setiap proses
+RESOURCES = ('cpu_user_us', 'cpu_system_us', 'rss_kb')
+# statistik modul lain yang disimpan di slot setiap proses agar STATUS
+# menjumlahkan semua worker; ditampilkan di bagiannya sendiri, bukan di metrics
+COMPRESSION_STATS = ('compress_zlib_transfers', 'compress_zlib_raw_bytes', 'compress_zlib_wire_bytes',
+                     'compress_lzma_transfers', 'compress_lzma_raw_bytes', 'compress_lzma_wire_bytes',
+                     'compress_bypassed', 'compress_bypassed_bytes')
+# cache response GET: counter, lalu isi cache saat ini (seperti gauge, ditulis
+# ulang oleh proses pemilik slot)
+CACHE_STATS = ('cache_hits', 'cache_misses', 'cache_evictions', 'cache_entries', 'cache_bytes')
+SHARED_STATS = COMPRESSION_STATS + CACHE_STATS
+RESOURCE_INTERVAL = 0.5
+# angka per slot yang ditampilkan terpisah di STATUS bila ada lebih dari satu slot
+PER_WORKER = ('requests_total', 'request_errors', 'active_connections', 'rss_kb')
+# batas atas bucket histogram latensi (mikrodetik); bucket terakhir = +Inf
+LATENCY_BUCKETS_US = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000,
+                      100000, 250000, 500000, 1000000, 2500000, 5000000, 10000000)
+OTHER_COMMAND = 'other'
+
+
+def accept_queue_depth(sock):
+    """Jumlah koneksi yang menunggu accept() pada listener (Linux: tcpi_unacked
+    dari TCP_INFO socket LISTEN). None jika tidak didukung."""
+    if sock is None or not hasattr(socket, 'TCP_INFO'):
+        return None
+    try:
+        info = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, 32)
+    except OSError:
+        return None
+    return struct.unpack_from('I', info, 24)[0]
+
+
+def current_rss_kb():
+    """RSS proses ini saat ini (Linux /proc), atau RSS puncak dari getrusage"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else 0
+
+
+def peak_rss_kb():
+    """RSS puncak proses ini (Linux VmHWM, bisa direset dengan reset_peak_rss),
+    atau ru_maxrss dari getrusage"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else 0
+
+
+def reset_peak_rss():
+    """Mulai ulang pencatatan RSS puncak (Linux /proc/self/clear_refs);
+    diabaikan jika tidak didukung"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def sample_percentile(values, q):
+    """Persentil q (0..1) dari daftar nilai yang sudah terurut (nearest-rank)"""
+    if not values:
+        return None
+    return values[max(0, math.ceil(len(values) * q) - 1)]
+
+
+class Metrics:
+    """Counter, gauge dan histogram latensi per command dengan biaya O(1).
+
+    Semua angka disimpan di satu RawArray shared memory yang dibagi menjadi
+    `slots` bagian; setiap proses (worker ServerProcess) hanya menulis ke
+    slotnya sendiri sehingga tidak perlu lock antar proses, dan snapshot
+    menjumlahkan semua slot. Di dalam satu proses, thread-thread memakai satu
+    lock yang hanya ditahan selama beberapa penjumlahan."""
+
+    def __init__(self, commands, slots=1):
+        self.commands = tuple(commands) + (OTHER_COMMAND,)
+        self.command_index = {name: i for i, name in enumerate(self.commands)}
+        self.scalar_index = {name: i for i, name in enumerate(COUNTERS + GAUGES + RESOURCES + SHARED_STATS)}
+        # per command: count, total mikrodetik, lalu isi setiap bucket (+Inf)
+        self.command_size = 2 + len(LATENCY_BUCKETS_US) + 1
+        self.slot_size = len(self.scalar_index) + len(self.commands) * self.command_size
+        self.slots = slots
+        self.data = multiprocessing.RawArray('q', slots * self.slot_size)
+        self.slot = 0
+        self.lock = threading.Lock()
+        self.gauge_sources = {}
+        self.started = time.time()
+        self.sampled_at = 0.0
+
+    def use_slot(self, slot):
+        """Pilih slot milik proses ini dan nolkan gauge peninggalan proses lama"""
+        self.slot = slot
+        self.lock = threading.Lock()
+        self.sampled_at = 0.0
+        base = slot * self.slot_size
+        for name in GAUGES + RESOURCES + ('cache_entries', 'cache_bytes'):
+            self.data[base + self.scalar_index[name]] = 0
+
+    def sample_resources(self):
+        """Tulis CPU dan RSS proses ini ke slotnya. Setiap worker ServerProcess
+        menulis slotnya sendiri sehingga totalnya mencakup semua proses."""
+        self.sampled_at = time.monotonic()
+        if resource is None:
+            return
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        self.set('cpu_user_us', int(usage.ru_utime * 1000000))
+        self.set('cpu_system_us', int(usage.ru_stime * 1000000))
+        self.set('rss_kb', current_rss_kb())
+
+    def gauge_source(self, name, func):
+        """Hitung gauge name saat snapshot dengan func() (nilai slot diabaikan)"""
+        self.gauge_sources[name] = func
+
+    def inc(self, name, n=1):
+        i = self.slot * self.slot_size + self.scalar_index[name]
+        with self.lock:
+            self.data[i] += n
+
+    def set(self, name, value):
+        self.data[self.slot * self.slot_size + self.scalar_index[name]] = value
+
+    def get(self, name):
+        """Nilai skalar name di slot proses ini"""
+        return self.data[self.slot * self.slot_size + self.scalar_index[name]]
+
+    def total(self, name):
+        """Nilai skalar name dijumlahkan atas semua slot (tanpa gauge_source)"""
+        i = self.scalar_index[name]
+        return sum(self.data[s * self.slot_size + i] for s in range(self.slots))
+
+    def observe(self, command, seconds, error=False):
+        """Catat satu request: command, durasi dan apakah gagal"""
+        micros = int(seconds * 1000000)
+        cmd = self.command_index.get(command, self.command_index[OTHER_COMMAND])
+        base = self.slot * self.slot_size
+        i = base + len(self.scalar_index) + cmd * self.command_size
+        bucket = bisect.bisect_left(LATENCY_BUCKETS_US, micros)
+        with self.lock:
+            self.data[i] += 1
+            self.data[i + 1] += micros
+            self.data[i + 2 + bucket] += 1
+            self.data[base + self.scalar_index['requests_total']] += 1
+            if error:
+                self.data[base + self.scalar_index['request_errors']] += 1
+        if time.monotonic() - self.sampled_at >= RESOURCE_INTERVAL:
+            self.sample_resources()
+
+    @contextmanager
+    def timed(self, command):
+        """Ukur durasi blok with sebagai satu request command"""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.observe(command, time.perf_counter() - start, error=True)
+            raise
+        self.observe(command, time.perf_counter() - start)
+
+    def totals(self):
+        """Jumlah semua slot: (skalar per nama, {command: [count, us, buckets...]})"""
+        self.sample_resources()
+        size = self.slot_size
+        sums = [sum(self.data[s * size + k] for s in range(self.slots)) for k in range(size)]
+        scalars = {name: sums[i] for name, i in self.scalar_index.items()}
+        for name, func in self.gauge_sources.items():
+            value = func()
+            if value is not None:
+                scalars[name] = value
+        offset = len(self.scalar_index)
+        commands = {}
+        for name, c in self.command_index.items():
+            start = offset + c * self.command_size
+            row = sums[start:start + self.command_size]
+            if row[0]:
+                commands[name] = row
+        return scalars, commands
+
+    @staticmethod
+    def percentile(buckets, count, q):
+        """Perkiraan persentil (ms) dari histogram: batas atas bucket yang memuatnya"""
+        target = math.ceil(count * q)
+        seen = 0
+        for bound, n in zip(LATENCY_BUCKETS_US + (None,), buckets):
+            seen += n
+            if seen >= target:
+                return bound / 1000 if bound is not None else None
+        return None
+
+    def snapshot(self):
+        """Ringkasan untuk STATUS"""
+        scalars, commands = self.totals()
+        data = {name: value for name, value in scalars.items() if name not in SHARED_STATS}
+        data['uptime_sec'] = round(time.time() - self.started, 1)
+        data['cpu_user_sec'] = round(data.pop('cpu_user_us') / 1000000, 3)
+        data['cpu_system_sec'] = round(data.pop('cpu_system_us') / 1000000, 3)
+        data['rss_mb'] = round(data.pop('rss_kb') / 1024, 1)
+        data['commands'] = {
+            name: dict(count=row[0], mean_ms=round(row[1] / row[0] / 1000, 3),
+                       p50_ms=self.percentile(row[2:], row[0], 0.5),
+                       p90_ms=self.percentile(row[2:], row[0], 0.9),
+                       p99_ms=self.percentile(row[2:], row[0], 0.99))
+            for name, row in commands.items()
+        }
+        if self.slots > 1:
+            # rincian per proses worker untuk melihat pembagian beban antar proses
+            data['per_worker'] = [
+                {name: self.data[s * self.slot_size + self.scalar_index[name]] for name in PER_WORKER}
+                for s in range(self.slots)
+            ]
+        return data
+
+    def prometheus(self, prefix='fileserver'):
+        """Dump format teks Prometheus (exposition format 0.0.4)"""
+        scalars, commands = self.totals()
+        lines = []
+        for name in COUNTERS:
+            lines.append(f'# TYPE {prefix}_{name} counter')
+            lines.append(f'{prefix}_{name} {scalars[name]}')
+        for name in GAUGES:
+            lines.append(f'# TYPE {prefix}_{name} gauge')
+            lines.append(f'{prefix}_{name} {scalars[name]}')
+        lines.append(f'# TYPE {prefix}_cpu_seconds_total counter')
+        lines.append(f'{prefix}_cpu_seconds_total{{mode="user"}} {scalars["cpu_user_us"] / 1000000}')
+        lines.append(f'{prefix}_cpu_seconds_total{{mode="system"}} {scalars["cpu_system_us"] / 1000000}')
+        lines.append(f'# TYPE {prefix}_resident_memory_bytes gauge')
+        lines.append(f'{prefix}_resident_memory_bytes {scalars["rss_kb"] * 1024}')
+        metric = f'{prefix}_request_duration_seconds'
+        lines.append(f'# TYPE {metric} histogram')
+        for name, row in commands.items():
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS_US + (None,), row[2:]):
+                cumulative += n
+                le = '+Inf' if bound is None else repr(bound / 1000000)
+                lines.append(f'{metric}_bucket{{command="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{command="{name}"}} {row[1] / 1000000}')
+            lines.append(f'{metric}_count{{command="{name}"}} {row[0]}')
+        return '\n'.join(lines) + '\n'
+
+
+class MeteredSocket:
+    """Pembungkus socket yang mencatat bytes_in/bytes_out ke Metrics"""
+
+    def __init__(self, sock, metrics):
+        self.sock = sock
+        self.metrics = metrics
+
+    def recv_into(self, buffer, nbytes=0):
+        n = self.sock.recv_into(buffer, nbytes)
+        self.metrics.inc('bytes_in', n)
+        return n
+
+    def sendall(self, data):
+        self.sock.sendall(data)
+        self.metrics.inc('bytes_out', len(data))
+
+    def sendfile(self, file, offset=0, count=None):
+        n = self.sock.sendfile(file, offset, count)
+        self.metrics.inc('bytes_out', n)
+        return n
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+
+class MeteredStreamReader:
+    """Pembungkus asyncio.StreamReader yang mencatat bytes_in ke Metrics"""
+
+    def __init__(self, stream, metrics):
+        self.stream = stream
+        self.metrics = metrics
+
+    async def read(self, n=-1):
+        data = await self.stream.read(n)
+        self.metrics.inc('bytes_in', len(data))
+        return data
@@ -0,0 +1,317 @@
+import cProfile
+import glob
+import json
+import multiprocessing
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+PROFILE_ALL = 'all'
+# command PROFILE sendiri tidak pernah diprofil: dump dan reset memakai lock
+# yang sama dengan request yang sedang diprofil
+PROFILE_COMMAND = 'profile'
+DEFAULT_LIMIT = 20
+# kolom pstats (cc, nc, tt, ct) yang dipakai untuk mengurutkan fungsi
+SORT_COLUMNS = dict(calls=1, tottime=2, cumulative=3)
+NOT_PROFILED = nullcontext()
+# pengaturan bersama di folder share (lihat CommandProfiler.share)
+CONTROL_FILE = 'control.json'
+EMPTY_SAMPLE = [0, 0.0, 0, 0]
+
+
+def parse_commands(spec):
+    """'get,upload' -> frozenset; 'all' -> None (semua command)"""
+    commands = frozenset(c.strip().lower() for c in spec.split(',') if c.strip())
+    return None if PROFILE_ALL in commands else commands
+
+
+def merge_sample(total, sample):
+    """Gabungkan [jumlah, detik, peak terbesar, total peak] sample ke total"""
+    total[0] += sample[0]
+    total[1] += sample[1]
+    total[2] = max(total[2], sample[2])
+    total[3] += sample[3]
+
+
+def remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class CommandProfiler:
+    """Profiling opt-in per command dengan cProfile dan (opsional) tracemalloc.
+
+    Hanya command yang dipilih yang diprofil, dengan peluang sample_rate per
+    request. Profil setiap command diakumulasi di satu cProfile.Profile. Hanya
+    satu request yang diprofil pada satu waktu; request lain yang datang saat
+    itu dilewati. Saat nonaktif biayanya hanya satu pengecekan atribut per
+    request.
+
+    Statistik dikumpulkan per proses. Server pre-fork (ServerProcess) memanggil
+    share() sebelum fork: PROFILE on/off/reset dari worker mana pun berlaku di
+    semua worker, setiap worker menulis statistiknya ke folder bersama setelah
+    setiap sampel, dan dump menggabungkan statistik semua worker."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = False
+        self.commands = frozenset()
+        self.sample_rate = 1.0
+        self.memory = False
+        self.started_tracing = False
+        self.profiles = {}
+        # command -> [jumlah sampel, total detik, peak alokasi terbesar, total peak]
+        self.samples = {}
+        # berbagi antar proses: folder statistik, generasi pengaturan di shared
+        # memory dan generasi terakhir yang sudah diterapkan proses ini
+        self.folder = None
+        self.generation = None
+        self.seen = 0
+        self.resets = 0
+        # penulisan statistik ke folder bersama dilakukan di luar self.lock;
+        # nomor snapshot mencegah snapshot lama menimpa yang lebih baru
+        self.save_lock = threading.Lock()
+        self.snapshots = 0
+        self.saved = {}  # command (dan None untuk file sampel) -> nomor snapshot tertulis
+
+    @classmethod
+    def from_env(cls):
+        """Aktifkan lewat FILE_PROFILE=get,upload (atau all), FILE_PROFILE_SAMPLE
+        dan FILE_PROFILE_MEMORY=1"""
+        profiler = cls()
+        spec = os.environ.get('FILE_PROFILE', '').strip()
+        if spec:
+            # parse_commands('all') = None berarti semua command, bukan nonaktif
+            profiler.enable(parse_commands(spec), float(os.environ.get('FILE_PROFILE_SAMPLE', '1')),
+                            os.environ.get('FILE_PROFILE_MEMORY') == '1')
+        return profiler
+
+    def share(self, folder):
+        """Bagi pengaturan dan statistik dengan proses yang di-fork setelah ini.
+        folder menampung control.json dan statistik setiap worker."""
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.generation = multiprocessing.Value('q', 0)
+        self.publish()
+
+    def publish(self):
+        """Umumkan pengaturan proses ini ke semua worker (jika share aktif)"""
+        if self.folder is None:
+            return
+        settings = dict(active=self.active, sample_rate=self.sample_rate, memory=self.memory,
+                        resets=self.resets, commands=None if self.commands is None else sorted(self.commands))
+        path = os.path.join(self.folder, CONTROL_FILE)
+        with self.generation.get_lock():
+            with open(path + '.tmp', 'w') as f:
+                json.dump(settings, f)
+            os.replace(path + '.tmp', path)
+            self.generation.value += 1
+            self.seen = self.generation.value
+
+    def sync(self):
+        """Terapkan pengaturan yang diubah worker lain. Tanpa perubahan biayanya
+        satu pembacaan shared memory."""
+        if self.generation is None or self.generation.get_obj().value == self.seen:
+            return
+        with self.generation.get_lock():
+            self.seen = self.generation.value
+            with open(os.path.join(self.folder, CONTROL_FILE)) as f:
+                settings = json.load(f)
+        if settings['resets'] != self.resets:
+            self.resets = settings['resets']
+            self.clear()
+        if settings['active']:
+            commands = settings['commands']
+            self.apply(None if commands is None else frozenset(commands), settings['sample_rate'],
+                       settings['memory'])
+        else:
+            self.stop()
+
+    def enable(self, commands=None, sample_rate=1.0, memory=False):
+        if not 0 < sample_rate <= 1:
+            raise ValueError('sample harus di antara 0 dan 1')
+        self.sync()
+        self.apply(commands, sample_rate, memory)
+        self.publish()
+
+    def apply(self, commands, sample_rate, memory):
+        self.commands = commands
+        self.sample_rate = sample_rate
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        elif not memory and self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+        self.memory = memory
+        self.active = True
+
+    def disable(self):
+        self.sync()
+        self.stop()
+        self.publish()
+
+    def stop(self):
+        self.active = False
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+        self.memory = False
+
+    def reset(self):
+        self.sync()
+        self.resets += 1
+        self.clear()
+        if self.folder is not None:
+            # statistik worker lain dibuang sekarang, tidak menunggu mereka
+            # menerapkan reset pada request berikutnya
+            remove_files(glob.glob(os.path.join(self.folder, 'worker-*')))
+        self.publish()
+
+    def clear(self):
+        with self.lock, self.save_lock:
+            self.profiles = {}
+            self.samples = {}
+            if self.folder is not None:
+                remove_files(glob.glob(os.path.join(self.folder, f'worker-{os.getpid()}[.-]*')))
+
+    def snapshot(self, command):
+        """Salinan statistik command dan sampel proses ini (dipanggil dengan self.lock)"""
+        self.snapshots += 1
+        samples = {name: list(sample) for name, sample in self.samples.items()}
+        return self.snapshots, command, pstats.Stats(self.profiles[command]), samples, self.resets
+
+    def save(self, snapshot):
+        """Tulis snapshot ke folder bersama. Ditulis ke file sementara lalu
+        di-rename agar dump di worker lain tidak membaca file setengah jadi."""
+        seq, command, stats, samples, resets = snapshot
+        base = os.path.join(self.folder, f'worker-{os.getpid()}')
+        path = f'{base}-{command}.prof'
+        with self.save_lock:
+            if resets != self.resets:
+                return
+            if seq > self.saved.get(command, 0):
+                self.saved[command] = seq
+                stats.dump_stats(path + '.tmp')
+                os.replace(path + '.tmp', path)
+            if seq > self.saved.get(None, 0):
+                self.saved[None] = seq
+                with open(base + '.json.tmp', 'w') as f:
+                    json.dump(samples, f)
+                os.replace(base + '.json.tmp', base + '.json')
+
+    def collect(self):
+        """(pstats.Stats, sampel) per command: milik proses ini, ditambah
+        statistik worker lain dari folder bersama bila share aktif"""
+        with self.lock:
+            stats = {name: pstats.Stats(profile) for name, profile in self.profiles.items()}
+            samples = {name: list(sample) for name, sample in self.samples.items()}
+        if self.folder is None:
+            return stats, samples
+        own = f'worker-{os.getpid()}'
+        for path in glob.glob(os.path.join(self.folder, 'worker-*.json')):
+            if os.path.basename(path)[:-len('.json')] == own:
+                continue
+            try:
+                with open(path) as f:
+                    for name, sample in json.load(f).items():
+                        merge_sample(samples.setdefault(name, list(EMPTY_SAMPLE)), sample)
+            except (OSError, ValueError):
+                continue
+        for path in glob.glob(os.path.join(self.folder, 'worker-*.prof')):
+            worker, _, name = os.path.basename(path)[:-len('.prof')].partition('-')[2].partition('-')
+            if f'worker-{worker}' == own:
+                continue
+            try:
+                stats.setdefault(name, pstats.Stats()).add(path)
+            except (OSError, EOFError, ValueError, TypeError):
+                # dihapus reset atau diganti worker pemiliknya saat dibaca
+                continue
+        return stats, samples
+
+    def profile(self, command):
+        """Context manager yang memprofil blok with sebagai satu request command,
+        atau context kosong jika request ini tidak diprofil"""
+        if self.generation is not None:
+            self.sync()
+        if not self.active or command == PROFILE_COMMAND or (
+                self.commands is not None and command not in self.commands):
+            return NOT_PROFILED
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return NOT_PROFILED
+        if not self.lock.acquire(blocking=False):
+            # request lain sedang diprofil
+            return NOT_PROFILED
+        return self.run(command)
+
+    @contextmanager
+    def run(self, command):
+        snapshot = None
+        try:
+            profile = self.profiles.get(command)
+            if profile is None:
+                profile = self.profiles[command] = cProfile.Profile()
+            memory = self.memory and tracemalloc.is_tracing()
+            if memory:
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+                elapsed = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1] - base if memory else 0
+                merge_sample(self.samples.setdefault(command, list(EMPTY_SAMPLE)), [1, elapsed, peak, peak])
+                if self.folder is not None:
+                    snapshot = self.snapshot(command)
+        finally:
+            self.lock.release()
+            if snapshot is not None:
+                self.save(snapshot)
+
+    def call(self, command, func, *args):
+        """Panggil func(*args) di dalam profile(command); untuk dijalankan di executor"""
+        with self.profile(command):
+            return func(*args)
+
+    def dump(self, command=None, limit=DEFAULT_LIMIT, sort='cumulative'):
+        """Statistik per command: jumlah sampel, rata-rata durasi, fungsi teratas
+        menurut sort, dan bila tracemalloc aktif, peak alokasi per request serta
+        lokasi alokasi terbesar (alokasi hanya dari proses yang menjawab)"""
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f'sort harus salah satu dari {", ".join(SORT_COLUMNS)}')
+        column = SORT_COLUMNS[sort]
+        self.sync()
+        all_stats, samples = self.collect()
+        profiles = {}
+        for name, stats in all_stats.items():
+            if command is not None and name != command:
+                continue
+            count, total, peak_max, peak_total = samples.get(name, EMPTY_SAMPLE)
+            rows = sorted(stats.stats.items(), key=lambda item: item[1][column], reverse=True)[:limit]
+            profiles[name] = dict(
+                samples=count,
+                mean_ms=round(total / count * 1000, 3) if count else None,
+                functions=[dict(function=pstats.func_std_string(func), calls=nc,
+                                tottime_ms=round(tt * 1000, 3), cumtime_ms=round(ct * 1000, 3))
+                           for func, (cc, nc, tt, ct, callers) in rows])
+            if self.memory:
+                profiles[name].update(peak_alloc_kb_max=peak_max // 1024,
+                                      peak_alloc_kb_mean=peak_total // count // 1024 if count else None)
+        data = dict(active=self.active,
+                    commands=PROFILE_ALL if self.commands is None else sorted(self.commands),
+                    sample_rate=self.sample_rate, memory=self.memory, profiles=profiles)
+        if self.memory and tracemalloc.is_tracing():
+            top = tracemalloc.take_snapshot().statistics('lineno')[:limit]
+            data['allocations'] = [dict(site=str(stat.traceback[0]), size_kb=stat.size // 1024, count=stat.count)
+                                   for stat in top]
+        return data
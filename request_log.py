@@ -0,0 +1,127 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+from contextlib import contextmanager
+
+# fraksi request sukses yang dicatat (0..1); request gagal selalu dicatat
+DEFAULT_SAMPLE_RATE = float(os.environ.get('FILE_LOG_SAMPLE', '1'))
+# teks dari request (command, nama file, pesan error) dipotong sepanjang ini
+PREVIEW_CHARS = 64
+REQUEST_FORMAT = 'request command=%s file=%s size=%d duration_ms=%.3f peer=%s%s'
+
+logger = logging.getLogger('request')
+_listener = None
+_config = None
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler yang tidak memformat pesan di thread pemanggil. Record
+    (beserta args-nya yang immutable) diteruskan apa adanya dan baru
+    diformat oleh QueueListener di thread latar."""
+
+    def prepare(self, record):
+        if record.exc_info:
+            return super().prepare(record)
+        return record
+
+
+def setup_logging(level=logging.WARNING, stream=None, fmt=logging.BASIC_FORMAT):
+    """Pasang pipeline logging non-blocking: handler root diganti satu
+    DeferredQueueHandler dan penulisan ke stream dilakukan QueueListener di
+    thread latar, sehingga logging di worker hanya berupa put ke antrean."""
+    global _listener, _config
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    log_queue = queue.SimpleQueue()
+    target = logging.StreamHandler(stream)
+    target.setFormatter(logging.Formatter(fmt))
+    listener = logging.handlers.QueueListener(log_queue, target)
+    listener.start()
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(level)
+    # catatan per request memakai level INFO; jumlahnya diatur lewat sampling
+    logger.setLevel(logging.INFO)
+    if _listener is None:
+        atexit.register(stop_logging)
+    _listener = listener
+    _config = (level, stream, fmt)
+
+
+def reinit_after_fork():
+    """Thread listener tidak ikut ter-fork; proses anak memasang pipeline
+    sendiri dengan konfigurasi yang sama seperti induknya"""
+    if _config is not None:
+        setup_logging(*_config)
+
+
+def stop_logging():
+    """Tulis sisa antrean log lalu hentikan thread listener"""
+    if _listener is not None:
+        _listener.stop()
+
+
+def preview(text, limit=PREVIEW_CHARS):
+    """Potong text agar payload tidak pernah ikut masuk log"""
+    if text is None or len(text) <= limit:
+        return text
+    return f'{text[:limit]}...(+{len(text) - limit})'
+
+
+def describe(data_str):
+    """(command, nama file) dari request tanpa menyalin payload di belakangnya"""
+    end = data_str.find(' ')
+    if end < 0:
+        return preview(data_str.strip().lower()), None
+    command = preview(data_str[:end].lower())
+    name_end = data_str.find(' ', end + 1)
+    if name_end < 0:
+        name_end = len(data_str)
+    return command, preview(data_str[end + 1:min(name_end, end + 1 + PREVIEW_CHARS * 2)]) or None
+
+
+class RequestRecord:
+    __slots__ = ('command', 'name', 'size')
+
+    def __init__(self, command, name, size):
+        self.command = command
+        self.name = name
+        self.size = size
+
+
+class RequestLog:
+    """Catatan terstruktur per request untuk satu koneksi: command, nama file,
+    ukuran request (byte diterima), durasi dan peer. Durasi juga dicatat ke
+    Metrics bila diberikan. Request sukses hanya dicatat dengan peluang
+    sample_rate, request gagal selalu dicatat."""
+
+    def __init__(self, peer=None, metrics=None, sample_rate=None):
+        self.peer = f'{peer[0]}:{peer[1]}' if peer else '-'
+        self.metrics = metrics
+        self.sample_rate = DEFAULT_SAMPLE_RATE if sample_rate is None else sample_rate
+
+    @contextmanager
+    def request(self, command, name=None, size=0):
+        """Ukur blok with sebagai satu request; size boleh diubah lewat record"""
+        record = RequestRecord(command, name, size)
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            self.finish(record, time.perf_counter() - start, e)
+            raise
+        self.finish(record, time.perf_counter() - start)
+
+    def finish(self, record, seconds, error=None):
+        if self.metrics is not None:
+            self.metrics.observe(record.command, seconds, error is not None)
+        if error is not None:
+            logger.warning(REQUEST_FORMAT, record.command, record.name, record.size,
+                           seconds * 1000, self.peer, f' error={preview(str(error))!r}')
+        elif self.sample_rate >= 1 or random.random() < self.sample_rate:
+            logger.info(REQUEST_FORMAT, record.command, record.name, record.size,
+                        seconds * 1000, self.peer, '')
@@ -0,0 +1,79 @@
+import threading
+from collections import OrderedDict
+
+from metrics import Metrics
+
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+
+class ResponseCache:
+    """Cache LRU untuk response GET yang sudah di-encode (bytes siap kirim).
+
+    Setiap entri disimpan bersama (mtime_ns, size) file saat response dibuat;
+    entri dianggap basi jika stat file berubah. Total ukuran entri dibatasi
+    max_bytes dan entri yang paling lama tidak dipakai dibuang lebih dulu.
+
+    Setiap proses punya cache sendiri; hit, miss, eviction dan isi cache
+    dicatat di Metrics server (slot proses ini) sehingga pada server
+    process/hybrid stats() menjumlahkan semua worker."""
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES, max_entry_bytes=None, metrics=None):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else max_bytes // 4
+        self.entries = OrderedDict()
+        self.used = 0
+        self.metrics = metrics if metrics is not None else Metrics(())
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def version(stat):
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self, name, stat):
+        """Ambil response untuk file name jika masih sesuai dengan stat-nya"""
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is not None and entry[0] == self.version(stat):
+                self.entries.move_to_end(name)
+                self.metrics.inc('cache_hits')
+                return entry[1]
+            if entry is not None:
+                self._drop(name)
+                self._publish()
+            self.metrics.inc('cache_misses')
+            return None
+
+    def put(self, name, stat, data):
+        if self.max_bytes <= 0 or len(data) > self.max_entry_bytes:
+            return
+        with self.lock:
+            if name in self.entries:
+                self._drop(name)
+            self.entries[name] = (self.version(stat), data)
+            self.used += len(data)
+            while self.used > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self._drop(oldest)
+                self.metrics.inc('cache_evictions')
+            self._publish()
+
+    def invalidate(self, name):
+        """Buang entri file name (dipanggil saat file diubah atau dihapus)"""
+        with self.lock:
+            if name in self.entries:
+                self._drop(name)
+                self._publish()
+
+    def _drop(self, name):
+        _, data = self.entries.pop(name)
+        self.used -= len(data)
+
+    def _publish(self):
+        self.metrics.set('cache_entries', len(self.entries))
+        self.metrics.set('cache_bytes', self.used)
+
+    def stats(self):
+        """Jumlah semua worker; max_bytes adalah batas per worker"""
+        total = self.metrics.total
+        return dict(hits=total('cache_hits'), misses=total('cache_misses'), evictions=total('cache_evictions'),
+                    entries=total('cache_entries'), bytes=total('cache_bytes'), max_bytes=self.max_bytes)
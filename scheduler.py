@@ -0,0 +1,252 @@
+import logging
+import os
+import queue
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from file_transfer import ServerConnection, LENGTH_HEADER, PAYLOAD_COMMANDS
+from framing import TERMINATOR
+from metrics import accept_queue_depth
+
+FAST = 'fast'
+BULK = 'bulk'
+TRANSFER_COMMANDS = frozenset(('GET', 'BGET'))
+BATCH_TRANSFER_COMMANDS = frozenset(('MGET',))
+# request kecil yang pekerjaannya besar (menggabungkan semua part)
+HEAVY_COMMANDS = frozenset(('UPLOAD_COMMIT',))
+# request yang membaca etag file lewat DirectoryIndex.lookup; etag file yang
+# berubah dari luar dihitung ulang dengan membaca seluruh isinya
+LOOKUP_COMMANDS = frozenset(('STAT',))
+CONDITIONAL_UPLOAD_COMMANDS = frozenset(('UPLOAD', 'BUPLOAD'))
+CONDITION_OPTION = b'if-none-match='
+# request (atau file yang diminta GET/BGET) sampai ukuran ini dianggap kecil
+SMALL_REQUEST_BYTES = int(os.environ.get('FILE_FAST_MAX_KB', '64')) * 1024
+# byte awal request yang diintip untuk klasifikasi: payload biner kecil
+# ditambah ruang untuk baris request dan header panjangnya
+PEEK_BYTES = SMALL_REQUEST_BYTES + 4096
+DEFAULT_FAST_WORKERS = int(os.environ.get('FILE_FAST_WORKERS', '2'))
+
+
+def classify(head, index=None, small=SMALL_REQUEST_BYTES):
+    """Lane untuk request yang diawali head (bytes): FAST untuk request
+    metadata (LIST, STAT, STATUS, DELETE, ...), UPLOAD kecil, GET/BGET file
+    kecil dan MGET yang total ukuran filenya kecil, BULK untuk sisanya.
+    Request hanya masuk lane cepat jika seluruh header-nya (dan untuk
+    BUPLOAD/BUPLOADPART seluruh payload-nya) sudah diterima, sehingga worker
+    lane cepat tidak pernah menunggu client yang lambat mengirim. Request
+    yang harus menghitung ulang sha256 file besar (STAT, upload dengan
+    if-none-match, atau LIST yang akan memindai ulang storage) juga masuk
+    lane bulk; ukuran dan kesegaran entri diperiksa dengan
+    DirectoryIndex.probe (stat, tanpa membaca isi file)."""
+    end = head.find(TERMINATOR)
+    if end < 0:
+        return BULK
+    tokens = head[:end].split(None, 2)
+    if not tokens:
+        return FAST
+    command = tokens[0].decode('latin-1').upper()
+    name = tokens[1].decode('utf-8', 'replace') if len(tokens) > 1 else None
+    if command in TRANSFER_COMMANDS:
+        # ukuran file saat ini dari storage (stat), bukan dari entri index yang bisa basi
+        probe = index.probe(name) if index is not None and name is not None else None
+        return FAST if probe is None or probe[0] <= small else BULK
+    if command in BATCH_TRANSFER_COMMANDS:
+        # file yang tidak ada hanya menghasilkan error per item
+        if index is None:
+            return BULK
+        total = 0
+        for item in head[:end].split()[1:]:
+            probe = index.probe(item.decode('utf-8', 'replace'))
+            total += probe[0] if probe is not None else 0
+            if total > small:
+                return BULK
+        return FAST
+    if index is not None and name is not None and (
+            command in LOOKUP_COMMANDS
+            or (command in CONDITIONAL_UPLOAD_COMMANDS and CONDITION_OPTION in head[:end].lower())):
+        probe = index.probe(name)
+        if probe is not None and probe[1] > small:
+            return BULK
+    if command == 'LIST' and index is not None and not index.is_current():
+        return BULK
+    if command in PAYLOAD_COMMANDS:
+        start = end + len(TERMINATOR) + LENGTH_HEADER.size
+        header = head[start - LENGTH_HEADER.size:start]
+        if len(header) < LENGTH_HEADER.size:
+            return BULK
+        length = LENGTH_HEADER.unpack(header)[0]
+        # payload kecil yang belum lengkap diterima tetap ke lane bulk
+        return FAST if length <= small and len(head) >= start + length else BULK
+    return BULK if command in HEAVY_COMMANDS else FAST
+
+
+class FairQueue:
+    """Antrean dengan giliran round-robin antar client: setiap client punya
+    antrean sendiri, dan get() mengambil satu item dari client berikutnya
+    sehingga satu client dengan banyak transfer besar tidak menahan client lain."""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.queues = {}
+        self.turns = deque()
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def put(self, client, item):
+        with self.cond:
+            items = self.queues.get(client)
+            if items is None:
+                items = self.queues[client] = deque()
+                self.turns.append(client)
+            items.append(item)
+            self.size += 1
+            self.cond.notify()
+
+    def get(self):
+        with self.cond:
+            while not self.turns:
+                self.cond.wait()
+            client = self.turns.popleft()
+            items = self.queues[client]
+            item = items.popleft()
+            self.size -= 1
+            if items:
+                self.turns.append(client)
+            else:
+                del self.queues[client]
+            return item
+
+
+class RequestScheduler:
+    """Loop accept dan penjadwal request untuk ServerThread dan setiap worker
+    ServerProcess.
+
+    Koneksi yang sedang menganggur menunggu di satu selector (poller), bukan
+    menempati worker. Saat request berikutnya datang, awal request diintip
+    dan diklasifikasi (classify): request metadata/kecil dilayani lane cepat
+    (fast_workers thread), transfer besar masuk FairQueue yang dilayani
+    bulk_workers thread secara bergiliran per alamat client. Setelah satu
+    request selesai, koneksi dikembalikan ke poller."""
+
+    def __init__(self, sock, fp, metrics, admission, recv_size, bulk_workers,
+                 fast_workers=DEFAULT_FAST_WORKERS, report_accept_queue=False):
+        self.sock = sock
+        self.fp = fp
+        self.metrics = metrics
+        self.admission = admission
+        self.recv_size = recv_size
+        self.bulk_workers = bulk_workers
+        self.fast_workers = fast_workers
+        # listener milik proses ini sendiri (SO_REUSEPORT): antreannya dicatat setiap accept
+        self.report_accept_queue = report_accept_queue
+        self.selector = selectors.DefaultSelector()
+        self.bulk = FairQueue()
+        self.fast = ThreadPoolExecutor(max_workers=fast_workers)
+        # koneksi yang selesai dilayani worker, menunggu didaftarkan ulang oleh poller
+        self.returned = queue.SimpleQueue()
+        self.wakeup_r, self.wakeup_w = socket.socketpair()
+        self.wakeup_w.setblocking(False)
+
+    def serve_forever(self):
+        self.sock.setblocking(False)
+        self.selector.register(self.sock, selectors.EVENT_READ)
+        self.selector.register(self.wakeup_r, selectors.EVENT_READ)
+        for _ in range(self.bulk_workers):
+            threading.Thread(target=self.bulk_loop, daemon=True).start()
+        while True:
+            for key, _ in self.selector.select():
+                if key.fileobj is self.sock:
+                    self.accept()
+                elif key.fileobj is self.wakeup_r:
+                    self.wakeup_r.recv(4096)
+                    self.reregister()
+                else:
+                    self.selector.unregister(key.fileobj)
+                    self.dispatch(key.data)
+
+    def accept(self):
+        try:
+            conn, addr = self.sock.accept()
+        except BlockingIOError:
+            # listener bersama: proses lain sudah mengambil koneksi ini
+            return
+        conn.setblocking(True)
+        self.metrics.inc('connections_total')
+        if self.report_accept_queue:
+            self.metrics.set('accept_queue', accept_queue_depth(self.sock) or 0)
+        # koneksi di atas batas dijawab BUSY sekarang, bukan menunggu di antrean
+        queued = self.metrics.get('queued_connections')
+        reason = self.admission.check_connection(queued)
+        if reason is not None:
+            self.admission.reject(conn, addr, reason, queued)
+            return
+        logging.warning(f"Connection dari {addr}")
+        self.metrics.inc('active_connections')
+        self.selector.register(conn, selectors.EVENT_READ,
+                               ServerConnection(conn, self.fp, self.recv_size, self.metrics, addr, self.admission))
+
+    def reregister(self):
+        while True:
+            try:
+                connection = self.returned.get_nowait()
+            except queue.Empty:
+                return
+            if connection.reader.buffered():
+                # request berikutnya sudah ada di buffer (pipelining)
+                self.dispatch(connection)
+            else:
+                self.selector.register(connection.sock, selectors.EVENT_READ, connection)
+
+    def dispatch(self, connection):
+        """Masukkan request berikutnya pada koneksi ke lane yang sesuai"""
+        try:
+            head = connection.head(PEEK_BYTES)
+        except OSError as e:
+            logging.error(f"error saat proses client {connection.peer}: {e}")
+            self.close(connection, ok=False)
+            return
+        if not head:
+            self.close(connection)
+            return
+        self.metrics.inc('queued_connections')
+        if classify(head, self.fp.file.index) == FAST:
+            self.metrics.inc('requests_fast')
+            self.fast.submit(self.run, connection)
+        else:
+            self.bulk.put(connection.peer[0], connection)
+
+    def bulk_loop(self):
+        while True:
+            self.run(self.bulk.get())
+
+    def run(self, connection):
+        """Layani satu request lalu kembalikan koneksi ke poller"""
+        self.metrics.inc('queued_connections', -1)
+        start = time.perf_counter()
+        try:
+            keep = connection.serve_one()
+        except Exception as e:
+            logging.error(f"error saat proses client {connection.peer}: {e}")
+            self.close(connection, ok=False)
+            return
+        finally:
+            self.admission.finished(time.perf_counter() - start)
+        if not keep:
+            self.close(connection)
+            return
+        self.returned.put(connection)
+        try:
+            self.wakeup_w.send(b'\0')
+        except BlockingIOError:
+            pass  # poller sudah pasti terbangun
+
+    def close(self, connection, ok=True):
+        self.metrics.inc('connections_ok' if ok else 'connections_failed')
+        self.metrics.inc('active_connections', -1)
+        connection.close()
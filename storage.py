@@ -0,0 +1,238 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+BLOB_FOLDER = '.blobs'
+NAME_DB = 'names.db'
+
+# metadata satu file yang tersimpan; hash None jika belum diketahui (flat)
+FileInfo = namedtuple('FileInfo', 'size mtime hash path')
+
+
+def valid_name(name):
+    """True jika name adalah nama file langsung di storage: bukan path
+    (tanpa pemisah folder atau ..) dan bukan file tersembunyi. Hanya nama
+    seperti ini yang bisa dihasilkan scan(), sehingga alias seperti
+    ./a.txt atau ../x tidak pernah menyentuh storage."""
+    return (bool(name) and not name.startswith('.') and '..' not in name and '/' not in name
+            and os.sep not in name and (os.altsep is None or os.altsep not in name) and '\0' not in name)
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class FlatStorage:
+    """Layout bawaan: setiap file disimpan dengan namanya langsung di base_folder"""
+
+    def __init__(self, base_folder):
+        self.base_folder = base_folder
+
+    def path(self, name):
+        """Path file name di base_folder; ValueError untuk nama yang tidak valid"""
+        if not valid_name(name):
+            raise ValueError('nama file tidak valid')
+        return os.path.join(self.base_folder, name)
+
+    def info(self, name):
+        """FileInfo untuk file name, atau None jika tidak ada (atau nama tidak valid)"""
+        if not valid_name(name):
+            return None
+        path = os.path.join(self.base_folder, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        return FileInfo(st.st_size, st.st_mtime_ns, None, path)
+
+    def scan(self):
+        """Hasilkan (nama, FileInfo) untuk semua file yang tersimpan"""
+        with os.scandir(self.base_folder) as it:
+            for item in it:
+                # file tersembunyi (mis. milik server) tidak termasuk isi storage
+                if item.is_file() and valid_name(item.name):
+                    try:
+                        st = item.stat()
+                    except FileNotFoundError:
+                        # dihapus request lain saat pemindaian
+                        continue
+                    yield item.name, FileInfo(st.st_size, st.st_mtime_ns, None, item.path)
+
+    def version(self):
+        """Berubah setiap ada file yang ditambah, diganti atau dihapus"""
+        return os.stat(self.base_folder).st_mtime_ns
+
+    def store(self, name, tmp_path, digest=None):
+        """Simpan tmp_path sebagai name. Mengembalikan (versi_sebelum, versi_sesudah)."""
+        path = self.path(name)
+        before = self.version()
+        os.replace(tmp_path, path)
+        return before, self.version()
+
+    def remove(self, name):
+        path = self.path(name)
+        before = self.version()
+        os.remove(path)
+        return before, self.version()
+
+
+class BlobStorage:
+    """Penyimpanan content-addressed: isi file disimpan sekali per sha256 di
+    base_folder/.blobs/ab/cd/<sha256>, sedangkan nama -> blob dicatat di
+    sqlite (.blobs/names.db) beserta jumlah referensi setiap blob.
+
+    Upload dengan isi yang sudah ada hanya menambah referensi (file sementara
+    dibuang, tidak disalin), dan blob dihapus saat referensi terakhirnya
+    dihapus. Folder dua tingkat menjaga jumlah entri per folder tetap kecil
+    walau berisi jutaan objek. Perubahan nama/referensi dan rename/unlink
+    blob dilakukan dalam satu transaksi tulis sqlite sehingga aman dipakai
+    bersama oleh banyak thread dan proses."""
+
+    def __init__(self, base_folder):
+        self.base_folder = base_folder
+        self.blob_folder = os.path.join(base_folder, BLOB_FOLDER)
+        os.makedirs(self.blob_folder, exist_ok=True)
+        self.db_path = os.path.join(self.blob_folder, NAME_DB)
+        self.local = threading.local()
+        with self.transaction() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS names (name TEXT PRIMARY KEY, hash TEXT NOT NULL,'
+                       ' size INTEGER NOT NULL, mtime INTEGER NOT NULL)')
+            db.execute('CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, refs INTEGER NOT NULL)')
+            db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            db.execute("INSERT OR IGNORE INTO meta VALUES ('version', 0)")
+            # versi file flat (size, mtime) yang sudah diimpor, lihat import_flat_files
+            db.execute('CREATE TABLE IF NOT EXISTS imported (name TEXT PRIMARY KEY,'
+                       ' size INTEGER NOT NULL, mtime INTEGER NOT NULL)')
+        self.import_flat_files()
+
+    def db(self):
+        """Koneksi sqlite milik thread ini (dibuat ulang setelah fork)"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn, self.local.pid = conn, os.getpid()
+        return conn
+
+    def query_one(self, db, sql, args=()):
+        """Satu baris hasil query. Cursor selalu dihabiskan: cursor yang masih
+        terbuka menahan transaksi baca sehingga perubahan dari proses lain
+        tidak terlihat."""
+        rows = db.execute(sql, args).fetchall()
+        return rows[0] if rows else None
+
+    @contextmanager
+    def transaction(self):
+        db = self.db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def blob_path(self, digest):
+        return os.path.join(self.blob_folder, digest[:2], digest[2:4], digest)
+
+    def import_flat_files(self):
+        """Salin file flat di base_folder (mis. dari mode flat) ke blob. File
+        aslinya tidak diubah atau dihapus sehingga kembali ke mode flat tetap
+        melihat isi folder yang sama. Setiap versi file (size, mtime) hanya
+        diimpor sekali, jadi nama yang sudah diganti lewat mode cas tidak
+        ditimpa lagi oleh salinan flat yang lama."""
+        with os.scandir(self.base_folder) as it:
+            files = [(item.name, item.stat()) for item in it if item.is_file() and valid_name(item.name)]
+        imported = {name: (size, mtime) for name, size, mtime
+                    in self.db().execute('SELECT name, size, mtime FROM imported').fetchall()}
+        for name, st in files:
+            if imported.get(name) == (st.st_size, st.st_mtime_ns):
+                continue
+            fd, tmp_path = tempfile.mkstemp(dir=self.blob_folder, prefix='import-')
+            os.close(fd)
+            try:
+                shutil.copyfile(os.path.join(self.base_folder, name), tmp_path)
+                self.store(name, tmp_path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            with self.transaction() as db:
+                db.execute('INSERT OR REPLACE INTO imported VALUES (?, ?, ?)', (name, st.st_size, st.st_mtime_ns))
+
+    def info(self, name):
+        row = self.query_one(self.db(), 'SELECT size, mtime, hash FROM names WHERE name = ?', (name,))
+        if row is None:
+            return None
+        return FileInfo(row[0], row[1], row[2], self.blob_path(row[2]))
+
+    def scan(self):
+        rows = self.db().execute('SELECT name, size, mtime, hash FROM names').fetchall()
+        for name, size, mtime, digest in rows:
+            yield name, FileInfo(size, mtime, digest, self.blob_path(digest))
+
+    def version(self):
+        return self.query_one(self.db(), "SELECT value FROM meta WHERE key = 'version'")[0]
+
+    def store(self, name, tmp_path, digest=None):
+        if not valid_name(name):
+            raise ValueError('nama file tidak valid')
+        digest = digest or file_sha256(tmp_path)
+        size = os.path.getsize(tmp_path)
+        with self.transaction() as db:
+            if self.query_one(db, 'SELECT 1 FROM blobs WHERE hash = ?', (digest,)) is None:
+                path = self.blob_path(digest)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+                db.execute('INSERT INTO blobs VALUES (?, 0)', (digest,))
+            else:
+                # isi yang sama sudah tersimpan, cukup tambah referensi
+                os.remove(tmp_path)
+            old = self.query_one(db, 'SELECT hash FROM names WHERE name = ?', (name,))
+            db.execute('INSERT OR REPLACE INTO names VALUES (?, ?, ?, ?)', (name, digest, size, time.time_ns()))
+            db.execute('UPDATE blobs SET refs = refs + 1 WHERE hash = ?', (digest,))
+            if old is not None:
+                self.release(db, old[0])
+            return self.bump(db)
+
+    def remove(self, name):
+        with self.transaction() as db:
+            row = self.query_one(db, 'SELECT hash FROM names WHERE name = ?', (name,))
+            if row is None:
+                raise FileNotFoundError(name)
+            db.execute('DELETE FROM names WHERE name = ?', (name,))
+            self.release(db, row[0])
+            return self.bump(db)
+
+    def release(self, db, digest):
+        """Kurangi referensi blob dan hapus blob yang tidak dipakai lagi"""
+        db.execute('UPDATE blobs SET refs = refs - 1 WHERE hash = ?', (digest,))
+        if self.query_one(db, 'SELECT refs FROM blobs WHERE hash = ?', (digest,))[0] <= 0:
+            db.execute('DELETE FROM blobs WHERE hash = ?', (digest,))
+            try:
+                os.remove(self.blob_path(digest))
+            except FileNotFoundError:
+                pass
+
+    def bump(self, db):
+        """Naikkan versi dalam transaksi db. Mengembalikan (versi_sebelum, versi_sesudah)."""
+        before = self.query_one(db, "SELECT value FROM meta WHERE key = 'version'")[0]
+        db.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+        return before, before + 1
+
+
+STORAGE_BACKENDS = dict(flat=FlatStorage, cas=BlobStorage)